@@ -0,0 +1,61 @@
+"""
+Python library for the R30x series of fingerprint modules.
+
+Importing the package does no I/O and pulls in neither pyserial, PIL nor
+numpy: pyserial is imported when Sensor opens a port by name, PIL when
+image_to_pil is called and numpy when an image is converted or assessed.
+The asyncio front end, the sensor pool, the broker and its client and the
+simulator are loaded on first use::
+
+    from r307_fingerprint import Sensor, CHAR_BUFFER_1
+
+    sensor = Sensor('/dev/ttyUSB0', 57600, connect=False)
+    sensor.connect(handshake_timeout=0.5)
+"""
+import importlib
+
+from .constants import *
+from .deadlines import DEFAULT_COMMAND_TIMEOUTS, CommandDeadlines
+from .errors import CommandError, ProtocolError, SensorError, Status
+from .image import image_to_array, image_to_pil, unpack_image
+from .library import BatchResult, LibraryIndex, LibraryStamp, \
+    TemplateStore, read_library_file
+from .metrics import COMMAND_NAMES, LATENCY_BUCKETS, Instrumentation, \
+    Metrics, prometheus_text
+from .protocol import DeviceProfile, FrameDecoder, FrameEncoder, \
+    IdentifyEvent, MatchResult, Result, SearchResult, checksum
+from .quality import QUALITY_CONTRAST, QUALITY_DISORDERED, QUALITY_SMALL, \
+    QualityGate, QualityReport
+from .search import SOURCE_FLASH, SOURCE_HOST, AdaptiveSearch, \
+    IdentifyResult, TemplateCache
+from .sensor import EnrollResult, Sensor
+from .trace import TRACE_RECEIVED, TRACE_SENT, TraceReader, TraceRecord, \
+    TraceRecorder, TraceReplay
+
+# Names loaded on first access, with the submodule defining them
+_LAZY = {
+    'AsyncSensor': 'aio',
+    'SensorPool': 'pool',
+    'command_priority': 'pool',
+    'PRIORITY_IDENTIFY': 'pool',
+    'PRIORITY_NORMAL': 'pool',
+    'PRIORITY_MAINTENANCE': 'pool',
+    'VirtualSensor': 'virtual',
+    'RemoteSensor': 'remote',
+    'SensorBroker': 'broker',
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError("module %r has no attribute %r"
+                             % (__name__, name))
+
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,31 @@
+from . import *
+
+if __name__ == '__main__':
+    sensor = Sensor('/dev/ttyUSB0', 57600)
+    # sensor.generate_image()
+    # image = sensor.download_image()
+    # image_to_pil(image).save('./temp/FingerPrintImage.png')
+    # sensor.generate_charfile_image(CHAR_BUFFER_1)
+    # sensor.generate_charfile_image(CHAR_BUFFER_2)
+    # sensor.generate_template()
+    # template = sensor.download_char_buffer(CHAR_BUFFER_1)
+    # sensor.export_library('./temp/library.bin')
+    #param_dict = sensor.read_parameters()
+    #print(param_dict)
+
+    #sensor.store_template(CHAR_BUFFER_1, 1)
+    # page_id, match_id = sensor.fingerprint_verification(CAPTURE_TIME_4_5, 1, 1)
+    # print(page_id, match_id)
+    # sensor.delete_template(1, 1)
+    # match_score = sensor.match_template()
+    # print(match_score)
+    # print(sensor.get_random_number())
+    # print(sensor.read_notepad())
+    # print(sensor.read_valid_template_num())
+    # print(sensor.auto_fingerprint_verification())
+    # sensor.read_template(CHAR_BUFFER_1, 0)
+    # index = sensor.load_library_index()
+    # sensor.store_template(CHAR_BUFFER_1, index.next_free())
+    # sensor.empty_fingerprint_library()
+    # print(sensor.negotiate_link())
+    # print(sensor.enroll())
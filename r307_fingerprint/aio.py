@@ -0,0 +1,737 @@
+"""
+asyncio front end for a module, over any pair of asyncio streams.
+"""
+import asyncio
+import functools
+import logging
+import time
+
+from .constants import *
+from .constants import _NO_FINGER_CCS
+from .errors import ProtocolError, SensorError
+from .image import _image_view
+from .library import _LibraryKeeper
+from .protocol import DeviceProfile, FrameDecoder, FrameEncoder, _ACK_PIDS, \
+    _DATA_PIDS, _IDEMPOTENT_COMMANDS, _NEGATIVE_OUTCOMES, _IdentifyCycle, \
+    _address_args, _capture_result, _check_cc, _check_pid, _command_data, \
+    _data_packets, _delete_args, _index_table_args, _match_reply, \
+    _notepad_args, _notepad_page_args, _notepad_reply, _parameter_args, \
+    _parse_parameters, _password_args, _port_control_args, _search_args, \
+    _search_reply, _status_result, _template_args, _verification_args, \
+    _verification_reply
+
+logger = logging.getLogger(__name__)
+
+# Bytes moved by each command with a data phase
+_TRANSFER_SIZES = {
+    IC_DOWNLOAD_IMAGE: IMAGE_SIZE,
+    IC_DOWNLOAD_CHAR_BUFFER: TEMPLATE_SIZE,
+    IC_UPLOAD_CHAR_BUFFER: TEMPLATE_SIZE,
+}
+
+
+class AsyncSensor:
+    """
+    asyncio front end with the same commands as Sensor.
+
+    Every command is a coroutine that takes an optional ``timeout`` in
+    seconds covering the whole exchange, including any data packets. It
+    defaults to ``self.timeout``, or ``self.transfer_timeout`` for commands
+    that move an image or template. Commands on one sensor run one at a time;
+    a command that is cancelled or times out leaves the stream to be drained
+    before the next one is sent.
+
+    ``profile`` is the module's DeviceProfile once read_profile or
+    read_parameters has run, kept current by the setters, and None before.
+
+    ``strict`` and ``stamp_library`` have the same meaning as for Sensor.
+    """
+
+    def __init__(self, reader, writer, timeout=3, transfer_timeout=None,
+                 strict=True, retries=DEFAULT_RETRIES, stamp_library=False):
+        """
+        :param reader: asyncio.StreamReader connected to the module
+        :param writer: asyncio.StreamWriter connected to the module
+        :param timeout: default deadline of a command in seconds
+        :param transfer_timeout: default deadline of a command with a data
+        phase, None to size it from the profile: ``timeout`` plus twice the
+        time the packets take on the line, DEFAULT_TRANSFER_TIMEOUT until
+        the profile is known
+        :param strict: when False, expected negative outcomes are returned
+        as results instead of raised, see Sensor
+        :param retries: times an idempotent command or a download is sent
+        again after a framing error, within the command's deadline
+        :param stamp_library: keep a library stamp in the notepad, see
+        Sensor
+        """
+        self._reader = reader
+        self._writer = writer
+        self._password = bytes.fromhex('00000000')
+        self._address = DEFAULT_ADDRESS
+        self._encoder = FrameEncoder(self._address)
+        self._decoder = FrameDecoder(self._address)
+        self._lock = asyncio.Lock()
+        self._stale = False
+        self.profile = None
+        self.timeout = timeout
+        self.transfer_timeout = transfer_timeout
+        self.strict = strict
+        self.retries = retries
+        self._library = _LibraryKeeper(stamp_library)
+        self.instrumentation = None
+
+    @property
+    def instrumentation(self):
+        """Instrumentation hooks, None to skip them"""
+        return self._instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, hooks):
+        self._instrumentation = hooks
+        self._decoder.on_fault = None if hooks is None else hooks.fault
+
+    @property
+    def library_index(self):
+        """LibraryIndex kept current by this sensor, None until loaded"""
+        return self._library.index
+
+    @library_index.setter
+    def library_index(self, index):
+        self._library.index = index
+
+    @property
+    def stamp_library(self):
+        """Whether library changes renew the library stamp"""
+        return self._library.stamp_library
+
+    @stamp_library.setter
+    def stamp_library(self, stamp_library):
+        self._library.stamp_library = stamp_library
+
+    @classmethod
+    async def open(cls, port, baudrate, timeout=3, strict=True,
+                   handshake_timeout=None):
+        """
+        Open a serial port with pyserial-asyncio and verify the password.
+
+        :param port: serial port name or pyserial URL
+        :param baudrate:
+        :param timeout: default deadline of a command in seconds
+        :param strict:
+        :param handshake_timeout: deadline of the password check, timeout
+        when None
+        :return, AsyncSensor:
+        """
+        import serial_asyncio
+
+        reader, writer = await serial_asyncio.open_serial_connection(
+            url=port, baudrate=baudrate)
+        sensor = cls(reader, writer, timeout, strict=strict)
+        try:
+            await sensor.connect(handshake_timeout)
+        except BaseException:
+            sensor.close()
+            raise
+
+        return sensor
+
+    async def connect(self, handshake_timeout=None):
+        """
+        Verify the password over the streams given to the constructor.
+
+        :param handshake_timeout: deadline of the password check, self.timeout
+        when None
+        :return, AsyncSensor: self
+        """
+        await self.verify_password(timeout=handshake_timeout)
+        return self
+
+    def close(self):
+        """
+        :return:
+        """
+        self._writer.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def _drain_stale(self):
+        """
+        Discard whatever a cancelled or timed out command left on the line,
+        waiting until the module has been quiet for a moment.
+
+        :return:
+        """
+        self._decoder.reset()
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + STALE_DRAIN_LIMIT
+        while loop.time() < deadline:
+            try:
+                data = await asyncio.wait_for(self._reader.read(4096),
+                                              STALE_QUIET)
+            except asyncio.TimeoutError:
+                break
+            if not data:
+                break
+
+        self._stale = False
+
+    async def _receive_packet(self, expected):
+        """
+        :param expected: _ACK_PIDS or _DATA_PIDS
+        :return: pid and content, content is only valid until the next
+        packet is received
+        """
+        decoder = self._decoder
+        hooks = self._instrumentation
+        skipped = decoder.skipped
+        while True:
+            try:
+                frame = decoder.decode()
+                if frame is not None:
+                    _check_pid(frame[0], expected)
+            except ProtocolError as error:
+                if hooks is not None:
+                    hooks.fault(error.kind)
+                raise
+            if frame is not None:
+                if hooks is not None:
+                    hooks.frame_received(frame[0], FRAME_PREFIX_SIZE +
+                                         len(frame[1]) + CHECKSUM_SIZE)
+                return frame
+
+            read = self._reader.read(decoder.space())
+            if decoder.skipped == skipped:
+                data = await read
+            else:
+                # Garbage came in; if nothing follows it the packet was lost
+                # and waiting for the deadline would only delay a retry
+                try:
+                    data = await asyncio.wait_for(read, LOST_PACKET_QUIET)
+                except asyncio.TimeoutError:
+                    if hooks is not None:
+                        hooks.fault('lost')
+                    raise ProtocolError("Packet lost in line noise", 'lost')
+                skipped = decoder.skipped
+            if not data:
+                if hooks is not None:
+                    hooks.fault('closed')
+                raise ConnectionError("Connection closed")
+            decoder.feed(data)
+
+    def _write_packet(self, pid, content):
+        """
+        Queue one packet on the writer.
+
+        :param pid:
+        :param content:
+        :return:
+        """
+        frame = self._encoder.encode(pid, content)
+        self._writer.write(frame)
+
+        if self._instrumentation is not None:
+            self._instrumentation.frame_sent(pid, len(frame))
+
+    async def _receive_data(self):
+        """
+        Yield the content of data packets up to and including the end of
+        data packet.
+
+        :return: async generator of memoryview
+        """
+        while True:
+            pid, content = await self._receive_packet(_DATA_PIDS)
+            yield content
+
+            if pid == PID_EOD:
+                break
+
+    async def _send_data(self, data):
+        """
+        Send data as a run of data packets ending with an end of data packet.
+
+        :param data, bytes-like:
+        :return:
+        """
+        for pid, content in _data_packets(data, self.profile.packet_size):
+            self._write_packet(pid, content)
+        await self._writer.drain()
+
+    async def _exchange(self, command, args, then=None, check=True):
+        """
+        Send a command, check its confirmation code and run ``then`` for
+        any data phase, all under one deadline.
+        """
+        if self._stale:
+            await self._drain_stale()
+
+        data = _command_data(command, args)
+        hooks = self._instrumentation
+        if hooks is not None:
+            start = time.perf_counter()
+
+        # Until the exchange completes an abandoned reply may still arrive
+        self._stale = True
+        self._write_packet(PID_COMMAND, data)
+        await self._writer.drain()
+
+        content = bytes((await self._receive_packet(_ACK_PIDS))[1])
+        if hooks is not None:
+            hooks.command(command, content[0:1], time.perf_counter() - start)
+        if then is None or content[0:1] != CC_SUCCESS:
+            self._stale = False
+        if not check:
+            return content
+        _check_cc(command, content[0:1])
+
+        if then is not None:
+            result = await then(content[1:])
+            self._stale = False
+            return result
+        return content[1:]
+
+    async def _execute(self, command, *args, timeout=None, then=None,
+                       check=True, retry=None):
+        """
+        Run one command exchange under the sensor's lock and a deadline.
+
+        :param command: bytes
+        :param args: other parameters for the command
+        :param timeout: seconds, self.timeout when None
+        :param then: optional coroutine function run on the acknowledgement
+        payload for commands with a data phase
+        :param check: when False the confirmation code is not checked and
+        the whole acknowledgement is returned
+        :param retry: whether the exchange may be run again after a framing
+        error, by default when the command is idempotent
+        :return: the acknowledgement after the confirmation code, or the
+        result of then
+        """
+        if timeout is None:
+            timeout = self.timeout if then is None else \
+                self._transfer_timeout(command)
+        if retry is None:
+            retry = command in _IDEMPOTENT_COMMANDS
+
+        async with self._lock:
+            try:
+                return await asyncio.wait_for(
+                    self._attempts(command, args, then, check,
+                                   self.retries if retry else 0), timeout)
+            except asyncio.TimeoutError:
+                if self._instrumentation is not None:
+                    self._instrumentation.fault('deadline')
+                raise
+
+    async def _attempts(self, command, args, then, check, retries):
+        """
+        Run the exchange, running it again up to retries times after a
+        framing error with a doubling delay in between.
+        """
+        attempt = 0
+        while True:
+            try:
+                return await self._exchange(command, args, then, check)
+            except ProtocolError as error:
+                if attempt >= retries:
+                    raise
+                logger.info("retrying after %s", error)
+
+            # The failed exchange left the stream stale, the next attempt
+            # drains it first
+            await asyncio.sleep(min(RETRY_DELAY * 2 ** attempt,
+                                    RETRY_MAX_DELAY))
+            attempt += 1
+
+    async def _outcome(self, command, *args, timeout=None):
+        """
+        Like _execute, but when the sensor is not strict the expected
+        negative outcomes of the command are returned instead of raised.
+
+        :return: Status and the acknowledgement after the confirmation code
+        """
+        data = await self._execute(command, *args, timeout=timeout,
+                                   check=False)
+        accept = () if self.strict else _NEGATIVE_OUTCOMES[command]
+        return _check_cc(command, data[0:1], accept), data[1:]
+
+    async def _run(self, steps, timeout=None, calls=None):
+        """
+        Run the steps of an operation shared with Sensor, see
+        library._LibraryKeeper.
+
+        :param steps: step generator
+        :param timeout: deadline of each step's command
+        :param calls: coroutine functions by step name, None to call the
+        sensor's method of that name with the timeout
+        :return: the result of the operation
+        """
+        reply = error = None
+        try:
+            while True:
+                try:
+                    if error is None:
+                        step = steps.send(reply)
+                    else:
+                        step = steps.throw(error)
+                except StopIteration as stop:
+                    return stop.value
+
+                if calls is None:
+                    call = functools.partial(getattr(self, step[0]),
+                                             timeout=timeout)
+                else:
+                    call = calls[step[0]]
+                reply = error = None
+                try:
+                    reply = await call(*step[1:])
+                except SensorError as raised:
+                    error = raised
+        finally:
+            steps.close()
+
+    def _transfer_timeout(self, command):
+        """
+        :return, float: default deadline of a command with a data phase
+        """
+        if self.transfer_timeout is not None:
+            return self.transfer_timeout
+        if self.profile is None:
+            return DEFAULT_TRANSFER_TIMEOUT
+        return self.timeout + 2 * self.profile.transfer_time(
+            _TRANSFER_SIZES.get(command, IMAGE_SIZE))
+
+    async def _device_profile(self, timeout=None):
+        if self.profile is None:
+            await self.read_parameters(timeout)
+        return self.profile
+
+    def _update_profile(self, **fields):
+        if self.profile is not None:
+            self.profile = self.profile._replace(**fields)
+
+    def _check_pages(self, page_id, n=1):
+        if self.profile is not None:
+            self.profile.check_pages(page_id, n)
+
+    async def verify_password(self, timeout=None):
+        await self._execute(IC_VERIFY_PASSWORD, self._password,
+                            timeout=timeout)
+
+    async def generate_image(self, timeout=2):
+        """
+        Capture a fingerprint image, giving the user up to timeout seconds
+        to place a finger, as Sensor.generate_image. Returns as soon as the
+        image is captured.
+
+        :param timeout: seconds to wait for a finger
+        :return: None, or a Result when the sensor is not strict
+        """
+        return _capture_result(await self.wait_for_finger(timeout),
+                               self.strict)
+
+    async def wait_for_finger(self, timeout=10, poll_interval=0.2):
+        """
+        Poll the capture command until an image has been captured, as
+        Sensor.wait_for_finger. Cancel the task to stop waiting.
+
+        :param timeout: seconds to wait, None to wait until cancelled
+        :param poll_interval: longest pause between two polls
+        :return, bool: True when an image was captured, False on timeout
+        """
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        interval = min(FINGER_POLL_MIN_INTERVAL, poll_interval)
+
+        while True:
+            data = await self._execute(IC_GENERATE_IMAGE, check=False)
+            if data[0:1] not in _NO_FINGER_CCS:
+                _check_cc(IC_GENERATE_IMAGE, data[0:1])
+                return True
+
+            wait = interval
+            if deadline is not None:
+                wait = min(wait, deadline - loop.time())
+                if wait <= 0:
+                    return False
+
+            await asyncio.sleep(wait)
+            interval = min(interval * FINGER_POLL_BACKOFF, poll_interval)
+
+    async def _wait_for_lift(self, poll_interval):
+        interval = FINGER_POLL_MIN_INTERVAL
+        while True:
+            data = await self._execute(IC_GENERATE_IMAGE, check=False)
+            if data[0:1] == CC_FINGER_NOT_DETECTED:
+                return True
+            await asyncio.sleep(interval)
+            interval = min(interval * FINGER_POLL_BACKOFF, poll_interval)
+
+    async def identify_events(self, start_page=0, count=None,
+                              buffer_id=CHAR_BUFFER_1, poll_interval=0.2,
+                              debounce=True, rate=None):
+        """
+        Identify every finger placed on the glass, as
+        Sensor.identify_events, for as long as the iterator is consumed::
+
+            async for event in sensor.identify_events(rate=2):
+                ...
+
+        The sensor's lock is only held for single commands, so other
+        commands run between polls. Close the iterator or cancel its task
+        to stop.
+
+        :return: async iterator of IdentifyEvent
+        """
+        if count is None:
+            count = (await self._device_profile()).library_size - start_page
+        loop = asyncio.get_event_loop()
+        cycle = _IdentifyCycle(poll_interval, debounce, rate, loop.time)
+
+        async def sleep(seconds):
+            await asyncio.sleep(seconds)
+            return True
+
+        async def extract():
+            return (await self._execute(IC_GENERATE_CHARACTERISTICS,
+                                        buffer_id, check=False))[0:1]
+
+        calls = {
+            'lift': lambda: self._wait_for_lift(poll_interval),
+            'sleep': sleep,
+            'finger': lambda: self.wait_for_finger(None, poll_interval),
+            'extract': extract,
+            'search': lambda: self.search_library(buffer_id, start_page,
+                                                  count),
+        }
+
+        while True:
+            yield await self._run(cycle.next_event(), calls=calls)
+
+    async def download_image(self, dest=None, timeout=None):
+        """
+        Download the image held in the module's image buffer.
+
+        :param dest: None to get a new buffer back, or a writable buffer or
+        file object as for Sensor.download_image
+        :param timeout: deadline of the whole transfer
+        :return: the packed image when dest is None, otherwise the number of
+        bytes received
+        """
+        if dest is None:
+            image = bytearray(IMAGE_SIZE)
+            received = await self.download_image(image, timeout)
+            del image[received:]
+            return image
+
+        retry = True
+        position = None
+        if hasattr(dest, 'write'):
+            if hasattr(dest, 'seekable') and dest.seekable():
+                position = dest.tell()
+            else:
+                # What was streamed already cannot be taken back
+                retry = False
+            view = None
+        else:
+            view = _image_view(dest)
+
+        async def receive(_):
+            received = 0
+            # A retry starts the image over
+            if position is not None and dest.tell() != position:
+                dest.seek(position)
+                dest.truncate()
+
+            try:
+                async for content in self._receive_data():
+                    end = received + len(content)
+                    if view is None:
+                        dest.write(content)
+                    elif end > len(view):
+                        raise ValueError("Image larger than the destination "
+                                         "buffer")
+                    else:
+                        view[received:end] = content
+                    received = end
+            except Exception:
+                # The rest of the image must not be taken for the next reply
+                await self._drain_stale()
+                raise
+
+            return received
+
+        return await self._execute(IC_DOWNLOAD_IMAGE, timeout=timeout,
+                                   then=receive, retry=retry)
+
+    async def generate_charfile_image(self, buffer_id, timeout=None):
+        status = (await self._outcome(IC_GENERATE_CHARACTERISTICS, buffer_id,
+                                      timeout=timeout))[0]
+        return _status_result(status, self.strict)
+
+    async def generate_template(self, timeout=None):
+        status = (await self._outcome(IC_GENERATE_TEMPLATE,
+                                      timeout=timeout))[0]
+        return _status_result(status, self.strict)
+
+    async def download_char_buffer(self, buffer_id, timeout=None):
+        async def receive(_):
+            char_rcv = bytearray()
+            async for content in self._receive_data():
+                char_rcv += content
+            return bytes(char_rcv)
+
+        return await self._execute(IC_DOWNLOAD_CHAR_BUFFER, buffer_id,
+                                   timeout=timeout, then=receive, retry=True)
+
+    async def upload_char_buffer(self, buffer_id, template, timeout=None):
+        await self._device_profile(timeout)
+
+        async def send(_):
+            await self._send_data(template)
+
+        await self._execute(IC_UPLOAD_CHAR_BUFFER, buffer_id,
+                            timeout=timeout, then=send)
+
+    async def set_password(self, new_password, timeout=None):
+        await self._execute(IC_SET_PASSWORD, *_password_args(new_password),
+                            timeout=timeout)
+
+    async def set_address(self, address, timeout=None):
+        args = _address_args(address)
+        await self._execute(IC_SET_ADDRESS, *args, timeout=timeout)
+        # The module answers under the old address and only listens on the
+        # new one from then on
+        self._address = args[0]
+        self._encoder.address = self._address
+        self._decoder.address = self._address
+        self._update_profile(address=self._address)
+
+    async def _set_parameters(self, pn, n, timeout=None):
+        await self._execute(IC_SET_PARAMETERS, *_parameter_args(pn, n),
+                            timeout=timeout)
+
+    async def set_baudrate(self, n, timeout=None):
+        await self._set_parameters(PN_BAUD_RATE, n, timeout)
+        self._update_profile(baud_setting=n)
+
+    async def set_security_level(self, n, timeout=None):
+        await self._set_parameters(PN_SECURITY_LEVEL, n, timeout)
+        self._update_profile(security_level=n)
+
+    async def set_package_length(self, n, timeout=None):
+        await self._set_parameters(PN_PACKAGE_LEN, n, timeout)
+        self._update_profile(package_length=n)
+
+    async def set_port_control(self, val, timeout=None):
+        await self._execute(IC_SET_PORT_CONTROL, *_port_control_args(val),
+                            timeout=timeout)
+
+    async def read_parameters(self, timeout=None):
+        data = await self._execute(IC_READ_PARAMETERS, timeout=timeout)
+        self.profile = DeviceProfile.from_parameters(data)
+        return _parse_parameters(data)
+
+    async def read_profile(self, timeout=None):
+        await self.read_parameters(timeout)
+        return self.profile
+
+    async def read_valid_template_num(self, timeout=None):
+        return await self._execute(IC_READ_TEMPLATE_NUM, timeout=timeout)
+
+    async def read_index_table(self, index_page, timeout=None):
+        return await self._execute(IC_READ_INDEX_TABLE,
+                                   *_index_table_args(index_page),
+                                   timeout=timeout)
+
+    async def load_library_index(self, cached=None, timeout=None):
+        return await self._run(
+            self._library.load_index(cached, self.profile), timeout)
+
+    async def read_library_stamp(self, timeout=None):
+        return await self._run(self._library.read_stamp(), timeout)
+
+    async def fingerprint_verification(self, capture_time, start_bit,
+                                       search_quantity, timeout=None):
+        status, rcv_data = await self._outcome(
+            IC_FINGERPRINT_VERIFICATION,
+            *_verification_args(capture_time, start_bit, search_quantity),
+            timeout=timeout)
+
+        return _verification_reply(status, rcv_data, self.strict)
+
+    async def auto_fingerprint_verification(self, timeout=None):
+        status, rcv_data = await self._outcome(
+            IC_AUTO_FINGERPRINT_VERIFICATION, timeout=timeout)
+
+        return _verification_reply(status, rcv_data, self.strict)
+
+    async def store_template(self, buffer_id, page_id, timeout=None):
+        self._check_pages(page_id)
+        await self._run(self._library.stamp_change(), timeout)
+        await self._execute(IC_STORE_TEMPLATE,
+                            *_template_args(buffer_id, page_id),
+                            timeout=timeout)
+        self._library.stored(page_id)
+
+    async def read_template(self, buffer_id, page_id, timeout=None):
+        self._check_pages(page_id)
+        await self._execute(IC_READ_TEMPLATE,
+                            *_template_args(buffer_id, page_id),
+                            timeout=timeout)
+
+    async def delete_template(self, page_id, n, timeout=None):
+        self._check_pages(page_id, n)
+        await self._run(self._library.stamp_change(), timeout)
+        await self._execute(IC_DELETE_TEMPLATE, *_delete_args(page_id, n),
+                            timeout=timeout)
+        self._library.deleted(page_id, n)
+
+    async def empty_fingerprint_library(self, timeout=None):
+        await self._run(self._library.stamp_change(), timeout)
+        await self._execute(IC_EMPTY_FINGERPRINT_LIBRARY, timeout=timeout)
+        self._library.emptied()
+
+    async def delete_templates(self, page_ids, timeout=None):
+        return await self._run(self._library.delete_templates(page_ids),
+                               timeout)
+
+    async def store_templates(self, templates, buffer_id=CHAR_BUFFER_1,
+                              timeout=None):
+        return await self._run(
+            self._library.store_templates(templates, buffer_id), timeout)
+
+    async def read_templates(self, page_ids, buffer_id=CHAR_BUFFER_1,
+                             timeout=None):
+        return await self._run(
+            self._library.read_templates(page_ids, buffer_id), timeout)
+
+    async def search_library(self, buffer_id, start_page, count,
+                             timeout=None):
+        return _search_reply(await self._execute(
+            IC_SEARCH, *_search_args(buffer_id, start_page, count),
+            timeout=timeout, check=False))
+
+    async def match_template(self, timeout=None):
+        status, match_score = await self._outcome(IC_MATCH_TEMPLATE,
+                                                  timeout=timeout)
+        return _match_reply(status, match_score, self.strict)
+
+    async def get_random_number(self, timeout=None):
+        random_number = await self._execute(IC_RANDOM_NUMBER, timeout=timeout)
+
+        return int.from_bytes(random_number, byteorder='big')
+
+    async def write_notepad(self, page, data, timeout=None):
+        await self._execute(IC_WRITE_NOTEPAD, *_notepad_args(page, data),
+                            timeout=timeout)
+        self._library.notepad_written(page)
+
+    async def read_notepad(self, page=0, encoding='UTF-8', timeout=None):
+        notepad_content = await self._execute(
+            IC_READ_NOTEPAD, *_notepad_page_args(page), timeout=timeout)
+        return _notepad_reply(notepad_content, encoding)
@@ -0,0 +1,301 @@
+"""
+Latency and throughput benchmarks for r307_fingerprint.
+
+Measures the round trip of each command and the throughput of image and
+template transfers for a set of baud rate and packet length settings, on a
+real module or on r307_fingerprint.virtual.VirtualSensor, and writes the
+results as JSON so runs can be diffed::
+
+    python -m r307_fingerprint.benchmark --port /dev/ttyUSB0 --output site.json
+    python -m r307_fingerprint.benchmark --virtual --latency \
+        --baudrates 57600,115200
+
+Commands that capture a fingerprint need a finger on the sensor. Storing
+and deleting use a scratch page, the last page of the library by default,
+which must not hold a template that matters.
+"""
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+
+from .constants import *
+from .sensor import Sensor
+
+
+def summarize(samples):
+    """
+    :param samples: durations in seconds
+    :return, dict: count, min, mean, percentiles and max, in milliseconds
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+
+    def percentile(p):
+        return ordered[min(int(math.ceil(p / 100.0 * len(ordered))) - 1,
+                           len(ordered) - 1)] * 1000
+
+    return {
+        'count': len(ordered),
+        'min_ms': ordered[0] * 1000,
+        'mean_ms': statistics.mean(ordered) * 1000,
+        'stdev_ms': statistics.pstdev(ordered) * 1000,
+        'p50_ms': percentile(50),
+        'p90_ms': percentile(90),
+        'p99_ms': percentile(99),
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def _time(call, iterations):
+    samples = []
+    errors = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        try:
+            call()
+        except Exception:
+            errors += 1
+            continue
+        samples.append(time.perf_counter() - start)
+    return samples, errors
+
+
+def command_cases(sensor, scratch_page):
+    """
+    :return: list of (name, setup, call) for every benchmarked command
+    """
+    def fill_buffers():
+        sensor.generate_charfile_image(CHAR_BUFFER_1)
+        sensor.generate_charfile_image(CHAR_BUFFER_2)
+
+    def store():
+        sensor.store_template(CHAR_BUFFER_1, scratch_page)
+
+    return [
+        ('verify_password', None, sensor.verify_password),
+        ('read_parameters', None, sensor.read_parameters),
+        ('read_valid_template_num', None, sensor.read_valid_template_num),
+        ('read_index_table', None, lambda: sensor.read_index_table(0)),
+        ('get_random_number', None, sensor.get_random_number),
+        ('read_notepad', None, sensor.read_notepad),
+        ('generate_image', None, sensor.generate_image),
+        ('generate_charfile_image', sensor.generate_image,
+         lambda: sensor.generate_charfile_image(CHAR_BUFFER_1)),
+        ('generate_template', fill_buffers, sensor.generate_template),
+        ('match_template', fill_buffers, sensor.match_template),
+        ('store_template', fill_buffers, store),
+        ('read_template', store,
+         lambda: sensor.read_template(CHAR_BUFFER_1, scratch_page)),
+        ('delete_template', None,
+         lambda: sensor.delete_template(scratch_page, 1)),
+        ('fingerprint_verification', None,
+         lambda: sensor.fingerprint_verification(CAPTURE_TIME_4_5, 0,
+                                                 scratch_page + 1)),
+        ('auto_fingerprint_verification', None,
+         sensor.auto_fingerprint_verification),
+    ]
+
+
+def bench_commands(sensor, iterations, scratch_page, only=None):
+    """
+    :param sensor: connected Sensor
+    :param iterations: samples per command
+    :param scratch_page: page the store/read/delete commands may overwrite
+    :param only: optional set of command names to run
+    :return, dict: per command latency summary and error count
+    """
+    results = {}
+    for name, setup, call in command_cases(sensor, scratch_page):
+        if only and name not in only:
+            continue
+        try:
+            if setup is not None:
+                setup()
+        except Exception as error:
+            results[name] = {'count': 0, 'errors': iterations,
+                             'setup_error': str(error)}
+            continue
+
+        samples, errors = _time(call, iterations)
+        results[name] = summarize(samples)
+        results[name]['errors'] = errors
+
+    return results
+
+
+def bench_transfers(sensor, iterations, baud_settings, package_lengths):
+    """
+    Throughput of download_image and download_char_buffer for every
+    combination of settings. The module's settings are restored afterwards.
+
+    :param sensor: connected Sensor with a finger on the glass
+    :param iterations: transfers per combination
+    :param baud_settings: baud rate settings (multiples of 9600) to try
+    :param package_lengths: package length settings (0 to 3) to try
+    :return, list of dict:
+    """
+    profile = sensor.read_profile()
+    original_baud = profile.baud_setting
+    original_length = profile.package_length
+
+    sensor.generate_image()
+    sensor.generate_charfile_image(CHAR_BUFFER_1)
+
+    results = []
+    try:
+        for baud in baud_settings:
+            sensor.switch_baudrate(baud)
+            # The link check overwrote the character file
+            sensor.generate_charfile_image(CHAR_BUFFER_1)
+            for length in package_lengths:
+                sensor.set_package_length(length)
+                packet_size = sensor.profile.packet_size
+
+                transfers = (
+                    ('download_image', sensor.download_image),
+                    ('download_char_buffer',
+                     lambda: sensor.download_char_buffer(CHAR_BUFFER_1)),
+                )
+                for name, call in transfers:
+                    size = len(call())
+                    samples, errors = _time(call, iterations)
+                    # Data packets plus the acknowledgement
+                    frames = -(-size // packet_size) + 1
+                    seconds = statistics.mean(samples) if samples else None
+                    results.append({
+                        'transfer': name,
+                        'baudrate': baud * 9600,
+                        'packet_size': packet_size,
+                        'bytes': size,
+                        'frames': frames,
+                        'errors': errors,
+                        'latency': summarize(samples),
+                        'bytes_per_s': size / seconds if seconds else None,
+                        'frames_per_s': frames / seconds if seconds else None,
+                    })
+    finally:
+        sensor.set_package_length(original_length)
+        sensor.switch_baudrate(original_baud)
+
+    return results
+
+
+def run(sensor, iterations=20, transfer_iterations=3, scratch_page=None,
+        baud_settings=None, package_lengths=(0, 1, 2, 3), commands=None,
+        transfers=True):
+    """
+    Run the whole suite on a connected sensor.
+
+    :return, dict: JSON-serialisable results
+    """
+    profile = sensor.read_profile()
+    if scratch_page is None:
+        scratch_page = profile.max_page_id
+    if baud_settings is None:
+        baud_settings = [profile.baud_setting]
+
+    results = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': iterations,
+            'transfer_iterations': transfer_iterations,
+            'scratch_page': scratch_page,
+        },
+        'commands': bench_commands(sensor, iterations, scratch_page,
+                                   commands),
+    }
+    if transfers:
+        results['transfers'] = bench_transfers(
+            sensor, transfer_iterations, baud_settings, package_lengths)
+
+    return results
+
+
+def _report(results, file):
+    for name, stats in results['commands'].items():
+        if stats['count']:
+            file.write('%-30s p50 %8.2f ms  p99 %8.2f ms  errors %d\n' % (
+                name, stats['p50_ms'], stats['p99_ms'], stats['errors']))
+        else:
+            file.write('%-30s failed\n' % name)
+
+    for row in results.get('transfers', []):
+        if row['bytes_per_s']:
+            file.write('%-22s %6d baud %3d B/packet %9.0f B/s %7.1f '
+                       'frames/s\n' % (row['transfer'], row['baudrate'],
+                                       row['packet_size'],
+                                       row['bytes_per_s'],
+                                       row['frames_per_s']))
+
+
+def _settings(text):
+    return [int(value) for value in text.split(',') if value]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--port', help='serial port of the module')
+    target.add_argument('--virtual', action='store_true',
+                        help='benchmark against virtual.VirtualSensor')
+    parser.add_argument('--baudrate', type=int, default=57600,
+                        help='current baud rate of the module')
+    parser.add_argument('--latency', action='store_true',
+                        help='simulate line and processing time (--virtual)')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--transfer-iterations', type=int, default=3)
+    parser.add_argument('--scratch-page', type=int)
+    parser.add_argument('--baudrates', type=_settings,
+                        help='comma separated baud rates to sweep')
+    parser.add_argument('--package-lengths', type=_settings,
+                        default=[0, 1, 2, 3],
+                        help='comma separated package length settings, 0-3')
+    parser.add_argument('--commands', type=lambda text: set(text.split(',')),
+                        help='comma separated commands to benchmark')
+    parser.add_argument('--no-transfers', action='store_true')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args(argv)
+
+    if args.virtual:
+        from .virtual import VirtualSensor
+
+        device = VirtualSensor(baudrate=args.baudrate, latency=args.latency)
+        device.place_finger(b'benchmark')
+        device.enroll(b'benchmark')
+        port = device
+    else:
+        port = args.port
+
+    # Without library stamping, so store and delete timings are those of
+    # the commands alone
+    sensor = Sensor(port, args.baudrate, stamp_library=False)
+
+    baud_settings = None
+    if args.baudrates:
+        baud_settings = [baud // 9600 for baud in args.baudrates]
+
+    results = run(sensor, args.iterations, args.transfer_iterations,
+                  args.scratch_page, baud_settings, args.package_lengths,
+                  args.commands, not args.no_transfers)
+    results['meta']['target'] = 'virtual' if args.virtual else args.port
+    results['meta']['latency_simulated'] = bool(args.virtual and
+                                                args.latency)
+
+    _report(results, sys.stderr)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""
+Broker daemon that shares sensors between processes.
+
+Only one process can hold a serial port. The broker owns a SensorPool and
+serves the pooled sensors' commands on a Unix domain socket to any number
+of RemoteSensor clients, queueing them by priority per device and
+streaming image downloads as they arrive::
+
+    python -m r307_fingerprint.broker --socket /run/r307.sock /dev/ttyUSB0
+
+    sensor = RemoteSensor('/run/r307.sock')
+    sensor.generate_image()
+    image = sensor.download_image()
+
+The wire format is described in r307_fingerprint.remote.
+"""
+import argparse
+import asyncio
+import inspect
+import logging
+import os
+import stat
+
+from .aio import AsyncSensor
+from .errors import SensorError
+from .pool import PRIORITY_MAINTENANCE, PRIORITY_NORMAL, SensorPool, \
+    command_priority
+from .remote import FLAG_LENIENT, MAX_MESSAGE_SIZE, PRIORITY_DEFAULT, \
+    REQ_CALL, REQ_LOCK, REQ_UNLOCK, RSP_CHUNK, RSP_ERROR, RSP_RESULT, \
+    _error_value, pack_value, unpack_value
+
+logger = logging.getLogger(__name__)
+
+# AsyncSensor commands a client may run
+BROKER_COMMANDS = frozenset(
+    name for name, member in vars(AsyncSensor).items()
+    if not name.startswith('_') and name != 'connect' and
+    inspect.iscoroutinefunction(member))
+
+
+def _write_message(writer, body):
+    writer.write(len(body).to_bytes(4, byteorder='big'))
+    writer.write(body)
+
+
+class _ChunkWriter:
+    """File-like destination that streams download_image to a client"""
+
+    def __init__(self, writer):
+        self._writer = writer
+
+    def write(self, content):
+        _write_message(self._writer, bytes((RSP_CHUNK,)) + content)
+
+
+class _Session:
+    """A client's exclusive hold on one pooled sensor"""
+
+    def __init__(self, port):
+        self.port = port
+        self.sensor = None
+        self.released = asyncio.Event()
+
+
+class SensorBroker:
+    """
+    Serves the sensors of a SensorPool on a Unix domain socket.
+
+    Usage::
+
+        async with SensorPool(['/dev/ttyUSB0'], 57600) as pool:
+            async with SensorBroker(pool, '/run/r307.sock') as broker:
+                await broker.serve_forever()
+    """
+
+    def __init__(self, pool, path, lock_timeout=30):
+        """
+        :param pool: started SensorPool, owned by the caller
+        :param path: socket path to listen on
+        :param lock_timeout: seconds after which an exclusive hold is ended
+        so a stuck client cannot keep a sensor from everyone else
+        """
+        self._pool = pool
+        self._path = path
+        self._server = None
+        self.lock_timeout = lock_timeout
+
+    @property
+    def path(self):
+        return self._path
+
+    async def start(self):
+        """
+        Listen on the socket path, replacing a socket left by an earlier
+        broker.
+
+        :return, SensorBroker: self
+        """
+        try:
+            if stat.S_ISSOCK(os.stat(self._path).st_mode):
+                os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+        self._server = await asyncio.start_unix_server(self._serve,
+                                                       path=self._path)
+        return self
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """
+        Stop listening and remove the socket file. Clients already connected
+        are served until they disconnect.
+
+        :return:
+        """
+        if self._server is None:
+            return
+
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _port(self, port):
+        return port or self._pool.ports[0]
+
+    async def _serve(self, reader, writer):
+        session = None
+        try:
+            while True:
+                try:
+                    size = int.from_bytes(await reader.readexactly(4),
+                                          byteorder='big')
+                    if size < 3 or size > MAX_MESSAGE_SIZE:
+                        logger.warning("Dropping client after a message "
+                                       "of %d bytes", size)
+                        break
+                    message = await reader.readexactly(size)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                kind, flags, priority = message[0], message[1], message[2]
+                try:
+                    value = unpack_value(memoryview(message)[3:])
+                    if priority != PRIORITY_DEFAULT and \
+                            priority > PRIORITY_MAINTENANCE:
+                        raise ValueError("Invalid priority %d" % priority)
+
+                    if kind == REQ_CALL:
+                        port, command, args = value
+                        result = await self._call(session, port, command,
+                                                  args, flags, priority,
+                                                  writer)
+                    elif kind == REQ_LOCK:
+                        if session is not None:
+                            session.released.set()
+                        session = None
+                        session = await self._acquire(value[0], priority)
+                        result = None
+                    elif kind == REQ_UNLOCK:
+                        if session is not None:
+                            session.released.set()
+                        session = None
+                        result = None
+                    else:
+                        raise SensorError("Unknown request kind %d" % kind)
+
+                    body = bytes((RSP_RESULT,)) + pack_value(result)
+                except Exception as error:
+                    body = bytes((RSP_ERROR,)) + \
+                        pack_value(_error_value(error))
+
+                _write_message(writer, body)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if session is not None:
+                session.released.set()
+            writer.close()
+
+    async def _acquire(self, port, priority):
+        """
+        Queue a hold on the sensor and wait until it is granted.
+
+        :return, _Session:
+        """
+        port = self._port(port)
+        session = _Session(port)
+        granted = asyncio.get_event_loop().create_future()
+
+        async def hold(sensor):
+            session.sensor = sensor
+            granted.set_result(None)
+            try:
+                await asyncio.wait_for(session.released.wait(),
+                                       self.lock_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Exclusive hold on %s expired", port)
+            finally:
+                session.sensor = None
+
+        if priority == PRIORITY_DEFAULT:
+            priority = PRIORITY_NORMAL
+        future = self._pool.submit(port, hold, priority=priority)
+        await asyncio.wait((granted, future),
+                           return_when=asyncio.FIRST_COMPLETED)
+        if not granted.done():
+            # The device failed before the hold began
+            future.result()
+
+        return session
+
+    async def _call(self, session, port, command, args, flags, priority,
+                    writer):
+        """
+        Run one command, on the held sensor when the client holds it and
+        through the pool otherwise.
+        """
+        if command not in BROKER_COMMANDS:
+            raise SensorError("Unknown command %r" % (command,))
+
+        port = self._port(port)
+        strict = not flags & FLAG_LENIENT
+        if command == 'download_image':
+            args = (_ChunkWriter(writer),)
+
+        async def run(sensor):
+            saved = sensor.strict
+            sensor.strict = strict
+            try:
+                return await getattr(sensor, command)(*args)
+            finally:
+                sensor.strict = saved
+
+        if session is not None and session.port == port:
+            if session.sensor is None:
+                raise SensorError("Exclusive hold expired")
+            return await run(session.sensor)
+
+        if priority == PRIORITY_DEFAULT:
+            priority = command_priority(command)
+        return await self._pool.submit(port, run, priority=priority)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('ports', nargs='*', help='serial ports of the sensors')
+    parser.add_argument('--socket', required=True,
+                        help='Unix domain socket to listen on')
+    parser.add_argument('--baudrate', type=int, default=57600)
+    parser.add_argument('--timeout', type=float, default=3,
+                        help='default command deadline in seconds')
+    parser.add_argument('--lock-timeout', type=float, default=30,
+                        help='longest exclusive hold in seconds')
+    parser.add_argument('--virtual', action='store_true',
+                        help='serve one simulated sensor instead')
+    args = parser.parse_args(argv)
+
+    ports = args.ports
+    if not ports and not args.virtual:
+        parser.error('give at least one port, or --virtual')
+
+    opener = None
+    if args.virtual:
+        from .virtual import VirtualSensor
+
+        device = VirtualSensor(baudrate=args.baudrate)
+        ports = ['virtual']
+
+        async def open_virtual(port, baudrate, timeout):
+            reader, writer = await device.open_connection()
+            return await AsyncSensor(reader, writer, timeout).connect()
+
+        opener = open_virtual
+
+    async def serve():
+        async with SensorPool(ports, args.baudrate, args.timeout,
+                              opener=opener) as pool:
+            async with SensorBroker(pool, args.socket,
+                                    args.lock_timeout) as broker:
+                await broker.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
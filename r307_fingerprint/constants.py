@@ -0,0 +1,168 @@
+"""
+Packet identifiers, instruction and confirmation codes, parameter keys and
+other constants of the R30x protocol.
+"""
+
+HEADER = bytes.fromhex('EF01')
+
+PID_COMMAND = bytes.fromhex('01')
+PID_ACK = bytes.fromhex('07')
+PID_DATA = bytes.fromhex('02')
+PID_EOD = bytes.fromhex('08')
+
+IC_VERIFY_PASSWORD = bytes.fromhex('13')
+IC_GENERATE_IMAGE = bytes.fromhex('01')
+IC_DOWNLOAD_IMAGE = bytes.fromhex('0a')
+IC_GENERATE_CHARACTERISTICS = bytes.fromhex('02')
+IC_GENERATE_TEMPLATE = bytes.fromhex('05')
+IC_DOWNLOAD_CHAR_BUFFER = bytes.fromhex('08')
+IC_UPLOAD_CHAR_BUFFER = bytes.fromhex('09')
+IC_SET_PASSWORD = bytes.fromhex('12')
+IC_SET_PARAMETERS = bytes.fromhex('0e')
+IC_READ_PARAMETERS = bytes.fromhex('0f')
+IC_FINGERPRINT_VERIFICATION = bytes.fromhex('32')
+IC_STORE_TEMPLATE = bytes.fromhex('06')
+IC_UPLOAD_IMAGE = bytes.fromhex('0b')
+IC_DELETE_TEMPLATE = bytes.fromhex('0c')
+IC_MATCH_TEMPLATE = bytes.fromhex('03')
+IC_RANDOM_NUMBER = bytes.fromhex('14')
+IC_READ_NOTEPAD = bytes.fromhex('19')
+IC_WRITE_NOTEPAD = bytes.fromhex('18')
+IC_SET_ADDRESS = bytes.fromhex('15')
+IC_SET_PORT_CONTROL = bytes.fromhex('17')
+IC_READ_TEMPLATE_NUM = bytes.fromhex('1d')
+IC_AUTO_FINGERPRINT_VERIFICATION = bytes.fromhex('34')
+IC_READ_TEMPLATE = bytes.fromhex('07')
+IC_EMPTY_FINGERPRINT_LIBRARY = bytes.fromhex('0d')
+IC_READ_INDEX_TABLE = bytes.fromhex('1f')
+IC_SEARCH = bytes.fromhex('04')
+
+CC_SUCCESS = bytes.fromhex('00')
+CC_ERROR = bytes.fromhex('01')
+CC_WRONG_PASS = bytes.fromhex('13')
+CC_FINGER_NOT_DETECTED = bytes.fromhex('02')
+CC_FAILED_TO_COLLECT_FINGER = bytes.fromhex('03')
+CC_FAILED_DOWNLOAD_IMAGE = bytes.fromhex('0e')
+CC_DISORDERED_FINGERPRINT = bytes.fromhex('06')
+CC_VERY_SMALL_FINGERPRINT = bytes.fromhex('07')
+CC_INVALID_PRIMARY_IMAGE = bytes.fromhex('15')
+CC_CHAR_MISMATCH = bytes.fromhex('0a')
+CC_TEMPLATE_DWNLD_ERR = bytes.fromhex('0d')
+CC_WRONG_REG_NUM = bytes.fromhex('1a')
+CC_NO_MATCH = bytes.fromhex('09')
+CC_PAGE_ID_INVALID = bytes.fromhex('0b')
+CC_ERROR_FLASH_WRITING = bytes.fromhex('18')
+CC_FAIL_TRANSFER_PACKET = bytes.fromhex('0e')
+CC_FAILED_DELETE = bytes.fromhex('10')
+CC_UNMATCHED_TEMPLATES = bytes.fromhex('08')
+CC_FAILED_TO_OPERATE_PORT = bytes.fromhex('1d')
+CC_NO_MATCHING_FINGERPRINT = bytes.fromhex('09')
+CC_READOUT_TEMPLATE_INVALID = bytes.fromhex('0c')
+CC_FAILED_TO_CLEAR_LIBRARY = bytes.fromhex('11')
+
+# PN = parameter number
+PN_BAUD_RATE = bytes.fromhex('04')
+PN_SECURITY_LEVEL = bytes.fromhex('05')
+PN_PACKAGE_LEN = bytes.fromhex('06')
+
+
+
+CHAR_BUFFER_1 = bytes.fromhex('01')
+CHAR_BUFFER_2 = bytes.fromhex('02')
+KEY_STATUS_REGISTER = 0
+KEY_SYSTEM_IDENTIFIER_CODE = 1
+KEY_FINGER_LIBRARY_SIZE = 2
+KEY_SECURITY_LEVEL = 3
+KEY_DEVICE_ADDRESS = 4
+KEY_DATA_PACKET_SIZE = 5
+KEY_BAUD_SETTINGS = 6
+CAPTURE_TIME_4_5 = bytes.fromhex('20')
+
+IMAGE_WIDTH = 256
+IMAGE_HEIGHT = 288
+# The module sends two 4-bit pixels per byte
+IMAGE_SIZE = IMAGE_WIDTH * IMAGE_HEIGHT // 2
+# Bytes of a character file or template moved through a character buffer
+TEMPLATE_SIZE = 512
+
+# Data packet size in bytes for each package length setting
+PACKET_SIZES = (32, 64, 128, 256)
+
+# Deadline in seconds of an AsyncSensor transfer before the module's data
+# packet size and baud rate are known
+DEFAULT_TRANSFER_TIMEOUT = 30
+
+# Baud rate settings tried by Sensor.negotiate_link, fastest first; the baud
+# rate is the setting times 9600
+LINK_BAUD_SETTINGS = (12, 6, 4, 2, 1)
+# Shortest pause and growth factor of the pause between capture polls in
+# Sensor.wait_for_finger
+FINGER_POLL_MIN_INTERVAL = 0.01
+FINGER_POLL_BACKOFF = 1.5
+# Capture results that just mean there is no usable finger yet
+_NO_FINGER_CCS = (CC_FINGER_NOT_DETECTED, CC_FAILED_TO_COLLECT_FINGER)
+# Character file generation failures fixed by capturing the finger again
+_RECAPTURE_CCS = (CC_DISORDERED_FINGERPRINT, CC_VERY_SMALL_FINGERPRINT,
+                  CC_INVALID_PRIMARY_IMAGE)
+
+# Data written to and read back from a character buffer to test a link
+_LINK_PROBE_PATTERN = bytes(range(256)) * 2
+
+# Idempotent commands are sent again after a framing error or lost packet:
+# retries per command by default, first delay and upper bound of the doubling
+# backoff between attempts, in seconds
+DEFAULT_RETRIES = 2
+RETRY_DELAY = 0.05
+RETRY_MAX_DELAY = 1.0
+# Silence that ends draining the rest of an abandoned reply, and the longest
+# drain, in seconds
+STALE_QUIET = 0.05
+STALE_DRAIN_LIMIT = 10
+# Silence after skipping garbage that means the awaited packet was the
+# garbage, in seconds
+LOST_PACKET_QUIET = 0.5
+
+# Backup file written by Sensor.export_library: the magic followed by one
+# record per template of page id (2 bytes), template length (2 bytes) and
+# the template itself
+LIBRARY_FILE_MAGIC = b'R307LIB\x01'
+
+# Host template store file written by TemplateStore.save: the magic followed
+# by one record per user of user id length (2 bytes), the UTF-8 user id,
+# template length (2 bytes) and the template itself
+TEMPLATE_STORE_MAGIC = b'R307TPL\x01'
+
+# Serial trace file written by TraceRecorder: the magic followed by one
+# record per read or write of direction (1 byte), time in nanoseconds since
+# the epoch (8 bytes), data length (4 bytes) and the data itself
+TRACE_FILE_MAGIC = b'R307TRC\x01'
+
+# Host library index file written by LibraryIndex.save: the magic followed
+# by the library size (2 bytes), 1 when a stamp follows (1 byte), the stamp
+# generation (8 bytes) and token (8 bytes) and the index table
+LIBRARY_INDEX_MAGIC = b'R307IDX\x01'
+
+# Notepad: pages of user data kept in the module's flash
+NOTEPAD_PAGES = 16
+NOTEPAD_PAGE_SIZE = 32
+
+# Notepad page holding the library stamp: the magic followed by the
+# generation (8 bytes), a random token (8 bytes) and zero padding
+LIBRARY_STAMP_PAGE = 15
+LIBRARY_STAMP_MAGIC = b'R307GEN\x01'
+
+# Each index table page holds one occupancy bit for 256 library pages
+INDEX_TABLE_PAGE_SIZE = 256
+
+
+# Largest data packet the module can be configured for (package length 3)
+MAX_DATA_PACKET_SIZE = 256
+# Header (2) + address (4) + pid (1) + length (2)
+FRAME_PREFIX_SIZE = 9
+CHECKSUM_SIZE = 2
+MAX_FRAME_SIZE = FRAME_PREFIX_SIZE + MAX_DATA_PACKET_SIZE + CHECKSUM_SIZE
+DEFAULT_ADDRESS = bytes.fromhex('FFFFFFFF')
+
+# Single byte objects for every pid value so decoding a frame never allocates
+# one
+_PID_BYTES = [bytes((i,)) for i in range(256)]
@@ -0,0 +1,265 @@
+"""
+Read deadlines per command, learned from the latency the module shows.
+"""
+import bisect
+import collections
+import math
+
+from .constants import *
+from .metrics import COMMAND_NAMES
+
+# Deadline in seconds before enough latencies have been seen, for commands
+# that legitimately take longer than the default
+DEFAULT_COMMAND_TIMEOUTS = {
+    IC_SEARCH: 5,
+    IC_FINGERPRINT_VERIFICATION: 10,
+    IC_AUTO_FINGERPRINT_VERIFICATION: 10,
+    IC_EMPTY_FINGERPRINT_LIBRARY: 5,
+}
+
+# Commands that wait on a finger: how long they take depends on the user,
+# not the link, so they keep their default deadline
+_CAPTURE_COMMANDS = frozenset((IC_GENERATE_IMAGE, IC_FINGERPRINT_VERIFICATION,
+                               IC_AUTO_FINGERPRINT_VERIFICATION))
+
+
+def _scaled(seconds, seen, size):
+    # A command covering more pages than one that took seconds over seen
+    # pages takes at most that much longer in proportion
+    if size is None or not seen or seen >= size:
+        return seconds
+    return seconds * size / seen
+
+
+class _Latencies:
+    """
+    The last ``window`` latencies of one wait with the pages each covered,
+    in order, and the latencies sorted
+    """
+
+    __slots__ = ('recent', 'ordered')
+
+    def __init__(self):
+        self.recent = collections.deque()
+        self.ordered = []
+
+    def __len__(self):
+        return len(self.ordered)
+
+    def add(self, seconds, window, size=None):
+        if len(self.recent) >= window:
+            oldest = self.recent.popleft()[0]
+            del self.ordered[bisect.bisect_left(self.ordered, oldest)]
+        self.recent.append((seconds, size))
+        bisect.insort(self.ordered, seconds)
+
+    def quantile(self, q, size=None):
+        ordered = self.ordered
+        if size is not None:
+            ordered = sorted(_scaled(seconds, seen, size)
+                             for seconds, seen in self.recent)
+        return ordered[min(max(int(math.ceil(q * len(ordered))) - 1, 0),
+                           len(ordered) - 1)]
+
+
+class CommandDeadlines:
+    """
+    How long Sensor waits for each command's acknowledgement and for each
+    data packet of a transfer.
+
+    Once ``min_samples`` latencies of a command have been seen, its deadline
+    is ``multiplier`` times their ``quantile`` over the last ``window``
+    exchanges, kept within ``minimum`` and ``maximum``. Until then it is the
+    command's DEFAULT_COMMAND_TIMEOUTS entry or ``default``. Data packets
+    follow the same rule on the gap before each packet, starting from
+    ``frame_default``. A deadline pinned with ``pin`` is used as is.
+
+    Commands that cover a range of pages, like a search, are given their
+    page count: each latency seen on fewer pages is scaled up to the pages
+    asked for, so fast searches of a few pages don't cut short a search of
+    the whole library. Commands that wait on a finger always use their
+    default. A deadline that expires is doubled, within ``maximum``, until
+    the command next succeeds, and the expired deadline is kept as one of
+    its latencies, so repeated timeouts raise the learned deadline.
+    """
+
+    def __init__(self, default=3, frame_default=1, multiplier=3,
+                 quantile=0.99, minimum=0.1, maximum=None, window=256,
+                 min_samples=16):
+        """
+        :param default: seconds to wait for an acknowledgement before any
+        latency is known
+        :param frame_default: seconds to wait for a data packet before any
+        gap is known
+        :param multiplier: factor applied to the observed quantile, None to
+        never learn
+        :param quantile: fraction of the observed latencies a deadline must
+        cover before the multiplier is applied
+        :param minimum: shortest learned deadline in seconds
+        :param maximum: longest learned deadline in seconds, None for no
+        bound
+        :param window: latencies kept per command
+        :param min_samples: latencies needed before a deadline is learned
+        """
+        self.default = default
+        self.frame_default = frame_default
+        self.multiplier = multiplier
+        self.quantile = quantile
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = window
+        self.min_samples = min_samples
+        self._commands = {}
+        self._frames = {}
+        self._pinned = {}
+        # Deadline and pages it was for, per command and per command's data
+        # packets, set by the last expiry until the wait next succeeds
+        self._widened = {}
+        self._frames_widened = {}
+
+    def __learned(self, latencies, default, size=None):
+        if self.multiplier is None or latencies is None or \
+                len(latencies) < self.min_samples:
+            return default
+
+        timeout = max(latencies.quantile(self.quantile, size) *
+                      self.multiplier, self.minimum)
+        if self.maximum is not None:
+            timeout = min(timeout, self.maximum)
+        return timeout
+
+    @staticmethod
+    def __widen(timeout, widened, size=None):
+        if widened is None:
+            return timeout
+        return max(timeout, _scaled(widened[0], widened[1], size))
+
+    def __expire(self, widened, key, seconds, size):
+        seconds *= 2
+        if self.maximum is not None:
+            seconds = min(seconds, self.maximum)
+        widened[key] = (seconds, size)
+
+    def __add(self, latencies, key, seconds, size=None):
+        samples = latencies.get(key)
+        if samples is None:
+            samples = latencies[key] = _Latencies()
+        samples.add(seconds, self.window, size)
+
+    def timeout(self, command, size=None):
+        """
+        :param command: instruction code
+        :param size: pages the command covers, None when it has no range
+        :return, float: seconds to wait for the command's acknowledgement
+        """
+        pinned = self._pinned.get(command)
+        if pinned is not None and pinned[0] is not None:
+            return pinned[0]
+
+        default = DEFAULT_COMMAND_TIMEOUTS.get(command, self.default)
+        if command in _CAPTURE_COMMANDS:
+            return default
+        return self.__widen(
+            self.__learned(self._commands.get(command), default, size),
+            self._widened.get(command), size)
+
+    def frame_timeout(self, command):
+        """
+        :param command: instruction code of a command with a data phase
+        :return, float: seconds to wait for each data packet
+        """
+        pinned = self._pinned.get(command)
+        if pinned is not None and pinned[1] is not None:
+            return pinned[1]
+        return self.__widen(
+            self.__learned(self._frames.get(command), self.frame_default),
+            self._frames_widened.get(command))
+
+    def observe(self, command, seconds, size=None):
+        """
+        Record the time from sending a command to its acknowledgement.
+
+        :param size: pages the command covered, None when it has no range
+        :return:
+        """
+        self.__add(self._commands, command, seconds, size)
+        widened = self._widened.get(command)
+        if widened is not None and (size is None or widened[1] is None or
+                                    size >= widened[1]):
+            del self._widened[command]
+
+    def observe_frame(self, command, seconds):
+        """
+        Record the wait for one data packet of a command's transfer.
+
+        :return:
+        """
+        self.__add(self._frames, command, seconds)
+        self._frames_widened.pop(command, None)
+
+    def expired(self, command, seconds, size=None):
+        """
+        Record that a command's acknowledgement did not arrive within its
+        deadline.
+
+        :param seconds: the deadline that expired
+        :param size: pages the command covered, None when it has no range
+        :return:
+        """
+        self.__add(self._commands, command, seconds, size)
+        self.__expire(self._widened, command, seconds, size)
+
+    def frame_expired(self, command, seconds):
+        """
+        Record that a data packet of a command's transfer did not arrive
+        within its deadline.
+
+        :param seconds: the deadline that expired
+        :return:
+        """
+        self.__add(self._frames, command, seconds)
+        self.__expire(self._frames_widened, command, seconds, None)
+
+    def pin(self, command, timeout=None, frame_timeout=None):
+        """
+        Use fixed deadlines for a command; pin(command) returns it to the
+        learned ones.
+
+        :param command: instruction code
+        :param timeout: seconds for the acknowledgement, None to learn it
+        :param frame_timeout: seconds for each data packet, None to learn it
+        :return:
+        """
+        if timeout is None and frame_timeout is None:
+            self._pinned.pop(command, None)
+        else:
+            self._pinned[command] = (timeout, frame_timeout)
+
+    def reset(self):
+        """
+        Forget the observed latencies, as after a change of baud rate or
+        packet size. Pinned deadlines are kept.
+
+        :return:
+        """
+        self._commands.clear()
+        self._frames.clear()
+        self._widened.clear()
+        self._frames_widened.clear()
+
+    def snapshot(self):
+        """
+        :return, dict: per command name, the current deadlines and the number
+        of latencies they are learned from
+        """
+        commands = set(self._commands) | set(self._frames) | \
+            set(self._pinned)
+        return {
+            COMMAND_NAMES.get(command, command.hex()): {
+                'timeout': self.timeout(command),
+                'frame_timeout': self.frame_timeout(command),
+                'samples': len(self._commands[command])
+                if command in self._commands else 0,
+            }
+            for command in commands
+        }
@@ -0,0 +1,62 @@
+"""
+Confirmation code statuses and the exceptions raised by the sensors.
+"""
+import enum
+
+
+class Status(enum.IntEnum):
+    """Confirmation codes the module answers commands with"""
+    SUCCESS = 0x00
+    PACKET_ERROR = 0x01
+    NO_FINGER = 0x02
+    CAPTURE_FAILED = 0x03
+    DISORDERED = 0x06
+    TOO_SMALL = 0x07
+    NOT_MATCHING = 0x08
+    NO_MATCH = 0x09
+    CHAR_MISMATCH = 0x0a
+    PAGE_ID_INVALID = 0x0b
+    TEMPLATE_INVALID = 0x0c
+    UPLOAD_FAILED = 0x0d
+    TRANSFER_FAILED = 0x0e
+    DELETE_FAILED = 0x10
+    CLEAR_FAILED = 0x11
+    WRONG_PASSWORD = 0x13
+    INVALID_IMAGE = 0x15
+    FLASH_WRITE_FAILED = 0x18
+    WRONG_REGISTER = 0x1a
+    PORT_FAILED = 0x1d
+
+
+# Status of each confirmation code byte
+_STATUSES = {bytes((status,)): status for status in Status}
+
+
+class SensorError(Exception):
+    """Base class of the errors raised by this module"""
+
+
+class ProtocolError(SensorError):
+    """
+    A packet was malformed, unexpected or did not arrive.
+
+    ``kind`` names the fault for metrics: 'header', 'address', 'length',
+    'checksum', 'timeout', 'lost', 'overflow', 'unexpected' or 'link'.
+    """
+
+    def __init__(self, message, kind=None):
+        super().__init__(message)
+        self.kind = kind
+
+
+class CommandError(SensorError):
+    """
+    The module answered a command with a failure confirmation code.
+
+    ``status`` is the Status, or the int code when it is not a known one.
+    """
+
+    def __init__(self, message, command=None, status=None):
+        super().__init__(message)
+        self.command = command
+        self.status = status
@@ -0,0 +1,89 @@
+"""
+Conversion of the module's packed 4-bit fingerprint images. PIL and numpy
+are only imported by the function that needs them.
+"""
+from .constants import IMAGE_HEIGHT, IMAGE_SIZE, IMAGE_WIDTH
+
+
+_HIGH_NIBBLE = bytes((b >> 4) * 17 for b in range(256))
+_LOW_NIBBLE = bytes((b & 0x0F) * 17 for b in range(256))
+
+
+def unpack_image(packed):
+    """
+    Expand a packed image (two 4-bit pixels per byte, first pixel in the high
+    nibble) to one 8-bit pixel per byte, row by row.
+
+    :param packed, bytes-like:
+    :return, bytearray: IMAGE_WIDTH * IMAGE_HEIGHT pixels for a full image
+    """
+    packed = bytes(packed)
+    pixels = bytearray(len(packed) * 2)
+    # Both nibble lookups and the interleave run as whole-buffer operations
+    pixels[0::2] = packed.translate(_HIGH_NIBBLE)
+    pixels[1::2] = packed.translate(_LOW_NIBBLE)
+    return pixels
+
+
+def image_to_pil(packed):
+    """
+    :param packed, bytes-like: image as returned by Sensor.download_image
+    :return: 8-bit greyscale PIL Image
+    """
+    from PIL import Image
+
+    return Image.frombytes('L', (IMAGE_WIDTH, IMAGE_HEIGHT),
+                           bytes(unpack_image(packed)))
+
+
+def image_to_array(packed):
+    """
+    :param packed, bytes-like: image as returned by Sensor.download_image
+    :return: numpy uint8 array of shape (IMAGE_HEIGHT, IMAGE_WIDTH)
+    """
+    import numpy
+
+    return numpy.frombuffer(unpack_image(packed), dtype=numpy.uint8) \
+        .reshape(IMAGE_HEIGHT, IMAGE_WIDTH)
+
+
+def _image_view(dest):
+    """
+    Check a buffer can hold a whole image before the download is started.
+
+    :param dest: writable buffer of at least IMAGE_SIZE bytes
+    :return, memoryview: the bytes of dest
+    """
+    view = memoryview(dest).cast('B')
+    if view.readonly:
+        raise TypeError("Destination buffer is read-only")
+    if len(view) < IMAGE_SIZE:
+        raise ValueError("Destination buffer holds %d bytes, an image %d" %
+                         (len(view), IMAGE_SIZE))
+    return view
+
+
+def _fill_image(dest, packets):
+    """
+    Copy the packets of an image download into a buffer or file object.
+
+    :param dest: writable buffer or object with write
+    :param packets: iterable of bytes-like
+    :return, int: number of bytes received
+    """
+    received = 0
+    if hasattr(dest, 'write'):
+        for content in packets:
+            dest.write(content)
+            received += len(content)
+        return received
+
+    view = memoryview(dest).cast('B')
+    for content in packets:
+        end = received + len(content)
+        if end > len(view):
+            raise ValueError("Image larger than the destination buffer")
+        view[received:end] = content
+        received = end
+
+    return received
@@ -0,0 +1,650 @@
+"""
+Host side views of the fingerprint library: library files, the index table,
+the library stamp and the template store.
+"""
+import collections
+import logging
+import os
+
+from .constants import INDEX_TABLE_PAGE_SIZE, LIBRARY_FILE_MAGIC, \
+    LIBRARY_INDEX_MAGIC, LIBRARY_STAMP_MAGIC, LIBRARY_STAMP_PAGE, \
+    NOTEPAD_PAGE_SIZE, TEMPLATE_STORE_MAGIC
+from .errors import CommandError
+
+logger = logging.getLogger(__name__)
+
+# Library stamp kept in a notepad page: generation counts the changes made
+# through stamping sensors, token is drawn anew for every change so stamps
+# of different modules or of a rolled back notepad never compare equal
+LibraryStamp = collections.namedtuple('LibraryStamp', 'generation token')
+
+# Summary of a batch of library commands: the number of pages asked for,
+# the number of commands sent, those reading and writing the library stamp
+# included, and (page_id, n, status) for every command the module refused
+BatchResult = collections.namedtuple('BatchResult', 'pages commands failed')
+
+
+def read_library_file(file):
+    """
+    Parse a backup file written by Sensor.export_library.
+
+    :param file: binary file object
+    :return: list of (page_id, template)
+    """
+    data = memoryview(file.read())
+    if data[:len(LIBRARY_FILE_MAGIC)] != LIBRARY_FILE_MAGIC:
+        raise ValueError("Not a template library file")
+
+    records = []
+    offset = len(LIBRARY_FILE_MAGIC)
+    while offset < len(data):
+        if offset + 4 > len(data):
+            raise ValueError("Truncated template library file")
+        page_id = int.from_bytes(data[offset:offset + 2], byteorder='big')
+        length = int.from_bytes(data[offset + 2:offset + 4], byteorder='big')
+        offset += 4
+        if offset + length > len(data):
+            raise ValueError("Truncated template library file")
+        records.append((page_id, data[offset:offset + length]))
+        offset += length
+
+    return records
+
+
+def _pack_library_stamp(stamp):
+    """
+    :param stamp, LibraryStamp:
+    :return, bytes: notepad page content
+    """
+    return (LIBRARY_STAMP_MAGIC +
+            stamp.generation.to_bytes(8, byteorder='big') +
+            stamp.token).ljust(NOTEPAD_PAGE_SIZE, b'\x00')
+
+
+def _parse_library_stamp(page):
+    """
+    :param page, bytes-like: notepad page content
+    :return, LibraryStamp: None when the page holds no stamp
+    """
+    page = bytes(page)
+    if not page.startswith(LIBRARY_STAMP_MAGIC):
+        return None
+
+    offset = len(LIBRARY_STAMP_MAGIC)
+    return LibraryStamp(
+        int.from_bytes(page[offset:offset + 8], byteorder='big'),
+        page[offset + 8:offset + 16])
+
+
+def _next_library_stamp(stamp):
+    """
+    :param stamp, LibraryStamp: current stamp, None when there is none
+    :return, LibraryStamp: the stamp to write before a change
+    """
+    generation = 0 if stamp is None else stamp.generation + 1
+    return LibraryStamp(generation % (1 << 64), os.urandom(8))
+
+
+def _page_ranges(page_ids):
+    """
+    Coalesce pages into runs of adjacent pages for range commands. Every
+    page asked for is covered and no other: the host's view of which pages
+    are free may be stale, so it is not used to skip or bridge pages.
+
+    :param page_ids: iterable of int
+    :return: list of (page_id, n), in page order
+    """
+    ranges = []
+    for page_id in sorted(set(page_ids)):
+        if ranges:
+            first, n = ranges[-1]
+            if page_id == first + n:
+                ranges[-1] = (first, n + 1)
+                continue
+        ranges.append((page_id, 1))
+
+    return ranges
+
+
+# _INDEX_BITS[j] maps an index table byte to bit j of it
+_INDEX_BITS = [bytes((b >> j) & 1 for b in range(256)) for j in range(8)]
+
+
+class LibraryIndex:
+    """
+    Host-side copy of which pages of the module's template library are
+    occupied, so occupancy questions don't need a command to the module.
+
+    Load it with Sensor.load_library_index; the sensor then keeps it up to
+    date through store_template, delete_template and
+    empty_fingerprint_library. ``stamp`` is the module's library stamp the
+    index matches, None when unknown or the sensor was made without
+    stamp_library; an index saved with its stamp can be handed back to
+    load_library_index after a restart and is reused when the library has
+    not changed since.
+    """
+
+    def __init__(self, library_size, stamp=None):
+        # One byte per page, 1 when the page holds a template
+        self._used = bytearray(library_size)
+        self._count = 0
+        # Every page below this one is known to be in use
+        self._first_free = 0
+        self.stamp = stamp
+
+    @classmethod
+    def from_index_table(cls, library_size, table):
+        """
+        :param library_size, int:
+        :param table, bytes-like: concatenated index table pages, bit j of
+        byte i set when page i * 8 + j is in use
+        :return, LibraryIndex:
+        """
+        index = cls(library_size)
+        index.load_index_table(table)
+        return index
+
+    def load_index_table(self, table):
+        """
+        Replace the whole index with an index table read from the module.
+        Pages beyond the table are free, bits beyond the library ignored.
+
+        :param table, bytes-like: index table pages as for from_index_table
+        :return:
+        """
+        table = bytes(table)
+        used = bytearray(len(table) * 8)
+        for j in range(8):
+            used[j::8] = table.translate(_INDEX_BITS[j])
+
+        size = len(self._used)
+        self._used[:] = used[:size].ljust(size, b'\x00')
+        self._count = self._used.count(1)
+        self._first_free = 0
+
+    def to_index_table(self):
+        """
+        :return, bytes: the index in the layout read by from_index_table
+        """
+        table = bytearray(-(-len(self._used) // 8))
+        for page_id in self.used_pages():
+            table[page_id >> 3] |= 1 << (page_id & 7)
+        return bytes(table)
+
+    @property
+    def size(self):
+        """Number of pages in the library"""
+        return len(self._used)
+
+    @property
+    def count(self):
+        """Number of stored templates"""
+        return self._count
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, page_id):
+        return self.is_used(page_id)
+
+    def is_used(self, page_id):
+        """
+        :param page_id, int:
+        :return, bool:
+        """
+        return 0 <= page_id < len(self._used) and self._used[page_id] == 1
+
+    def next_free(self):
+        """
+        :return, int: lowest free page, or None when the library is full
+        """
+        page_id = self._used.find(0, self._first_free)
+        if page_id < 0:
+            self._first_free = len(self._used)
+            return None
+
+        self._first_free = page_id
+        return page_id
+
+    def next_used(self, page_id=0):
+        """
+        :param page_id, int: first page to look at
+        :return, int: lowest occupied page from page_id on, or None
+        """
+        page_id = self._used.find(1, page_id)
+        return None if page_id < 0 else page_id
+
+    def used_pages(self):
+        """
+        :return: generator of the occupied page ids in ascending order
+        """
+        page_id = self.next_used()
+        while page_id is not None:
+            yield page_id
+            page_id = self.next_used(page_id + 1)
+
+    def mark_used(self, page_id):
+        """
+        :param page_id, int:
+        :return:
+        """
+        if not self._used[page_id]:
+            self._used[page_id] = 1
+            self._count += 1
+
+    def mark_free(self, page_id, n=1):
+        """
+        :param page_id, int: first page
+        :param n, int: number of pages
+        :return:
+        """
+        pages = self._used[page_id:page_id + n]
+        self._count -= pages.count(1)
+        self._used[page_id:page_id + n] = bytes(len(pages))
+        self._first_free = min(self._first_free, page_id)
+
+    def clear(self):
+        """
+        :return:
+        """
+        self._used[:] = bytes(len(self._used))
+        self._count = 0
+        self._first_free = 0
+
+    @classmethod
+    def load(cls, file):
+        """
+        :param file: path or binary file object written by save
+        :return, LibraryIndex:
+        """
+        if not hasattr(file, 'read'):
+            with open(file, 'rb') as file:
+                return cls.load(file)
+
+        data = file.read()
+        if data[:len(LIBRARY_INDEX_MAGIC)] != LIBRARY_INDEX_MAGIC:
+            raise ValueError("Not a library index file")
+
+        offset = len(LIBRARY_INDEX_MAGIC)
+        if len(data) < offset + 19:
+            raise ValueError("Truncated library index file")
+        library_size = int.from_bytes(data[offset:offset + 2],
+                                      byteorder='big')
+        table = data[offset + 19:]
+        if len(table) < -(-library_size // 8):
+            raise ValueError("Truncated library index file")
+
+        index = cls.from_index_table(library_size, table)
+        if data[offset + 2]:
+            index.stamp = LibraryStamp(
+                int.from_bytes(data[offset + 3:offset + 11],
+                               byteorder='big'),
+                data[offset + 11:offset + 19])
+        return index
+
+    def save(self, file):
+        """
+        Write the index and its stamp to a file. A path is replaced
+        atomically so a crash never leaves a half written index behind.
+
+        :param file: path or binary file object
+        :return:
+        """
+        if not hasattr(file, 'write'):
+            temporary = os.fspath(file) + '.tmp'
+            with open(temporary, 'wb') as out:
+                self.save(out)
+            os.replace(temporary, file)
+            return
+
+        stamp = self.stamp
+        file.write(LIBRARY_INDEX_MAGIC)
+        file.write(self.size.to_bytes(2, byteorder='big'))
+        if stamp is None:
+            file.write(bytes(17))
+        else:
+            file.write(b'\x01')
+            file.write(stamp.generation.to_bytes(8, byteorder='big'))
+            file.write(stamp.token)
+        file.write(self.to_index_table())
+
+
+class _LibraryKeeper:
+    """
+    The library index and stamp a front end keeps for one module, and the
+    library operations Sensor and AsyncSensor share.
+
+    An operation that needs the module is a generator of steps: it yields
+    (method name, *args) for each command, the front end calls that method
+    of its own and sends back the result, or throws in the SensorError it
+    raised, and the generator returns the operation's result.
+    """
+
+    def __init__(self, stamp_library=False):
+        self.index = None
+        # Library stamp last read or written, None when not known; set while
+        # a change that has stamped the library runs
+        self.stamp = None
+        self.stamped = False
+        self.stamp_library = stamp_library
+
+    def current_stamp(self):
+        """
+        :return, LibraryStamp: the module's library stamp, None when it has
+        none or stamping is off
+        """
+        if not self.stamp_library:
+            return None
+
+        if self.stamp is None:
+            page = yield 'read_notepad', LIBRARY_STAMP_PAGE, None
+            self.stamp = _parse_library_stamp(page)
+            if self.stamp is None and any(page):
+                logger.warning("Notepad page %d holds other data, not "
+                               "stamping the library", LIBRARY_STAMP_PAGE)
+                self.stamp_library = False
+        return self.stamp
+
+    def read_stamp(self):
+        """
+        :return, LibraryStamp: the stamp in notepad page LIBRARY_STAMP_PAGE,
+        None when the page holds none
+        """
+        page = yield 'read_notepad', LIBRARY_STAMP_PAGE, None
+        self.stamp = _parse_library_stamp(page)
+        return self.stamp
+
+    def write_stamp(self, current):
+        """
+        :param current, LibraryStamp: stamp on the module, None for none
+        :return, LibraryStamp: the stamp written
+        """
+        stamp = _next_library_stamp(current)
+        yield 'write_notepad', LIBRARY_STAMP_PAGE, _pack_library_stamp(stamp)
+        self.stamp = stamp
+        return stamp
+
+    def stamp_change(self):
+        """
+        Renew the library stamp ahead of a change to the library, so a crash
+        halfway leaves a stamp no saved index matches.
+
+        :return, int: number of commands sent
+        """
+        if self.stamped or not self.stamp_library:
+            return 0
+
+        sent = 1 if self.stamp is None else 0
+        current = yield from self.current_stamp()
+        if not self.stamp_library:
+            return sent
+
+        stamp = yield from self.write_stamp(current)
+        if self.index is not None:
+            # The index follows the change and stays current
+            self.index.stamp = stamp if self.index.stamp == current else None
+        return sent + 1
+
+    def change(self, steps):
+        """
+        Run the steps of a batch of changes with the library stamped once
+        ahead of them.
+
+        :return: the number of commands sent to stamp the library, and the
+        result of steps
+        """
+        if self.stamped:
+            return 0, (yield from steps)
+
+        sent = yield from self.stamp_change()
+        self.stamped = True
+        try:
+            return sent, (yield from steps)
+        finally:
+            self.stamped = False
+
+    def current_index(self):
+        """
+        :return, LibraryIndex: the index when the stamp on the module shows
+        it is still current, None when there is no index or it may be stale
+        """
+        index = self.index
+        if index is None or index.stamp is None:
+            return None
+
+        stamp = yield from self.read_stamp()
+        return index if stamp == index.stamp else None
+
+    def notepad_written(self, page):
+        """
+        Forget the stamp when its notepad page is written over.
+
+        :return:
+        """
+        if page == LIBRARY_STAMP_PAGE:
+            self.stamp = None
+
+    def stored(self, page_id):
+        if self.index is not None:
+            self.index.mark_used(page_id)
+
+    def deleted(self, page_id, n):
+        if self.index is not None:
+            self.index.mark_free(page_id, n)
+
+    def emptied(self):
+        if self.index is not None:
+            self.index.clear()
+
+    def load_index(self, cached=None, profile=None):
+        """
+        :param cached: LibraryIndex saved earlier, see
+        Sensor.load_library_index
+        :param profile: DeviceProfile of the module, None to read it
+        :return, LibraryIndex:
+        """
+        # Read afresh: the module may have been changed by another host
+        self.stamp = None
+        stamp = yield from self.current_stamp()
+        if stamp is not None and cached is not None and \
+                cached.stamp == stamp:
+            self.index = cached
+            return cached
+        if stamp is None and self.stamp_library:
+            stamp = yield from self.write_stamp(None)
+
+        if profile is None:
+            profile = yield ('read_profile',)
+        library_size = profile.library_size
+
+        table = bytearray()
+        for index_page in range(-(-library_size // INDEX_TABLE_PAGE_SIZE)):
+            table += yield 'read_index_table', index_page
+
+        index = LibraryIndex.from_index_table(library_size, table)
+        index.stamp = stamp
+        self.index = index
+        return index
+
+    def delete_templates(self, page_ids):
+        """
+        :param page_ids: iterable of int
+        :return, BatchResult:
+        """
+        page_ids = set(page_ids)
+        ranges = _page_ranges(page_ids)
+        if not ranges:
+            return BatchResult(0, 0, ())
+
+        def deletes():
+            failed = []
+            for page_id, n in ranges:
+                try:
+                    yield 'delete_template', page_id, n
+                except CommandError as error:
+                    failed.append((page_id, n, error.status))
+            return tuple(failed)
+
+        sent, failed = yield from self.change(deletes())
+        return BatchResult(len(page_ids), sent + len(ranges), failed)
+
+    def store_templates(self, templates, buffer_id):
+        """
+        :param templates: mapping or iterable of (page_id, template)
+        :param buffer_id: character buffer used for the transfer
+        :return, BatchResult:
+        """
+        templates = sorted(dict(templates).items())
+        if not templates:
+            return BatchResult(0, 0, ())
+
+        def stores():
+            sent = 0
+            failed = []
+            for page_id, template in templates:
+                try:
+                    sent += 1
+                    yield 'upload_char_buffer', buffer_id, template
+                    sent += 1
+                    yield 'store_template', buffer_id, page_id
+                except CommandError as error:
+                    failed.append((page_id, 1, error.status))
+            return sent, tuple(failed)
+
+        stamping, (sent, failed) = yield from self.change(stores())
+        return BatchResult(len(templates), stamping + sent, failed)
+
+    def read_templates(self, page_ids, buffer_id):
+        """
+        :param page_ids: iterable of int
+        :param buffer_id: character buffer used for the transfer
+        :return, dict: template bytes by page_id, without the pages the
+        module could not read
+        """
+        index = yield from self.current_index()
+        templates = {}
+        for page_id in sorted(set(page_ids)):
+            if index is not None and not index.is_used(page_id):
+                continue
+            try:
+                yield 'read_template', buffer_id, page_id
+            except CommandError:
+                continue
+            templates[page_id] = yield 'download_char_buffer', buffer_id
+
+        return templates
+
+
+class TemplateStore:
+    """
+    Host-side store of the templates of every enrolled user, for populations
+    larger than the module's library. Users are identified by str ids and
+    kept in insertion order.
+    """
+
+    def __init__(self, templates=()):
+        """
+        :param templates: optional mapping or iterable of (user, template)
+        """
+        self._templates = collections.OrderedDict()
+        for user, template in dict(templates).items():
+            self.add(user, template)
+
+    def __len__(self):
+        return len(self._templates)
+
+    def __contains__(self, user):
+        return user in self._templates
+
+    def __iter__(self):
+        return iter(self._templates)
+
+    def get(self, user):
+        """
+        :param user, str:
+        :return, bytes: the user's template, or None when not stored
+        """
+        return self._templates.get(user)
+
+    def items(self):
+        """
+        :return: view of (user, template)
+        """
+        return self._templates.items()
+
+    def add(self, user, template):
+        """
+        Store or replace the template of a user.
+
+        :param user, str:
+        :param template, bytes-like: as returned by
+        Sensor.download_char_buffer
+        :return:
+        """
+        self._templates[user] = bytes(template)
+
+    def remove(self, user):
+        """
+        :param user, str:
+        :return:
+        """
+        del self._templates[user]
+
+    @classmethod
+    def load(cls, file):
+        """
+        :param file: path or binary file object written by save
+        :return, TemplateStore:
+        """
+        if not hasattr(file, 'read'):
+            with open(file, 'rb') as file:
+                return cls.load(file)
+
+        data = memoryview(file.read())
+        if data[:len(TEMPLATE_STORE_MAGIC)] != TEMPLATE_STORE_MAGIC:
+            raise ValueError("Not a template store file")
+
+        store = cls()
+        offset = len(TEMPLATE_STORE_MAGIC)
+        while offset < len(data):
+            fields = []
+            for _ in range(2):
+                if offset + 2 > len(data):
+                    raise ValueError("Truncated template store file")
+                length = int.from_bytes(data[offset:offset + 2],
+                                        byteorder='big')
+                offset += 2
+                if offset + length > len(data):
+                    raise ValueError("Truncated template store file")
+                fields.append(data[offset:offset + length])
+                offset += length
+
+            user, template = fields
+            store.add(str(user, 'UTF-8'), template)
+
+        return store
+
+    def save(self, file):
+        """
+        Write every template to a file. A path is replaced atomically so a
+        crash never leaves a half written store behind.
+
+        :param file: path or binary file object
+        :return, int: number of templates written
+        """
+        if not hasattr(file, 'write'):
+            temporary = os.fspath(file) + '.tmp'
+            with open(temporary, 'wb') as out:
+                count = self.save(out)
+            os.replace(temporary, file)
+            return count
+
+        file.write(TEMPLATE_STORE_MAGIC)
+        for user, template in self._templates.items():
+            user = user.encode('UTF-8')
+            file.write(len(user).to_bytes(2, byteorder='big'))
+            file.write(user)
+            file.write(len(template).to_bytes(2, byteorder='big'))
+            file.write(template)
+
+        return len(self._templates)
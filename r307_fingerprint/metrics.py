@@ -0,0 +1,209 @@
+"""
+Instrumentation hooks and the Metrics collector with its Prometheus text
+export.
+"""
+import bisect
+import collections
+
+from . import constants
+from .errors import _STATUSES
+
+
+# Name of every instruction code, for metrics and logs
+COMMAND_NAMES = {value: name[3:].lower()
+                 for name, value in vars(constants).items()
+                 if name.startswith('IC_')}
+
+# Upper bounds in seconds of the command latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+
+class Instrumentation:
+    """
+    Hooks a Sensor or AsyncSensor calls while talking to the module when it
+    is set as the sensor's ``instrumentation``. Every hook does nothing here;
+    override the ones needed. Sensors without instrumentation skip the hooks
+    entirely.
+    """
+
+    def command(self, command, cc, seconds):
+        """
+        A command was acknowledged.
+
+        :param command, bytes: instruction code
+        :param cc, bytes: confirmation code
+        :param seconds: time from sending the command to its acknowledgement
+        """
+
+    def frame_sent(self, pid, size):
+        """
+        :param pid, bytes:
+        :param size, int: bytes on the wire, header to checksum
+        """
+
+    def frame_received(self, pid, size):
+        """
+        :param pid, bytes:
+        :param size, int: bytes on the wire, header to checksum
+        """
+
+    def fault(self, kind):
+        """
+        A packet could not be received.
+
+        :param kind, str: ProtocolError.kind, 'closed' when the connection
+        went away or 'deadline' when an AsyncSensor command timed out
+        """
+
+
+class Metrics(Instrumentation):
+    """
+    Instrumentation that counts frames, bytes, faults and confirmation codes
+    and keeps a latency histogram per command.
+
+    Usage::
+
+        sensor.instrumentation = Metrics(labels={'sensor': 'gate-1'})
+        ...
+        print(sensor.instrumentation.prometheus())
+    """
+
+    def __init__(self, labels=None, buckets=LATENCY_BUCKETS):
+        """
+        :param labels: optional dict of labels added to every exported
+        sample, e.g. which sensor this is
+        :param buckets: ascending upper bounds of the latency buckets in
+        seconds
+        """
+        self.labels = dict(labels or {})
+        self.buckets = tuple(buckets)
+        # Per command: count of each bucket plus one for larger values,
+        # and the total seconds
+        self._latency = {}
+        self._latency_sum = collections.Counter()
+        self.codes = collections.Counter()
+        self.frames = collections.Counter()
+        self.bytes = collections.Counter()
+        self.faults = collections.Counter()
+
+    def command(self, command, cc, seconds):
+        name = COMMAND_NAMES.get(command) or command.hex()
+        counts = self._latency.get(name)
+        if counts is None:
+            counts = self._latency[name] = [0] * (len(self.buckets) + 1)
+        counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self._latency_sum[name] += seconds
+
+        status = _STATUSES.get(cc)
+        self.codes[name, status.name.lower() if status is not None
+                   else cc.hex()] += 1
+
+    def frame_sent(self, pid, size):
+        self.frames['sent'] += 1
+        self.bytes['sent'] += size
+
+    def frame_received(self, pid, size):
+        self.frames['received'] += 1
+        self.bytes['received'] += size
+
+    def fault(self, kind):
+        self.faults[kind or 'other'] += 1
+
+    def reset(self):
+        """
+        :return:
+        """
+        self.__init__(self.labels, self.buckets)
+
+    def snapshot(self):
+        """
+        :return, dict: plain copy of every metric; latency bucket counts
+        are per bucket, not cumulative
+        """
+        return {
+            'labels': dict(self.labels),
+            'latency': {
+                name: {
+                    'count': sum(counts),
+                    'sum_s': self._latency_sum[name],
+                    'buckets': dict(zip(self.buckets + (float('inf'),),
+                                        counts)),
+                }
+                for name, counts in self._latency.items()
+            },
+            'codes': {'%s:%s' % key: count
+                      for key, count in self.codes.items()},
+            'frames': dict(self.frames),
+            'bytes': dict(self.bytes),
+            'faults': dict(self.faults),
+        }
+
+    def samples(self):
+        """
+        :return: generator of (family, type, name, labels, value) for the
+        Prometheus text format
+        """
+        labels = self.labels
+        for name, counts in self._latency.items():
+            command = dict(labels, command=name)
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                total += count
+                yield ('r307_command_seconds', 'histogram',
+                       'r307_command_seconds_bucket',
+                       dict(command, le='+Inf' if bound == float('inf')
+                            else repr(bound)), total)
+            yield ('r307_command_seconds', 'histogram',
+                   'r307_command_seconds_sum', command,
+                   self._latency_sum[name])
+            yield ('r307_command_seconds', 'histogram',
+                   'r307_command_seconds_count', command, total)
+
+        for (name, status), count in self.codes.items():
+            yield ('r307_confirmation_codes_total', 'counter',
+                   'r307_confirmation_codes_total',
+                   dict(labels, command=name, status=status), count)
+        for direction, count in self.frames.items():
+            yield ('r307_frames_total', 'counter', 'r307_frames_total',
+                   dict(labels, direction=direction), count)
+        for direction, count in self.bytes.items():
+            yield ('r307_bytes_total', 'counter', 'r307_bytes_total',
+                   dict(labels, direction=direction), count)
+        for kind, count in self.faults.items():
+            yield ('r307_faults_total', 'counter', 'r307_faults_total',
+                   dict(labels, kind=kind), count)
+
+    def prometheus(self):
+        """
+        :return, str: the metrics in the Prometheus text exposition format
+        """
+        return prometheus_text([self])
+
+
+def prometheus_text(metrics):
+    """
+    Render several Metrics, e.g. one per sensor told apart by their labels,
+    as one Prometheus text exposition.
+
+    :param metrics: iterable of Metrics
+    :return, str:
+    """
+    families = collections.OrderedDict()
+    for source in metrics:
+        for family, kind, name, labels, value in source.samples():
+            families.setdefault((family, kind), []).append(
+                (name, labels, value))
+
+    lines = []
+    for (family, kind), samples in families.items():
+        lines.append('# TYPE %s %s' % (family, kind))
+        for name, labels, value in samples:
+            if labels:
+                name += '{%s}' % ','.join(
+                    '%s="%s"' % (key, str(label).replace('\\', '\\\\')
+                                 .replace('"', '\\"'))
+                    for key, label in labels.items())
+            lines.append('%s %s' % (name, value))
+
+    return '\n'.join(lines) + '\n' if lines else ''
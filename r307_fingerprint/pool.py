@@ -0,0 +1,353 @@
+"""
+Scheduling of many AsyncSensors from one event loop.
+"""
+import asyncio
+import collections
+
+from .aio import AsyncSensor
+from .metrics import Metrics, prometheus_text
+
+
+# Scheduling classes of SensorPool, lower runs first
+PRIORITY_IDENTIFY = 0
+PRIORITY_NORMAL = 1
+PRIORITY_MAINTENANCE = 2
+
+# Commands that are part of identifying a finger at a gate
+_IDENTIFY_COMMANDS = frozenset((
+    'generate_image', 'wait_for_finger', 'generate_charfile_image',
+    'generate_template', 'match_template', 'search_library',
+    'fingerprint_verification', 'auto_fingerprint_verification',
+))
+
+# Housekeeping and bulk traffic that can wait behind identification
+_MAINTENANCE_COMMANDS = frozenset((
+    'read_parameters', 'read_profile', 'read_valid_template_num',
+    'read_index_table', 'load_library_index', 'download_image',
+    'download_char_buffer', 'upload_char_buffer', 'read_template',
+    'read_templates', 'store_templates', 'delete_templates',
+    'read_notepad', 'write_notepad', 'read_library_stamp',
+    'get_random_number', 'set_password', 'set_address', 'set_baudrate',
+    'set_security_level', 'set_package_length', 'set_port_control',
+))
+
+
+def command_priority(command):
+    """
+    :param command: name of an AsyncSensor method
+    :return, int: default PRIORITY_* class of the command
+    """
+    if command in _IDENTIFY_COMMANDS:
+        return PRIORITY_IDENTIFY
+    if command in _MAINTENANCE_COMMANDS:
+        return PRIORITY_MAINTENANCE
+    return PRIORITY_NORMAL
+
+
+class _PoolRequest:
+    __slots__ = ('command', 'args', 'kwargs', 'future', 'enqueued')
+
+    def __init__(self, command, args, kwargs, future, enqueued):
+        self.command = command
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued = enqueued
+
+
+class _PoolDevice:
+    """Connection, command queues and worker task of one pooled sensor"""
+
+    def __init__(self, port):
+        self.port = port
+        self.sensor = None
+        self.queues = (collections.deque(), collections.deque(),
+                       collections.deque())
+        self.wakeup = asyncio.Event()
+        self.worker = None
+        self.failures = 0
+        self.last_error = None
+        self.metrics = None
+
+
+class SensorPool:
+    """
+    Drives many sensors from one event loop.
+
+    Each device gets a worker task with its own command queue, so a slow or
+    failed device never holds up the others. Within a device, identification
+    commands run before normal ones and maintenance traffic runs last; a
+    request that has waited longer than ``max_wait`` seconds is served next
+    regardless of its class so maintenance cannot starve.
+
+    Usage::
+
+        pool = SensorPool(['/dev/ttyUSB0', '/dev/ttyUSB1'], 57600)
+        await pool.start()
+        page_id, score = await pool.call('/dev/ttyUSB1',
+                                         'auto_fingerprint_verification')
+        await pool.close()
+    """
+
+    def __init__(self, ports, baudrate=57600, timeout=3, max_wait=5,
+                 reconnect_delay=0.5, max_reconnect_delay=30,
+                 max_timeouts=3, opener=None, instrument=False):
+        """
+        :param ports: serial ports of the sensors
+        :param baudrate:
+        :param timeout: default command deadline in seconds
+        :param max_wait: seconds after which a queued request jumps ahead
+        of higher priority ones
+        :param reconnect_delay: first delay before reopening a failed device,
+        doubled after every failed attempt
+        :param max_reconnect_delay: upper bound of the reconnect delay
+        :param max_timeouts: consecutive command timeouts after which a
+        device is treated as failed and reopened
+        :param opener: coroutine function (port, baudrate, timeout) returning
+        a connected AsyncSensor, AsyncSensor.open by default
+        :param instrument: keep Metrics labelled with the port for every
+        device, across reconnects
+        """
+        self._devices = collections.OrderedDict(
+            (port, _PoolDevice(port)) for port in ports)
+        if instrument:
+            for port, device in self._devices.items():
+                device.metrics = Metrics(labels={'port': port})
+        self._baudrate = baudrate
+        self._timeout = timeout
+        self._max_wait = max_wait
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._max_timeouts = max_timeouts
+        self._opener = opener if opener is not None else AsyncSensor.open
+        self._closed = False
+
+    @property
+    def ports(self):
+        return list(self._devices)
+
+    async def start(self):
+        """
+        Open and verify every sensor concurrently, then start the workers.
+        Devices that fail to open keep retrying in the background.
+
+        :return, dict: port to the exception raised while opening it, for
+        the devices that are not connected yet
+        """
+        ports = list(self._devices)
+        results = await asyncio.gather(
+            *(self._open(self._devices[port]) for port in ports),
+            return_exceptions=True)
+
+        for port in ports:
+            device = self._devices[port]
+            device.worker = asyncio.ensure_future(self._work(device))
+
+        return {port: result for port, result in zip(ports, results)
+                if isinstance(result, BaseException)}
+
+    async def close(self):
+        """
+        Stop the workers, fail the pending requests and close every sensor.
+
+        :return:
+        """
+        self._closed = True
+        workers = set()
+        for device in self._devices.values():
+            device.wakeup.set()
+            if device.worker is not None:
+                workers.add(device.worker)
+
+        # A cancel that lands as a command completes can be swallowed by
+        # asyncio.wait_for; the worker then stops at its next check of
+        # _closed, and cancelling again covers a worker stuck elsewhere
+        pending = workers
+        while pending:
+            for worker in pending:
+                worker.cancel()
+            pending = (await asyncio.wait(pending, timeout=0.1))[1]
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        for device in self._devices.values():
+            for queue in device.queues:
+                while queue:
+                    future = queue.popleft().future
+                    if not future.done():
+                        future.set_exception(
+                            ConnectionError("Sensor pool closed"))
+            self._disconnect(device)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def connected(self, port):
+        """
+        :return, bool: whether the device currently has an open connection
+        """
+        return self._devices[port].sensor is not None
+
+    def status(self):
+        """
+        :return, dict: per port, whether it is connected, the number of
+        queued requests and the last device error
+        """
+        return {
+            port: {
+                'connected': device.sensor is not None,
+                'queued': sum(len(queue) for queue in device.queues),
+                'last_error': device.last_error,
+            }
+            for port, device in self._devices.items()
+        }
+
+    def metrics(self):
+        """
+        :return, dict: per port, its Metrics when the pool is instrumented
+        """
+        return {port: device.metrics
+                for port, device in self._devices.items()
+                if device.metrics is not None}
+
+    def prometheus(self):
+        """
+        :return, str: metrics of every device in the Prometheus text format
+        """
+        return prometheus_text(self.metrics().values())
+
+    def submit(self, port, command, *args, priority=None, **kwargs):
+        """
+        Queue a command for one sensor.
+
+        :param port: the sensor
+        :param command: name of an AsyncSensor method, or a coroutine
+        function called with the AsyncSensor for multi-step work
+        :param priority: PRIORITY_* class, by default taken from the command
+        :return, asyncio.Future: resolves to the command's result
+        """
+        if self._closed:
+            raise ConnectionError("Sensor pool closed")
+
+        if priority is None:
+            priority = command_priority(command) if isinstance(command, str) \
+                else PRIORITY_NORMAL
+
+        device = self._devices[port]
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        device.queues[priority].append(
+            _PoolRequest(command, args, kwargs, future, loop.time()))
+        device.wakeup.set()
+        return future
+
+    async def call(self, port, command, *args, priority=None, **kwargs):
+        """
+        Submit a command and wait for its result.
+        """
+        return await self.submit(port, command, *args, priority=priority,
+                                 **kwargs)
+
+    async def _open(self, device):
+        device.sensor = await self._opener(device.port, self._baudrate,
+                                           self._timeout)
+        device.sensor.instrumentation = device.metrics
+        device.failures = 0
+        device.last_error = None
+        return device.sensor
+
+    def _disconnect(self, device):
+        if device.sensor is not None:
+            try:
+                device.sensor.close()
+            except Exception:
+                pass
+            device.sensor = None
+
+    def _next_request(self, device):
+        """
+        Pop the request to run next: the oldest request that has waited
+        longer than max_wait, otherwise the head of the highest priority
+        non-empty queue.
+        """
+        now = asyncio.get_event_loop().time()
+        queues = device.queues
+
+        for queue in queues[1:]:
+            if queue and now - queue[0].enqueued > self._max_wait:
+                return queue.popleft()
+
+        for queue in queues:
+            if queue:
+                return queue.popleft()
+
+        return None
+
+    async def _reconnect(self, device):
+        """
+        Reopen a failed device with exponential backoff. Only this device's
+        worker waits here.
+        """
+        delay = self._reconnect_delay
+        while not self._closed:
+            try:
+                await self._open(device)
+                return
+            except Exception as error:
+                device.last_error = error
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self._max_reconnect_delay)
+
+    async def _work(self, device):
+        while not self._closed:
+            if device.sensor is None:
+                await self._reconnect(device)
+                continue
+
+            request = self._next_request(device)
+            if request is None:
+                device.wakeup.clear()
+                if not self._closed:
+                    await device.wakeup.wait()
+                continue
+
+            future = request.future
+            if future.cancelled():
+                continue
+
+            try:
+                if isinstance(request.command, str):
+                    result = await getattr(device.sensor, request.command)(
+                        *request.args, **request.kwargs)
+                else:
+                    result = await request.command(device.sensor,
+                                                   *request.args,
+                                                   **request.kwargs)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except asyncio.TimeoutError as error:
+                device.failures += 1
+                if device.failures >= self._max_timeouts:
+                    device.last_error = error
+                    self._disconnect(device)
+                if not future.done():
+                    future.set_exception(error)
+            except OSError as error:
+                # The port went away, reopen it before the next request
+                device.last_error = error
+                self._disconnect(device)
+                if not future.done():
+                    future.set_exception(error)
+            except Exception as error:
+                device.failures = 0
+                if not future.done():
+                    future.set_exception(error)
+            else:
+                device.failures = 0
+                if not future.done():
+                    future.set_result(result)
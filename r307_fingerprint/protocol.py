@@ -0,0 +1,867 @@
+"""
+Packet framing, command arguments and replies, command results and the
+confirmation code tables shared by Sensor and AsyncSensor. Nothing here
+touches a port.
+"""
+import collections
+import logging
+
+from .constants import *
+from .constants import _PID_BYTES, _RECAPTURE_CCS
+from .errors import CommandError, ProtocolError, Status, _STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+class _Outcome:
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """Whether the command succeeded"""
+        return self.status == Status.SUCCESS
+
+
+class Result(_Outcome, collections.namedtuple('Result', 'status')):
+    """Outcome of a command without a result value"""
+    __slots__ = ()
+
+
+class MatchResult(_Outcome,
+                  collections.namedtuple('MatchResult', 'status score')):
+    """Outcome of match_template"""
+    __slots__ = ()
+
+
+class SearchResult(_Outcome, collections.namedtuple(
+        'SearchResult', 'status page_id score')):
+    """Outcome of a library search, page_id and score are 0 on a miss"""
+    __slots__ = ()
+
+
+class DeviceProfile(collections.namedtuple(
+        'DeviceProfile', 'status_register system_identifier library_size '
+        'security_level address package_length baud_setting')):
+    """
+    System parameters of a module as read by read_parameters, decoded.
+    address is the 4 address bytes, package_length the 0-3 setting and
+    baud_setting the N of N * 9600 baud; the rest are integers.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_parameters(cls, param):
+        """
+        :param param, bytes-like: read parameters acknowledgement after the
+        confirmation code
+        :return, DeviceProfile:
+        """
+        param = bytes(param)
+        return cls(int.from_bytes(param[0:2], byteorder='big'),
+                   int.from_bytes(param[2:4], byteorder='big'),
+                   int.from_bytes(param[4:6], byteorder='big'),
+                   int.from_bytes(param[6:8], byteorder='big'),
+                   param[8:12],
+                   int.from_bytes(param[12:14], byteorder='big'),
+                   int.from_bytes(param[14:16], byteorder='big'))
+
+    @property
+    def packet_size(self):
+        """Data packet size in bytes"""
+        return PACKET_SIZES[self.package_length]
+
+    @property
+    def baudrate(self):
+        return self.baud_setting * 9600
+
+    @property
+    def max_page_id(self):
+        """Highest page of the template library"""
+        return self.library_size - 1
+
+    @property
+    def image_frames(self):
+        """Data packets of an image download"""
+        return self.frames(IMAGE_SIZE)
+
+    @property
+    def template_frames(self):
+        """Data packets of a template download or upload"""
+        return self.frames(TEMPLATE_SIZE)
+
+    def frames(self, size):
+        """
+        :param size, int: bytes to move
+        :return, int: data packets needed, at least one
+        """
+        return max(-(-size // self.packet_size), 1)
+
+    def transfer_time(self, size):
+        """
+        :param size, int: bytes to move
+        :return, float: seconds the packets take on the line, 10 bits a byte
+        """
+        frames = self.frames(size)
+        line = size + frames * (FRAME_PREFIX_SIZE + CHECKSUM_SIZE)
+        return line * 10 / self.baudrate
+
+    def check_pages(self, page_id, n=1):
+        """
+        :param page_id, int: first page
+        :param n, int: number of pages
+        :return:
+        """
+        if page_id < 0 or n < 1 or page_id + n - 1 > self.max_page_id:
+            raise ValueError("Pages %d to %d are outside the library of %d "
+                             "pages" % (page_id, page_id + n - 1,
+                                        self.library_size))
+
+
+class IdentifyEvent(collections.namedtuple(
+        'IdentifyEvent', 'page_id score latency')):
+    """
+    One finger identified by identify_events: page_id and score of the
+    match, None and 0 when it matched no page, and seconds from the
+    captured image to the search result
+    """
+    __slots__ = ()
+
+    @property
+    def matched(self):
+        """Whether the finger matched a page"""
+        return self.page_id is not None
+
+
+# Results carry no data beyond the status, so one of each is enough
+_RESULTS = {status: Result(status) for status in Status}
+
+
+def checksum(pid, package_len, content):
+    """
+    Checksum of a packet as defined by the module: the sum of the pid byte,
+    the package length and every content byte, truncated to 2 bytes.
+
+    :param pid, int: packet identifier
+    :param package_len, int: length of content plus checksum
+    :param content, bytes-like:
+    :return, int:
+    """
+    # sum() runs over the buffer in C instead of one Python step per byte
+    return (pid + package_len + sum(content)) & 0xFFFF
+
+
+class FrameEncoder:
+    """
+    Builds whole packets in one preallocated buffer so that each packet can
+    be handed to the serial port in a single write.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS):
+        self._buffer = bytearray(MAX_FRAME_SIZE)
+        self._view = memoryview(self._buffer)
+        self.address = address
+
+    @property
+    def address(self):
+        return bytes(self._buffer[2:6])
+
+    @address.setter
+    def address(self, address):
+        if len(address) != 4:
+            raise ValueError('Invalid Address Length')
+        # Header and address never change between packets
+        self._buffer[0:6] = HEADER + address
+
+    def encode(self, pid, content):
+        """
+        :param pid, bytes: one byte packet identifier
+        :param content, bytes-like: at most MAX_DATA_PACKET_SIZE bytes
+        :return, memoryview: the complete packet, valid until the next call
+        """
+        content_len = len(content)
+        if content_len > MAX_DATA_PACKET_SIZE:
+            raise ValueError('Packet content too long')
+
+        package_len = content_len + CHECKSUM_SIZE
+        end = FRAME_PREFIX_SIZE + content_len
+        buffer = self._buffer
+
+        buffer[6] = pid[0]
+        buffer[7] = package_len >> 8
+        buffer[8] = package_len & 0xFF
+        buffer[FRAME_PREFIX_SIZE:end] = content
+
+        cks = checksum(pid[0], package_len, content)
+        buffer[end] = cks >> 8
+        buffer[end + 1] = cks & 0xFF
+
+        return self._view[:end + CHECKSUM_SIZE]
+
+
+class FrameDecoder:
+    """
+    Splits the byte stream coming from the module into packets.
+
+    Received bytes are kept in a reusable buffer and the decoder reads ahead
+    whatever the port already holds, so a burst of data packets is usually
+    parsed out of a single read. The content of a decoded packet is returned
+    as a memoryview into that buffer and is only valid until the next call to
+    ``decode``/``read_frame``; copy it with ``bytes()`` to keep it.
+
+    With ``resync`` set, bytes that do not start a packet for this address
+    are skipped up to the next header and address instead of raising, and a
+    packet with a bad checksum is dropped without losing what follows it.
+    ``on_fault`` is called with the kind of every fault skipped over.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, size=4096, resync=True):
+        if size < MAX_FRAME_SIZE:
+            raise ValueError('Decoder buffer too small')
+
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self.address = address
+        self.resync = resync
+        self.on_fault = None
+        # Bytes dropped while resynchronising
+        self.skipped = 0
+
+    @property
+    def address(self):
+        return self._prefix[2:]
+
+    @address.setter
+    def address(self, address):
+        if len(address) != 4:
+            raise ValueError('Invalid Address Length')
+        self._prefix = HEADER + address
+
+    @property
+    def buffered(self):
+        """Number of received bytes not yet decoded"""
+        return self._end - self._start
+
+    def reset(self):
+        """Drop every buffered byte"""
+        self._start = 0
+        self._end = 0
+
+    def missing(self):
+        """
+        :return, int: minimum number of bytes needed to complete the next
+        packet
+        """
+        available = self._end - self._start
+        if available < FRAME_PREFIX_SIZE:
+            return FRAME_PREFIX_SIZE - available
+
+        start = self._start
+        package_len = (self._buffer[start + 7] << 8) | self._buffer[start + 8]
+        return max(FRAME_PREFIX_SIZE + package_len - available, 0)
+
+    def space(self):
+        """
+        :return, int: number of bytes that can be fed without overflowing
+        """
+        return len(self._buffer) - (self._end - self._start)
+
+    def feed(self, data):
+        """
+        Append received bytes to the buffer.
+
+        :param data, bytes-like:
+        :return:
+        """
+        data_len = len(data)
+        if self._end + data_len > len(self._buffer):
+            # Move the unread bytes to the front of the buffer
+            available = self._end - self._start
+            if available + data_len > len(self._buffer):
+                raise ProtocolError('Receive buffer overflow', 'overflow')
+            self._buffer[:available] = self._buffer[self._start:self._end]
+            self._start = 0
+            self._end = available
+
+        self._buffer[self._end:self._end + data_len] = data
+        self._end += data_len
+
+    def decode(self):
+        """
+        Decode the next packet if it has been received completely.
+
+        :return: (pid, content) or None when more bytes are needed
+        """
+        buffer = self._buffer
+        while True:
+            start = self._start
+            available = self._end - start
+            if available < FRAME_PREFIX_SIZE:
+                return None
+
+            if self._view[start:start + 6] != self._prefix:
+                kind = 'header' if self._view[start:start + 2] != HEADER \
+                    else 'address'
+                if not self.resync:
+                    self.reset()
+                    if kind == 'header':
+                        raise ProtocolError('Acknowledgment Header invalid',
+                                            kind)
+                    raise ProtocolError('Address is invalid', kind)
+                self._skip_to_prefix(start + 1, kind)
+                continue
+
+            package_len = (buffer[start + 7] << 8) | buffer[start + 8]
+            if package_len < CHECKSUM_SIZE or \
+                    package_len > MAX_DATA_PACKET_SIZE + CHECKSUM_SIZE:
+                if not self.resync:
+                    self.reset()
+                    raise ProtocolError('Invalid package length', 'length')
+                # Most likely a header look-alike inside garbage
+                self._skip_to_prefix(start + 1, 'length')
+                continue
+            break
+
+        frame_len = FRAME_PREFIX_SIZE + package_len
+        if available < frame_len:
+            return None
+
+        pid = buffer[start + 6]
+        content_end = start + frame_len - CHECKSUM_SIZE
+        content = self._view[start + FRAME_PREFIX_SIZE:content_end]
+        checksum_rcv = (buffer[content_end] << 8) | buffer[content_end + 1]
+
+        if checksum_rcv != checksum(pid, package_len, content):
+            if self.resync:
+                # The length may be the corrupted part, so look for the next
+                # packet right after this header
+                self._skip_to_prefix(start + 1)
+            else:
+                self.reset()
+            raise ProtocolError('Checksum Mismatch', 'checksum')
+
+        self._start = start + frame_len
+        if self._start == self._end:
+            self._start = self._end = 0
+
+        return _PID_BYTES[pid], content
+
+    def _skip_to_prefix(self, offset, kind=None):
+        """
+        Drop the bytes before the next packet prefix at or after offset.
+
+        :param kind: fault reported to on_fault, if any
+        :return:
+        """
+        if kind is not None and self.on_fault is not None:
+            self.on_fault(kind)
+
+        found = self._buffer.find(self._prefix, offset, self._end)
+        if found < 0:
+            # Keep a tail that may be the beginning of a prefix
+            found = max(self._end - len(self._prefix) + 1, offset)
+
+        self.skipped += found - self._start
+        self._start = found
+
+    def read_frame(self, serial):
+        """
+        Read the next packet from a serial port.
+
+        :param serial: object with pyserial's ``read`` (and optionally
+        ``in_waiting``)
+        :return: (pid, content)
+        """
+        while True:
+            frame = self.decode()
+            if frame is not None:
+                return frame
+
+            missing = self.missing()
+            # Read ahead whatever the port already holds, as long as it fits
+            size = min(max(missing, getattr(serial, 'in_waiting', 0)),
+                       self.space())
+            data = serial.read(size)
+            if len(data) < missing:
+                # A partial packet can never be completed, drop it
+                self.reset()
+                raise ProtocolError('Timed out waiting for packet', 'timeout')
+            self.feed(data)
+
+
+_UNRECOGNISED_CC = "Unrecognised confirmation code"
+
+# Message logged on success (None for none) and error message of each known
+# failure confirmation code, for every command. Shared by Sensor and
+# AsyncSensor.
+_RESPONSES = {
+    IC_VERIFY_PASSWORD: ("Verified", {
+        CC_ERROR: "error when receiving package",
+        CC_WRONG_PASS: "Wrong Password",
+    }),
+    IC_GENERATE_IMAGE: ("Finger Collection Success", {
+        CC_ERROR: "error when receiving package",
+        CC_FINGER_NOT_DETECTED: "can’t detect finger",
+        CC_FAILED_TO_COLLECT_FINGER: "fail to collect finger;",
+    }),
+    IC_DOWNLOAD_IMAGE: ("Downloading the fingerprint image", {
+        CC_ERROR: "error when receiving package for downloading image",
+        CC_FAILED_DOWNLOAD_IMAGE: "Could not download image",
+    }),
+    IC_GENERATE_CHARACTERISTICS: ("generate character file complete;", {
+        CC_ERROR: "error when receiving package",
+        CC_DISORDERED_FINGERPRINT: "fail to generate character file due to "
+                                   "the over-disorderly fingerprint image",
+        CC_VERY_SMALL_FINGERPRINT: "fail to generate character file due to "
+                                   "lackness of character point or "
+                                   "over-smallness of fingerprint image",
+        CC_INVALID_PRIMARY_IMAGE: "fail to generate the image for the "
+                                  "lackness of valid primary image",
+    }),
+    IC_GENERATE_TEMPLATE: ("generate template complete", {
+        CC_ERROR: "error when receiving package",
+        CC_CHAR_MISMATCH: "fail to combine the character files. That’s, "
+                          "the character files don’t belong to one finger",
+    }),
+    IC_DOWNLOAD_CHAR_BUFFER: ("Downloading the character buffer", {
+        CC_ERROR: "error when receiving package",
+        CC_TEMPLATE_DWNLD_ERR: "Error when downloading template",
+    }),
+    IC_UPLOAD_CHAR_BUFFER: ("Uploading the character buffer", {
+        CC_ERROR: "error when receiving package for uploading template",
+        CC_FAIL_TRANSFER_PACKET: "fail to receive the following data "
+                                 "packages",
+    }),
+    IC_SET_PASSWORD: ("Password setting complete", {
+        CC_ERROR: "error when receiving package",
+    }),
+    IC_SET_ADDRESS: ("Address set successfully", {
+        CC_ERROR: "error when receiving package",
+    }),
+    IC_SET_PARAMETERS: ("Parameter set successfully", {
+        CC_ERROR: "error when receiving package",
+        CC_WRONG_REG_NUM: "wrong register number;",
+    }),
+    IC_SET_PORT_CONTROL: ("port control set successfully", {
+        CC_ERROR: "Error when receiving packet",
+        CC_FAILED_TO_OPERATE_PORT: "Failed to operate communication port",
+    }),
+    IC_READ_PARAMETERS: (None, {
+        CC_ERROR: "error when receiving package",
+    }),
+    IC_READ_TEMPLATE_NUM: (None, {
+        CC_ERROR: "Error when receiving package",
+    }),
+    IC_READ_INDEX_TABLE: (None, {
+        CC_ERROR: "Error when receiving package",
+    }),
+    IC_SEARCH: (None, {
+        CC_ERROR: "error when receiving package",
+        CC_NO_MATCH: "No matching in the library (both the PageID and "
+                     "matching score are 0)",
+    }),
+    IC_FINGERPRINT_VERIFICATION: (None, {
+        CC_ERROR: "error when receiving package",
+        CC_FINGER_NOT_DETECTED: "can’t detect finger",
+        CC_DISORDERED_FINGERPRINT: "fail to generate character file due to "
+                                   "the over-disorderly fingerprint image",
+        CC_VERY_SMALL_FINGERPRINT: "fail to generate character file due to "
+                                   "lackness of character point or "
+                                   "over-smallness of fingerprint image",
+        CC_NO_MATCH: "No matching in the library (both the PageID and "
+                     "matching score are 0)",
+    }),
+    IC_AUTO_FINGERPRINT_VERIFICATION: (None, {
+        CC_ERROR: "Error during receiving packet",
+        CC_FINGER_NOT_DETECTED: "can’t detect finger",
+        CC_DISORDERED_FINGERPRINT: "Overly disordered fingerprint",
+        CC_VERY_SMALL_FINGERPRINT: "Very small fingerprint",
+        CC_NO_MATCHING_FINGERPRINT: "No Matching Fingerprint",
+    }),
+    IC_STORE_TEMPLATE: ("storage success", {
+        CC_ERROR: "error when receiving package",
+        CC_PAGE_ID_INVALID: "addressing PageID is beyond the finger library;",
+        CC_ERROR_FLASH_WRITING: "error when writing Flash",
+    }),
+    IC_READ_TEMPLATE: ("Read template successfully", {
+        CC_ERROR: "Failed to received package",
+        CC_READOUT_TEMPLATE_INVALID: "Invalid readout template",
+        CC_PAGE_ID_INVALID: "Invalid Page ID",
+    }),
+    IC_DELETE_TEMPLATE: ("Deleted successfully", {
+        CC_ERROR: "error when receiving package",
+        CC_FAILED_DELETE: "failed to delete templates",
+    }),
+    IC_EMPTY_FINGERPRINT_LIBRARY: ("Finger print library emptied", {
+        CC_ERROR: "Error when receiving packet",
+        CC_FAILED_TO_CLEAR_LIBRARY: "Failed to Clear Library",
+    }),
+    IC_MATCH_TEMPLATE: ("Templates of the two buffers are matching", {
+        CC_ERROR: "error when receiving package",
+        CC_UNMATCHED_TEMPLATES: "Templates of the two buffers are not "
+                                "matching",
+    }),
+    IC_RANDOM_NUMBER: ("Random Number generated successfully", {
+        CC_ERROR: "error when receiving package",
+    }),
+    IC_READ_NOTEPAD: ("Read successful", {
+        CC_ERROR: "error when receiving package",
+    }),
+    IC_WRITE_NOTEPAD: ("Write successful", {
+        CC_ERROR: "error when receiving package",
+        CC_ERROR_FLASH_WRITING: "error when writing Flash",
+    }),
+}
+
+
+# Commands that can be sent again when their reply was lost or garbled:
+# reads, verification and parameter queries, which change nothing in the
+# library or notepad. Captures and writes are not repeated, since one whose
+# reply is lost may still have taken effect
+_IDEMPOTENT_COMMANDS = frozenset((
+    IC_VERIFY_PASSWORD, IC_READ_PARAMETERS, IC_READ_TEMPLATE_NUM,
+    IC_READ_INDEX_TABLE, IC_READ_TEMPLATE, IC_READ_NOTEPAD, IC_SEARCH,
+    IC_MATCH_TEMPLATE, IC_FINGERPRINT_VERIFICATION,
+    IC_AUTO_FINGERPRINT_VERIFICATION,
+))
+
+# Failure confirmation codes that are ordinary outcomes of a command rather
+# than faults: returned instead of raised by sensors that are not strict
+_NEGATIVE_OUTCOMES = {
+    IC_GENERATE_IMAGE: frozenset((CC_FINGER_NOT_DETECTED,
+                                  CC_FAILED_TO_COLLECT_FINGER)),
+    IC_GENERATE_CHARACTERISTICS: frozenset(_RECAPTURE_CCS),
+    IC_GENERATE_TEMPLATE: frozenset((CC_CHAR_MISMATCH,)),
+    IC_MATCH_TEMPLATE: frozenset((CC_UNMATCHED_TEMPLATES,)),
+    IC_SEARCH: frozenset((CC_NO_MATCH,)),
+    IC_FINGERPRINT_VERIFICATION: frozenset((
+        CC_FINGER_NOT_DETECTED, CC_DISORDERED_FINGERPRINT,
+        CC_VERY_SMALL_FINGERPRINT, CC_NO_MATCH)),
+    IC_AUTO_FINGERPRINT_VERIFICATION: frozenset((
+        CC_FINGER_NOT_DETECTED, CC_DISORDERED_FINGERPRINT,
+        CC_VERY_SMALL_FINGERPRINT, CC_NO_MATCHING_FINGERPRINT)),
+}
+
+
+def _check_cc(command, cc, accept=()):
+    """
+    Raise the error matching the confirmation code of a command, if any.
+
+    :param command, bytes: instruction code
+    :param cc, bytes: confirmation code
+    :param accept: failure confirmation codes to return instead of raising
+    :return, Status:
+    """
+    if cc == CC_SUCCESS:
+        success = _RESPONSES[command][0]
+        if success is not None:
+            logger.debug(success)
+        return Status.SUCCESS
+
+    status = _STATUSES.get(cc)
+    if cc in accept:
+        return status
+
+    raise CommandError(_RESPONSES[command][1].get(cc, _UNRECOGNISED_CC),
+                       command, cc[0] if status is None else status)
+
+
+def _search_result(status, data):
+    """
+    :param data, bytes: search acknowledgement after the confirmation code
+    :return, SearchResult:
+    """
+    return SearchResult(status, int.from_bytes(data[0:2], byteorder='big'),
+                        int.from_bytes(data[2:4], byteorder='big'))
+
+
+# Packet identifiers that may come in reply to a command, and in its data
+# phase
+_ACK_PIDS = (PID_ACK,)
+_DATA_PIDS = (PID_DATA, PID_EOD)
+
+
+def _check_pid(pid, expected):
+    """
+    :param pid, bytes: identifier of a received packet
+    :param expected: _ACK_PIDS or _DATA_PIDS
+    :return:
+    """
+    if pid not in expected:
+        raise ProtocolError("Received packet in not an acknowledgement "
+                            "packet" if expected is _ACK_PIDS else
+                            "Received packet is not a data packet",
+                            'unexpected')
+
+
+def _command_data(command, args):
+    """
+    :param command, bytes: instruction code
+    :param args: bytes-like parameters
+    :return, bytes: content of the command packet
+    """
+    return b''.join((command,) + tuple(args))
+
+
+# Where the page count of a command over a range of pages is in its packet
+# data, which starts with the instruction code
+_PAGE_COUNTS = {
+    IC_SEARCH: slice(4, 6),
+    IC_DELETE_TEMPLATE: slice(3, 5),
+}
+
+
+def _page_count(data):
+    """
+    :param data, bytes: a command and its parameters
+    :return, int: pages the command covers, None when it has no range
+    """
+    field = _PAGE_COUNTS.get(data[0:1])
+    if field is None:
+        return None
+    return int.from_bytes(data[field], byteorder='big')
+
+
+def _data_packets(data, packet_size):
+    """
+    Split data for a data phase: data packets of packet_size bytes and an
+    end of data packet with the rest, which is never empty unless data is.
+
+    :param data, bytes-like:
+    :param packet_size, int:
+    :return: generator of (pid, memoryview)
+    """
+    view = memoryview(data).cast('B')
+    last = (len(view) - 1) // packet_size * packet_size if view else 0
+
+    for offset in range(0, last, packet_size):
+        yield PID_DATA, view[offset:offset + packet_size]
+    yield PID_EOD, view[last:]
+
+
+def _parse_parameters(param):
+    """
+    :param param, bytes: read parameters acknowledgement after the
+    confirmation code
+    :return, dict: raw parameter bytes keyed by the KEY_* constants
+    """
+    return {
+        KEY_STATUS_REGISTER: param[0:2],
+        KEY_SYSTEM_IDENTIFIER_CODE: param[2:4],
+        KEY_FINGER_LIBRARY_SIZE: param[4:6],
+        KEY_SECURITY_LEVEL: param[6:8],
+        KEY_DEVICE_ADDRESS: param[8:12],
+        KEY_DATA_PACKET_SIZE: param[12:14],
+        KEY_BAUD_SETTINGS: param[14:16],
+    }
+
+
+# Command arguments. Each function checks the values and returns the
+# parameters to send after the instruction code
+
+# Lowest and highest setting of each system parameter, and its name
+_PARAMETER_RANGES = {
+    PN_BAUD_RATE: (1, 12, 'baudrate'),
+    PN_SECURITY_LEVEL: (1, 5, 'security'),
+    PN_PACKAGE_LEN: (0, 3, 'package length'),
+}
+
+
+def _password_args(password):
+    if len(password) != 4:
+        raise ValueError("password set failed, please enter 4 bytes "
+                         "password")
+    return bytes(password),
+
+
+def _address_args(address):
+    if len(address) != 4:
+        raise ValueError("Invalid Address Length")
+    return bytes(address),
+
+
+def _parameter_args(pn, n):
+    """
+    :param pn: PN_BAUD_RATE, PN_SECURITY_LEVEL or PN_PACKAGE_LEN
+    :param n, int: new setting
+    """
+    low, high, name = _PARAMETER_RANGES[pn]
+    if n < low or n > high:
+        raise ValueError('Invalid value for ' + name)
+    return pn, n.to_bytes(1, byteorder='big')
+
+
+def _port_control_args(val):
+    return b'\x01' if val else b'\x00',
+
+
+def _index_table_args(index_page):
+    return index_page.to_bytes(1, byteorder='big'),
+
+
+def _template_args(buffer_id, page_id):
+    """Arguments of store_template and read_template"""
+    return buffer_id, page_id.to_bytes(2, byteorder='big')
+
+
+def _delete_args(page_id, n):
+    return page_id.to_bytes(2, byteorder='big'), n.to_bytes(2, byteorder='big')
+
+
+def _search_args(buffer_id, start_page, count):
+    return buffer_id, start_page.to_bytes(2, byteorder='big'), \
+        count.to_bytes(2, byteorder='big')
+
+
+def _verification_args(capture_time, start_bit, search_quantity):
+    return capture_time, start_bit.to_bytes(2, byteorder='big'), \
+        search_quantity.to_bytes(2, byteorder='big')
+
+
+def _notepad_page_args(page):
+    if not 0 <= page < NOTEPAD_PAGES:
+        raise ValueError("Notepad page must be 0 to %d" % (NOTEPAD_PAGES - 1))
+    return page.to_bytes(1, byteorder='big'),
+
+
+def _notepad_args(page, data):
+    """
+    :param page, int: notepad page
+    :param data: bytes-like, or str written as UTF-8
+    :return: write notepad arguments, with the data padded to a full page
+    """
+    if isinstance(data, str):
+        data = data.encode('UTF-8')
+    if len(data) > NOTEPAD_PAGE_SIZE:
+        raise ValueError("Notepad pages hold %d bytes" % NOTEPAD_PAGE_SIZE)
+    return _notepad_page_args(page) + \
+        (bytes(data).ljust(NOTEPAD_PAGE_SIZE, b'\x00'),)
+
+
+# Command replies. Each function decodes an acknowledgement, whole or after
+# its confirmation code, into what the front ends return
+
+def _status_result(status, strict):
+    """
+    :return: None for a strict sensor, the Result of status otherwise
+    """
+    if not strict:
+        return _RESULTS[status]
+
+
+def _capture_result(captured, strict):
+    """
+    :param captured, bool: whether wait_for_finger captured an image
+    :return: None for a strict sensor, the Result of the capture otherwise
+    """
+    if not strict:
+        return _RESULTS[Status.SUCCESS if captured else Status.NO_FINGER]
+    if not captured:
+        _check_cc(IC_GENERATE_IMAGE, CC_FINGER_NOT_DETECTED)
+
+
+def _search_reply(data):
+    """
+    :param data, bytes: whole search acknowledgement
+    :return: (page_id, score) of the match, (None, 0) when there is none
+    """
+    cc = data[0:1]
+    if cc == CC_NO_MATCH:
+        return None, 0
+    _check_cc(IC_SEARCH, cc)
+
+    return int.from_bytes(data[1:3], byteorder='big'), \
+        int.from_bytes(data[3:5], byteorder='big')
+
+
+def _verification_reply(status, data, strict):
+    """
+    :param data, bytes: verification acknowledgement after the
+    confirmation code
+    :return: a SearchResult, or the raw page id and score bytes for a
+    strict sensor
+    """
+    if not strict:
+        return _search_result(status, data)
+    return data[0:2], data[2:4]
+
+
+def _match_reply(status, data, strict):
+    """
+    :param data, bytes: match acknowledgement after the confirmation code
+    :return: the score, or a MatchResult when the sensor is not strict
+    """
+    score = int.from_bytes(data, byteorder='big')
+    if not strict:
+        return MatchResult(status, score)
+    return score
+
+
+def _notepad_reply(data, encoding):
+    """
+    :param encoding: encoding of the page, None to return bytes
+    """
+    if encoding is None:
+        return bytes(data)
+    return str(data, encoding)
+
+
+class _IdentifyCycle:
+    """
+    The identification loop of identify_events, shared by Sensor and
+    AsyncSensor: next_event yields the steps of one identification for
+    the front end to run, see library._LibraryKeeper, while the rate limit
+    and the wait for the glass to clear carry over to the next one.
+
+    Steps are ('lift',), ('sleep', seconds) and ('finger',), answered with
+    whether to go on, ('extract',), answered with the confirmation code of
+    the extraction, and ('search',), answered with (page_id, score).
+    """
+
+    def __init__(self, poll_interval, debounce, rate, clock):
+        """
+        :param clock: callable returning the time in seconds
+        """
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.spacing = 0 if rate is None else 1 / rate
+        self.clock = clock
+        self.next_start = clock()
+        self.covered = False
+
+    def next_event(self):
+        """
+        :return, IdentifyEvent: None when a step answered to stop
+        """
+        clock = self.clock
+        while True:
+            try:
+                if self.covered:
+                    if not (yield ('lift',)):
+                        return None
+                    self.covered = False
+
+                wait = self.next_start - clock()
+                if wait > 0 and not (yield ('sleep', wait)):
+                    return None
+                if not (yield ('finger',)):
+                    return None
+
+                captured = clock()
+                self.next_start = captured + self.spacing
+                cc = yield ('extract',)
+                if cc in _RECAPTURE_CCS:
+                    continue
+                _check_cc(IC_GENERATE_CHARACTERISTICS, cc)
+
+                page_id, score = yield ('search',)
+            except ProtocolError as error:
+                logger.warning("Identification restarted: %s", error)
+                if not (yield ('sleep', self.poll_interval)):
+                    return None
+                continue
+
+            self.covered = self.debounce
+            return IdentifyEvent(page_id, score, clock() - captured)
+
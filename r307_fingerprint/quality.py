@@ -0,0 +1,187 @@
+"""
+Host-side quality screening of captured fingerprint images with numpy.
+
+A QualityGate scores the image from Sensor.download_image before the module
+is asked to extract it, so a capture the module would reject as too small,
+disordered or invalid can be retaken at once::
+
+    gate = QualityGate()
+    report = gate.assess(sensor.download_image())
+    if not report.ok:
+        print(report.reason, report.score)
+
+numpy is imported when the first image is assessed.
+"""
+import collections
+
+from .errors import Status
+from .image import image_to_array
+
+# Reasons a capture is rejected: too little of the glass covered, ridges
+# and valleys too alike, ridge flow without a clear orientation
+QUALITY_SMALL = 'small'
+QUALITY_CONTRAST = 'contrast'
+QUALITY_DISORDERED = 'disordered'
+
+# Outcome of QualityGate.assess: whether the capture passes, why not (None
+# when it does), the overall score and the metrics it is made of, all from
+# 0 to 1
+QualityReport = collections.namedtuple(
+    'QualityReport', 'ok reason score coverage contrast coherence')
+
+# Verdicts of the module's feature extraction that a gate tries to predict
+_REJECTED_STATUSES = frozenset((Status.DISORDERED, Status.TOO_SMALL,
+                                Status.INVALID_IMAGE))
+
+
+class QualityGate:
+    """
+    Scores fingerprint images by foreground coverage, contrast and ridge
+    orientation coherence, each computed over square blocks with whole
+    array numpy operations.
+
+    A block is foreground when the standard deviation of its pixels reaches
+    ``foreground``. coverage is the share of foreground blocks, contrast the
+    spread between the 5th and 95th percentile of the foreground pixels,
+    and coherence the mean over the foreground blocks of how strongly their
+    gradients agree on one orientation.
+
+    The default thresholds are starting points. Record the module's verdict
+    on the captures that pass, with record or through Sensor.enroll, and
+    let tune fit the thresholds to the sensor.
+    """
+
+    def __init__(self, min_coverage=0.2, min_contrast=0.25,
+                 min_coherence=0.3, block=16, foreground=12, history=1024):
+        """
+        :param min_coverage: lowest share of foreground blocks passed
+        :param min_contrast: lowest foreground contrast passed
+        :param min_coherence: lowest mean orientation coherence passed
+        :param block: block side in pixels
+        :param foreground: standard deviation, on the 0-255 pixel scale,
+        from which a block is foreground
+        :param history: assessments kept with the module's verdict for tune
+        """
+        self.min_coverage = min_coverage
+        self.min_contrast = min_contrast
+        self.min_coherence = min_coherence
+        self.block = block
+        self.foreground = foreground
+        self.records = collections.deque(maxlen=history)
+        self.assessed = 0
+        self.rejected = collections.Counter()
+
+    def metrics(self, packed):
+        """
+        :param packed, bytes-like: image as returned by
+        Sensor.download_image
+        :return: (coverage, contrast, coherence)
+        """
+        import numpy
+
+        block = self.block
+        image = image_to_array(packed).astype(numpy.float32)
+        rows = image.shape[0] // block
+        cols = image.shape[1] // block
+        image = image[:rows * block, :cols * block]
+
+        def blocks(values):
+            return values.reshape(rows, block, cols, block)
+
+        foreground = blocks(image).std(axis=(1, 3)) >= self.foreground
+        coverage = float(foreground.mean())
+        if not foreground.any():
+            return coverage, 0.0, 0.0
+
+        pixels = blocks(image).transpose(0, 2, 1, 3)[foreground]
+        low, high = numpy.percentile(pixels, (5, 95))
+        contrast = float(high - low) / 255
+
+        gy, gx = numpy.gradient(image)
+        gxx = blocks(gx * gx).sum(axis=(1, 3))
+        gyy = blocks(gy * gy).sum(axis=(1, 3))
+        gxy = blocks(gx * gy).sum(axis=(1, 3))
+        coherence = numpy.sqrt((gxx - gyy) ** 2 + 4 * gxy ** 2) / \
+            numpy.maximum(gxx + gyy, 1e-9)
+
+        return coverage, contrast, float(coherence[foreground].mean())
+
+    def assess(self, packed):
+        """
+        :param packed, bytes-like: image as returned by
+        Sensor.download_image
+        :return, QualityReport:
+        """
+        coverage, contrast, coherence = self.metrics(packed)
+
+        reason = None
+        if coverage < self.min_coverage:
+            reason = QUALITY_SMALL
+        elif contrast < self.min_contrast:
+            reason = QUALITY_CONTRAST
+        elif coherence < self.min_coherence:
+            reason = QUALITY_DISORDERED
+
+        self.assessed += 1
+        if reason is not None:
+            self.rejected[reason] += 1
+
+        score = (coverage * contrast * coherence) ** (1 / 3)
+        return QualityReport(reason is None, reason, score, coverage,
+                             contrast, coherence)
+
+    def record(self, report, status):
+        """
+        Keep an assessment with the module's verdict on the same capture.
+
+        :param report, QualityReport:
+        :param status: Status of generate_charfile_image on the capture
+        :return:
+        """
+        self.records.append((report, status))
+
+    def tune(self, max_rejected=0.01):
+        """
+        Set each threshold so that at most ``max_rejected`` of the recorded
+        captures the module extracted would have been rejected by it.
+
+        :param max_rejected: share of good captures a threshold may reject
+        :return, dict: the new thresholds by attribute name, empty when no
+        good capture has been recorded
+        """
+        import numpy
+
+        good = [report for report, status in self.records
+                if status == Status.SUCCESS]
+        if not good:
+            return {}
+
+        thresholds = {
+            name: float(numpy.quantile([getattr(report, metric)
+                                        for report in good], max_rejected))
+            for name, metric in (('min_coverage', 'coverage'),
+                                 ('min_contrast', 'contrast'),
+                                 ('min_coherence', 'coherence'))
+        }
+        for name, threshold in thresholds.items():
+            setattr(self, name, threshold)
+        return thresholds
+
+    def snapshot(self):
+        """
+        :return, dict: JSON-serialisable counts of assessments, rejections
+        by reason, and recorded captures the gate passed but the module
+        rejected
+        """
+        return {
+            'assessed': self.assessed,
+            'rejected': dict(self.rejected),
+            'recorded': len(self.records),
+            'missed': sum(1 for report, status in self.records
+                          if report.ok and status in _REJECTED_STATUSES),
+            'thresholds': {
+                'min_coverage': self.min_coverage,
+                'min_contrast': self.min_contrast,
+                'min_coherence': self.min_coherence,
+            },
+        }
@@ -0,0 +1,586 @@
+"""
+Blocking client of a SensorBroker, and the wire format the two share.
+
+Every message is a 4-byte big-endian length followed by the body. A request
+body is the request kind, a flags byte and a priority byte followed by a
+packed value: (port, command, args) for REQ_CALL, (port,) for REQ_LOCK and
+() for REQ_UNLOCK. A response body is the response kind followed by a
+packed value, except RSP_CHUNK whose body is raw image data streamed ahead
+of the result of download_image.
+"""
+import contextlib
+import socket
+import struct
+import threading
+
+from .constants import CC_FINGER_NOT_DETECTED, CHAR_BUFFER_1, \
+    IC_GENERATE_IMAGE
+from .errors import CommandError, ProtocolError, SensorError, Status
+from .library import BatchResult, LibraryIndex, LibraryStamp
+from .protocol import DeviceProfile, MatchResult, Result, SearchResult, \
+    _RESULTS, _check_cc
+
+# Request kinds
+REQ_CALL = 1
+REQ_LOCK = 2
+REQ_UNLOCK = 3
+
+# Response kinds
+RSP_RESULT = 1
+RSP_ERROR = 2
+RSP_CHUNK = 3
+
+# Request flag asking for the results of a sensor that is not strict
+FLAG_LENIENT = 0x01
+
+# Priority byte asking for the command's default class
+PRIORITY_DEFAULT = 0xFF
+
+# Largest message either side accepts
+MAX_MESSAGE_SIZE = 1 << 20
+
+# Result types that can be sent, indexed by their tag byte
+_RESULT_TYPES = (Result, MatchResult, SearchResult)
+
+# Exceptions raised again on the client side, by class name
+_ERRORS = {
+    'SensorError': SensorError,
+    'ProtocolError': ProtocolError,
+    'CommandError': CommandError,
+    'TimeoutError': TimeoutError,
+    'ValueError': ValueError,
+    'KeyError': KeyError,
+    'ConnectionError': ConnectionError,
+    'OSError': OSError,
+}
+
+
+def pack_value(value):
+    """
+    Pack a command argument or result.
+
+    Every value starts with a tag byte: N None, T and F booleans, i 8-byte
+    signed int, d double, b bytes, s UTF-8 string, l tuple or list, m dict,
+    r Result, MatchResult or SearchResult, x LibraryIndex. Lengths and
+    counts are 4 bytes, big endian.
+
+    :return, bytearray:
+    """
+    out = bytearray()
+    _pack(value, out)
+    return out
+
+
+def _pack(value, out):
+    if value is None:
+        out += b'N'
+    elif value is True:
+        out += b'T'
+    elif value is False:
+        out += b'F'
+    elif isinstance(value, _RESULT_TYPES):
+        out += b'r'
+        out.append(_RESULT_TYPES.index(type(value)))
+        _pack(tuple(value), out)
+    elif isinstance(value, int):
+        out += b'i'
+        out += value.to_bytes(8, byteorder='big', signed=True)
+    elif isinstance(value, float):
+        out += b'd'
+        out += struct.pack('>d', value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        value = memoryview(value).cast('B')
+        out += b'b'
+        out += len(value).to_bytes(4, byteorder='big')
+        out += value
+    elif isinstance(value, str):
+        data = value.encode('UTF-8')
+        out += b's'
+        out += len(data).to_bytes(4, byteorder='big')
+        out += data
+    elif isinstance(value, (tuple, list)):
+        out += b'l'
+        out += len(value).to_bytes(4, byteorder='big')
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        out += b'm'
+        out += len(value).to_bytes(4, byteorder='big')
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    elif isinstance(value, LibraryIndex):
+        out += b'x'
+        _pack(value.size, out)
+        _pack(value.to_index_table(), out)
+        _pack(value.stamp, out)
+    else:
+        raise TypeError("Cannot pack a %s" % type(value).__name__)
+
+
+def unpack_value(data):
+    """
+    :param data, bytes-like: a value packed by pack_value
+    :return: the value; tuples and lists come back as tuples, bytes-like
+    values as bytes
+    """
+    view = memoryview(data).cast('B')
+    value, offset = _unpack(view, 0)
+    if offset != len(view):
+        raise ValueError("Trailing data after packed value")
+    return value
+
+
+def _take(view, offset, n):
+    if offset + n > len(view):
+        raise ValueError("Packed value is truncated")
+    return view[offset:offset + n]
+
+
+def _status(code):
+    try:
+        return Status(code)
+    except ValueError:
+        return code
+
+
+def _unpack(view, offset):
+    tag = bytes(_take(view, offset, 1))
+    offset += 1
+
+    if tag == b'N':
+        return None, offset
+    if tag == b'T':
+        return True, offset
+    if tag == b'F':
+        return False, offset
+    if tag == b'i':
+        return int.from_bytes(_take(view, offset, 8), byteorder='big',
+                              signed=True), offset + 8
+    if tag == b'd':
+        return struct.unpack('>d', _take(view, offset, 8))[0], offset + 8
+    if tag == b'r':
+        kind = _take(view, offset, 1)[0]
+        if kind >= len(_RESULT_TYPES):
+            raise ValueError("Unknown result type %d" % kind)
+        fields, offset = _unpack(view, offset + 1)
+        return _RESULT_TYPES[kind](_status(fields[0]), *fields[1:]), offset
+    if tag == b'x':
+        size, offset = _unpack(view, offset)
+        table, offset = _unpack(view, offset)
+        stamp, offset = _unpack(view, offset)
+        index = LibraryIndex.from_index_table(size, table)
+        if stamp is not None:
+            index.stamp = LibraryStamp(*stamp)
+        return index, offset
+    if tag not in (b'b', b's', b'l', b'm'):
+        raise ValueError("Unknown value tag %r" % tag)
+
+    n = int.from_bytes(_take(view, offset, 4), byteorder='big')
+    offset += 4
+    if tag == b'b':
+        return bytes(_take(view, offset, n)), offset + n
+    if tag == b's':
+        return str(_take(view, offset, n), 'UTF-8'), offset + n
+
+    items = []
+    for _ in range(n * 2 if tag == b'm' else n):
+        item, offset = _unpack(view, offset)
+        items.append(item)
+    if tag == b'm':
+        return dict(zip(items[0::2], items[1::2])), offset
+    return tuple(items), offset
+
+
+def _error_value(error):
+    """
+    :param error: exception raised by a command on the broker
+    :return, tuple: class name and arguments to raise it again with
+    """
+    name = 'SensorError'
+    for cls in type(error).__mro__:
+        if cls.__name__ in _ERRORS:
+            name = cls.__name__
+            break
+
+    if isinstance(error, CommandError):
+        status = None if error.status is None else int(error.status)
+        return name, (str(error), error.command, status)
+    if isinstance(error, ProtocolError):
+        return name, (str(error), error.kind)
+    return name, (str(error),)
+
+
+def _exception(name, args):
+    cls = _ERRORS.get(name, SensorError)
+    if cls is CommandError:
+        message, command, status = args
+        return CommandError(message, command,
+                            None if status is None else _status(status))
+    return cls(*args)
+
+
+def _recv_exactly(sock, n):
+    data = bytearray(n)
+    view = memoryview(data)
+    received = 0
+    while received < n:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("Broker closed the connection")
+        received += count
+    return data
+
+
+def _send_message(sock, body):
+    sock.sendall(len(body).to_bytes(4, byteorder='big') + body)
+
+
+def _recv_message(sock):
+    size = int.from_bytes(_recv_exactly(sock, 4), byteorder='big')
+    if size == 0 or size > MAX_MESSAGE_SIZE:
+        raise ProtocolError("Invalid broker message length %d" % size,
+                            'length')
+    return _recv_exactly(sock, size)
+
+
+class RemoteSensor:
+    """
+    Blocking client of a SensorBroker with the command methods of Sensor.
+
+    Commands are queued by the broker with every other client's, by
+    default in the pool's class for the command. A sequence of commands
+    that relies on the module's image and character buffers staying put,
+    such as capturing twice and merging the character files, should run
+    inside ``with sensor.exclusive():`` so no other client's command lands
+    in between.
+
+    The multi-step helpers of Sensor (enroll, match_candidates,
+    export_library, import_library and negotiate_link) are not offered;
+    run them in the process that owns the port.
+    """
+
+    def __init__(self, path, port='', strict=True, priority=None,
+                 timeout=None, connect=True):
+        """
+        :param path: Unix domain socket of the broker
+        :param port: serial port of the sensor, '' for the broker's first
+        :param strict: as for Sensor
+        :param priority: PRIORITY_* class of every request, by default taken
+        from the command
+        :param timeout: socket timeout in seconds, None to wait for the
+        broker's own deadlines
+        :param connect: when False the socket is opened by the first request
+        """
+        self._path = path
+        self._socket = None
+        # One request at a time on the connection
+        self._lock = threading.Lock()
+        self.port = port
+        self.strict = strict
+        self.priority = priority
+        self.timeout = timeout
+        self.library_index = None
+        self._profile = None
+
+        if connect:
+            self.connect()
+
+    def connect(self):
+        """
+        :return, RemoteSensor: self
+        """
+        if self._socket is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self._path)
+            except BaseException:
+                sock.close()
+                raise
+            self._socket = sock
+
+        return self
+
+    def close(self):
+        """
+        Close the connection. The broker ends any exclusive hold.
+
+        :return:
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __request(self, kind, value, priority=None, on_chunk=None):
+        """
+        Send one request and wait for its response.
+
+        :param on_chunk: called with each streamed RSP_CHUNK body
+        :return: the unpacked result
+        """
+        if priority is None:
+            priority = self.priority
+        body = bytes((kind, 0 if self.strict else FLAG_LENIENT,
+                      PRIORITY_DEFAULT if priority is None else priority))
+        body += pack_value(value)
+
+        with self._lock:
+            self.connect()
+            try:
+                _send_message(self._socket, body)
+                while True:
+                    message = memoryview(_recv_message(self._socket))
+                    if message[0] != RSP_CHUNK:
+                        break
+                    on_chunk(message[1:])
+
+                if message[0] not in (RSP_RESULT, RSP_ERROR):
+                    raise ProtocolError("Unknown broker response %d"
+                                        % message[0], 'unexpected')
+                value = unpack_value(message[1:])
+            except BaseException:
+                # Where the next response starts is no longer known
+                self.close()
+                raise
+
+        if message[0] == RSP_ERROR:
+            raise _exception(*value)
+        return value
+
+    def __call(self, command, *args, on_chunk=None):
+        return self.__request(REQ_CALL, (self.port, command, args),
+                              on_chunk=on_chunk)
+
+    @contextlib.contextmanager
+    def exclusive(self, priority=None):
+        """
+        Hold the sensor for this client for the duration of a with block.
+        The broker ends the hold after its lock_timeout.
+
+        :param priority: PRIORITY_* class to queue the hold in
+        """
+        self.__request(REQ_LOCK, (self.port,), priority)
+        try:
+            yield self
+        finally:
+            if self._socket is not None:
+                self.__request(REQ_UNLOCK, ())
+
+    def verify_password(self):
+        self.__call('verify_password')
+
+    def generate_image(self, timeout=2):
+        """
+        :param timeout: seconds to wait for a finger
+        :return: None, or a Result when the sensor is not strict
+        """
+        captured = self.wait_for_finger(timeout)
+        if not self.strict:
+            return _RESULTS[Status.SUCCESS if captured else Status.NO_FINGER]
+        if not captured:
+            _check_cc(IC_GENERATE_IMAGE, CC_FINGER_NOT_DETECTED)
+
+    def wait_for_finger(self, timeout=10, poll_interval=0.2):
+        return self.__call('wait_for_finger', timeout, poll_interval)
+
+    def download_image(self, dest=None):
+        """
+        Download the image held in the module's image buffer, streamed from
+        the broker as it arrives.
+
+        :param dest: None, a writable buffer or a file object, as for
+        Sensor.download_image
+        :return: the packed image when dest is None, otherwise the number of
+        bytes received
+        """
+        if dest is None:
+            image = bytearray()
+            self.__call('download_image', on_chunk=image.extend)
+            return image
+
+        if hasattr(dest, 'write'):
+            return self.__call('download_image', on_chunk=dest.write)
+
+        view = memoryview(dest).cast('B')
+        received = 0
+
+        def write(content):
+            nonlocal received
+            end = received + len(content)
+            if end > len(view):
+                raise ValueError("Image larger than the destination buffer")
+            view[received:end] = content
+            received = end
+
+        self.__call('download_image', on_chunk=write)
+        return received
+
+    def generate_charfile_image(self, buffer_id):
+        return self.__call('generate_charfile_image', buffer_id)
+
+    def generate_template(self):
+        return self.__call('generate_template')
+
+    def download_char_buffer(self, buffer_id):
+        return self.__call('download_char_buffer', buffer_id)
+
+    def upload_char_buffer(self, buffer_id, template):
+        self.__call('upload_char_buffer', buffer_id, template)
+
+    def set_password(self, new_password):
+        self.__call('set_password', new_password)
+
+    def set_address(self, address):
+        self.__call('set_address', address)
+        self._profile = None
+
+    def set_baudrate(self, n):
+        self.__call('set_baudrate', n)
+        self._profile = None
+
+    def set_security_level(self, n):
+        self.__call('set_security_level', n)
+        self._profile = None
+
+    def set_package_length(self, n):
+        self.__call('set_package_length', n)
+        self._profile = None
+
+    def set_port_control(self, val):
+        self.__call('set_port_control', val)
+
+    def read_parameters(self):
+        return self.__call('read_parameters')
+
+    def read_profile(self):
+        """
+        :return, DeviceProfile:
+        """
+        self._profile = DeviceProfile(*self.__call('read_profile'))
+        return self._profile
+
+    @property
+    def profile(self):
+        """
+        The module's DeviceProfile, read once and read again after this
+        client's own setters
+        """
+        if self._profile is None:
+            self.read_profile()
+        return self._profile
+
+    def read_valid_template_num(self):
+        return self.__call('read_valid_template_num')
+
+    def read_index_table(self, index_page):
+        return self.__call('read_index_table', index_page)
+
+    def load_library_index(self, cached=None):
+        """
+        :param cached: LibraryIndex saved earlier, returned by the broker
+        when its stamp is still the module's library stamp
+        :return, LibraryIndex: a snapshot, kept up to date only through
+        this client's own store_template, delete_template and
+        empty_fingerprint_library
+        """
+        self.library_index = self.__call('load_library_index', cached)
+        return self.library_index
+
+    def read_library_stamp(self):
+        """
+        :return, LibraryStamp: None when the module has none
+        """
+        stamp = self.__call('read_library_stamp')
+        return None if stamp is None else LibraryStamp(*stamp)
+
+    def fingerprint_verification(self, capture_time, start_bit,
+                                 search_quantity):
+        return self.__call('fingerprint_verification', capture_time,
+                           start_bit, search_quantity)
+
+    def auto_fingerprint_verification(self):
+        return self.__call('auto_fingerprint_verification')
+
+    def store_template(self, buffer_id, page_id):
+        self.__call('store_template', buffer_id, page_id)
+
+        if self.library_index is not None:
+            # The broker renewed the stamp, which this client doesn't see
+            self.library_index.stamp = None
+            self.library_index.mark_used(page_id)
+
+    def read_template(self, buffer_id, page_id):
+        self.__call('read_template', buffer_id, page_id)
+
+    def delete_template(self, page_id, n):
+        self.__call('delete_template', page_id, n)
+
+        if self.library_index is not None:
+            self.library_index.stamp = None
+            self.library_index.mark_free(page_id, n)
+
+    def empty_fingerprint_library(self):
+        self.__call('empty_fingerprint_library')
+
+        if self.library_index is not None:
+            self.library_index.stamp = None
+            self.library_index.clear()
+
+    def __batch_result(self, value):
+        pages, commands, failed = value
+        return BatchResult(pages, commands, tuple(
+            (page_id, n, _status(status)) for page_id, n, status in failed))
+
+    def delete_templates(self, page_ids):
+        page_ids = set(page_ids)
+        result = self.__batch_result(
+            self.__call('delete_templates', sorted(page_ids)))
+
+        index = self.library_index
+        if index is not None:
+            index.stamp = None
+            for page_id in page_ids:
+                if not any(first <= page_id < first + n
+                           for first, n, _ in result.failed):
+                    index.mark_free(page_id)
+        return result
+
+    def store_templates(self, templates, buffer_id=CHAR_BUFFER_1):
+        templates = dict(templates)
+        result = self.__batch_result(self.__call(
+            'store_templates', templates, buffer_id))
+
+        index = self.library_index
+        if index is not None:
+            index.stamp = None
+            refused = {page_id for page_id, _, _ in result.failed}
+            for page_id in templates:
+                if page_id not in refused:
+                    index.mark_used(page_id)
+        return result
+
+    def read_templates(self, page_ids, buffer_id=CHAR_BUFFER_1):
+        return self.__call('read_templates', sorted(set(page_ids)),
+                           buffer_id)
+
+    def match_template(self):
+        return self.__call('match_template')
+
+    def search_library(self, buffer_id, start_page, count):
+        return self.__call('search_library', buffer_id, start_page, count)
+
+    def get_random_number(self):
+        return self.__call('get_random_number')
+
+    def write_notepad(self, page, data):
+        self.__call('write_notepad', page, data)
+
+    def read_notepad(self, page=0, encoding='UTF-8'):
+        return self.__call('read_notepad', page, encoding)
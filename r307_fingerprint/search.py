@@ -0,0 +1,444 @@
+"""
+Identification strategies built on a Sensor: a host template cache with a
+flash hot set, and a library search that keeps frequent fingers first.
+"""
+import collections
+import time
+
+from .constants import CHAR_BUFFER_1, CHAR_BUFFER_2
+
+
+# Where TemplateCache found a finger: in the module's library or on the host
+SOURCE_FLASH = 'flash'
+SOURCE_HOST = 'host'
+
+IdentifyResult = collections.namedtuple(
+    'IdentifyResult', 'user score page_id source')
+
+
+class TemplateCache:
+    """
+    Uses a range of the module's library as a cache of the most wanted
+    templates of a TemplateStore, so the module can identify more users than
+    its flash holds.
+
+    A search first runs on the module over the cached pages. On a miss the
+    templates that are not cached are matched on the module one at a time,
+    most frequently matched users first, and the match is paged in over the
+    least recently (``policy='lru'``) or least frequently (``policy='lfu'``)
+    matched cached user.
+
+    The cache owns pages first_page to first_page + capacity - 1 and
+    overwrites whatever they hold; call reset to empty them on the module.
+
+    Usage::
+
+        store = TemplateStore.load('users.tpl')
+        cache = TemplateCache(sensor, store, first_page=0, capacity=900)
+        result = cache.identify()
+        if result is not None:
+            print(result.user, result.score, result.source)
+    """
+
+    def __init__(self, sensor, store, first_page=0, capacity=None,
+                 policy='lru'):
+        """
+        :param sensor: connected Sensor
+        :param store: TemplateStore holding the whole population
+        :param first_page: first library page used by the cache
+        :param capacity: number of pages used, by default every page from
+        first_page to the end of the library
+        :param policy: 'lru' or 'lfu', which cached user to evict
+        """
+        if policy not in ('lru', 'lfu'):
+            raise ValueError('Invalid cache policy')
+
+        if capacity is None:
+            capacity = sensor.profile.library_size - first_page
+
+        self.sensor = sensor
+        self.store = store
+        self.first_page = first_page
+        self.capacity = capacity
+        self.policy = policy
+        # Cached users in order of their last match, least recent first
+        self._pages = collections.OrderedDict()
+        self._users = {}
+        self._free = list(range(first_page + capacity - 1, first_page - 1,
+                                -1))
+        self.matches = collections.Counter()
+        self.flash_hits = 0
+        self.host_hits = 0
+        self.rejects = 0
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __contains__(self, user):
+        return user in self._pages
+
+    def page_of(self, user):
+        """
+        :return, int: page holding the user's template, None if not cached
+        """
+        return self._pages.get(user)
+
+    def reset(self):
+        """
+        Delete the cache's pages on the module and forget what they held.
+
+        :return:
+        """
+        self.sensor.delete_template(self.first_page, self.capacity)
+        self._pages.clear()
+        self._users.clear()
+        self._free = list(range(self.first_page + self.capacity - 1,
+                                self.first_page - 1, -1))
+
+    def add(self, user, template, page_in=True):
+        """
+        Add or replace a user's template in the store, and in the cache.
+
+        :param user, str:
+        :param template, bytes-like:
+        :param page_in: also store the template on the module now
+        :return:
+        """
+        self.store.add(user, template)
+        if user in self._pages:
+            self.evict(user)
+        if page_in:
+            self.page_in(user)
+
+    def remove(self, user):
+        """
+        Remove a user from the store and from the module.
+
+        :param user, str:
+        :return:
+        """
+        if user in self._pages:
+            self.evict(user)
+        self.store.remove(user)
+        self.matches.pop(user, None)
+
+    def warm(self, users=None):
+        """
+        Page in users, by default the most frequently matched ones, until
+        the cache is full.
+
+        :param users: optional iterable of users, in order of preference
+        :return, int: number of templates paged in
+        """
+        if users is None:
+            users = self._by_frequency(user for user in self.store
+                                       if user not in self._pages)
+
+        paged = 0
+        for user in users:
+            if not self._free:
+                break
+            if user not in self._pages:
+                self.page_in(user)
+                paged += 1
+
+        return paged
+
+    def page_in(self, user, buffer_id=None):
+        """
+        Store a user's template on the module, evicting a cached user when
+        every page is taken.
+
+        :param user, str:
+        :param buffer_id: character buffer that already holds the user's
+        template, or None to upload it into CHAR_BUFFER_2 first
+        :return, int: page holding the template
+        """
+        page_id = self._pages.get(user)
+        if page_id is not None:
+            return page_id
+
+        if buffer_id is None:
+            buffer_id = CHAR_BUFFER_2
+            self.sensor.upload_char_buffer(buffer_id, self.store.get(user))
+
+        if self._free:
+            page_id = self._free.pop()
+        else:
+            page_id = self._pages.pop(self._victim())
+            del self._users[page_id]
+
+        # Storing over the victim's page replaces it, no delete needed
+        self.sensor.store_template(buffer_id, page_id)
+        self._pages[user] = page_id
+        self._users[page_id] = user
+        return page_id
+
+    def evict(self, user):
+        """
+        Delete a cached user's template from the module. The store keeps it.
+
+        :param user, str:
+        :return:
+        """
+        page_id = self._pages[user]
+        self.sensor.delete_template(page_id, 1)
+        del self._pages[user]
+        del self._users[page_id]
+        self._free.append(page_id)
+
+    def identify(self, timeout=10):
+        """
+        Capture a finger and search for it.
+
+        :param timeout: seconds to wait for a finger
+        :return, IdentifyResult: or None when no finger was placed or it
+        matches nobody
+        """
+        if not self.sensor.wait_for_finger(timeout):
+            return None
+
+        result = self.sensor.generate_charfile_image(CHAR_BUFFER_1)
+        if result is not None and not result.ok:
+            # Unusable image on a sensor that is not strict
+            return None
+        return self.search()
+
+    def search(self):
+        """
+        Search for the character file in CHAR_BUFFER_1, first on the module
+        and then on the host. Overwrites CHAR_BUFFER_2.
+
+        :return, IdentifyResult: or None when it matches nobody
+        """
+        if self._pages:
+            page_id, score = self.sensor.search_library(
+                CHAR_BUFFER_1, self.first_page, self.capacity)
+            user = self._users.get(page_id)
+            if user is not None:
+                self.flash_hits += 1
+                self._matched(user)
+                return IdentifyResult(user, score, page_id, SOURCE_FLASH)
+
+        candidates = ((user, self.store.get(user)) for user in
+                      self._by_frequency(user for user in self.store
+                                         if user not in self._pages))
+        user, score = self.sensor.match_candidates(candidates)
+        if user is None:
+            self.rejects += 1
+            return None
+
+        # The matching template is still in CHAR_BUFFER_2
+        page_id = self.page_in(user, CHAR_BUFFER_2)
+        self.host_hits += 1
+        self._matched(user)
+        return IdentifyResult(user, score, page_id, SOURCE_HOST)
+
+    def _matched(self, user):
+        self.matches[user] += 1
+        self._pages.move_to_end(user)
+
+    def _by_frequency(self, users):
+        matches = self.matches
+        return sorted(users, key=lambda user: -matches[user])
+
+    def _victim(self):
+        if self.policy == 'lru':
+            return next(iter(self._pages))
+
+        # Least matches, the least recently matched of those on a tie
+        matches = self.matches
+        return min(self._pages, key=lambda user: matches[user])
+
+
+class AdaptiveSearch:
+    """
+    Searches a range of the library hot pages first.
+
+    The number of matches of every page is counted. A search runs over the
+    ``hot_size`` pages at the start of the range first, and over the rest
+    only when the hot pages hold no match. relocate swaps the most matched
+    templates into the hot pages, every ``relocate_every`` searches when
+    set. Relocating changes page ids: ``on_relocate`` is called with a dict
+    of old page id to new page id so callers can update their records.
+
+    Usage::
+
+        search = AdaptiveSearch(sensor, hot_size=100, relocate_every=500,
+                                on_relocate=users.renumber)
+        page_id, score = search.identify()
+        print(search.metrics())
+    """
+
+    def __init__(self, sensor, first_page=0, count=None, hot_size=None,
+                 relocate_every=None, on_relocate=None,
+                 buffer_id=CHAR_BUFFER_1):
+        """
+        :param sensor: connected Sensor
+        :param first_page: first page of the searched range
+        :param count: number of pages searched, by default to the end of
+        the library
+        :param hot_size: number of hot pages at the start of the range, a
+        tenth of the range by default
+        :param relocate_every: relocate after this many searches, never when
+        None
+        :param on_relocate: optional callable(moves) called after templates
+        were moved
+        :param buffer_id: character buffer the captured finger is extracted
+        into
+        """
+        if count is None:
+            count = sensor.profile.library_size - first_page
+        if hot_size is None:
+            hot_size = max(count // 10, 1)
+
+        self.sensor = sensor
+        self.first_page = first_page
+        self.count = count
+        self.hot_size = min(hot_size, count)
+        self.relocate_every = relocate_every
+        self.on_relocate = on_relocate
+        self.buffer_id = buffer_id
+        self.matches = collections.Counter()
+        self.searches = 0
+        self.hot_hits = 0
+        self.cold_hits = 0
+        self.misses = 0
+        self.relocations = 0
+        # Total seconds spent in searches answered by the hot pages, and in
+        # searches that had to go over the whole range
+        self._hot_time = 0.0
+        self._full_time = 0.0
+
+    def identify(self, timeout=10):
+        """
+        Capture a finger and search for it.
+
+        :param timeout: seconds to wait for a finger
+        :return: (page_id, score), (None, 0) when no finger was placed or it
+        matches no page
+        """
+        if not self.sensor.wait_for_finger(timeout):
+            return None, 0
+
+        result = self.sensor.generate_charfile_image(self.buffer_id)
+        if result is not None and not result.ok:
+            # Unusable image on a sensor that is not strict
+            return None, 0
+        return self.search()
+
+    def search(self):
+        """
+        Search for the character file already in buffer_id.
+
+        :return: (page_id, score), (None, 0) when it matches no page
+        """
+        start = time.monotonic()
+        page_id, score = self.sensor.search_library(
+            self.buffer_id, self.first_page, self.hot_size)
+
+        if page_id is not None:
+            self._hot_time += time.monotonic() - start
+            self.hot_hits += 1
+        else:
+            cold_size = self.count - self.hot_size
+            if cold_size:
+                page_id, score = self.sensor.search_library(
+                    self.buffer_id, self.first_page + self.hot_size,
+                    cold_size)
+            self._full_time += time.monotonic() - start
+            if page_id is not None:
+                self.cold_hits += 1
+            else:
+                self.misses += 1
+
+        self.searches += 1
+        if page_id is not None:
+            self.matches[page_id] += 1
+
+        if self.relocate_every and \
+                self.searches % self.relocate_every == 0:
+            # Report where the matched template lives from now on
+            page_id = self.relocate().get(page_id, page_id)
+
+        return page_id, score
+
+    def relocate(self):
+        """
+        Move the most matched templates into the hot pages, swapping them
+        with the least matched hot templates. Match counts are halved
+        afterwards so the ranking follows changes in who uses the sensor.
+
+        :return, dict: old page id to new page id of every moved template
+        """
+        hot_end = self.first_page + self.hot_size
+        matches = self.matches
+        wanted = [page_id for page_id, _ in matches.most_common(self.hot_size)]
+        wanted_set = set(wanted)
+
+        promote = [page_id for page_id in wanted if page_id >= hot_end]
+        demote = sorted((page_id for page_id in
+                         range(self.first_page, hot_end)
+                         if page_id not in wanted_set),
+                        key=lambda page_id: matches[page_id])
+
+        moves = {}
+        for cold, hot in zip(promote, demote):
+            self._swap(cold, hot)
+            moves[cold] = hot
+            moves[hot] = cold
+            matches[cold], matches[hot] = matches[hot], matches[cold]
+
+        for page_id in list(matches):
+            matches[page_id] //= 2
+            if not matches[page_id]:
+                del matches[page_id]
+
+        self.relocations += 1
+        if moves and self.on_relocate is not None:
+            self.on_relocate(moves)
+
+        return moves
+
+    def _swap(self, cold, hot):
+        """
+        Exchange the templates of two pages through both character buffers.
+        """
+        sensor = self.sensor
+        index = sensor.library_index
+        if index is None:
+            index = sensor.load_library_index()
+
+        sensor.read_template(CHAR_BUFFER_2, cold)
+        if index.is_used(hot):
+            sensor.read_template(CHAR_BUFFER_1, hot)
+            sensor.store_template(CHAR_BUFFER_1, cold)
+        else:
+            sensor.delete_template(cold, 1)
+        sensor.store_template(CHAR_BUFFER_2, hot)
+
+    def metrics(self):
+        """
+        :return, dict: search counts, the share answered by the hot pages,
+        mean search times and the time saved by searching hot pages first,
+        estimated from the mean time of a search over the whole range
+        """
+        full_searches = self.cold_hits + self.misses
+        hot_mean = self._hot_time / self.hot_hits if self.hot_hits else None
+        full_mean = self._full_time / full_searches if full_searches else None
+        saved = None
+        if hot_mean is not None and full_mean is not None:
+            saved = self.hot_hits * (full_mean - hot_mean)
+
+        return {
+            'searches': self.searches,
+            'hot_hits': self.hot_hits,
+            'cold_hits': self.cold_hits,
+            'misses': self.misses,
+            'hot_hit_rate': self.hot_hits / self.searches if self.searches
+            else None,
+            'relocations': self.relocations,
+            'hot_search_s': hot_mean,
+            'full_search_s': full_mean,
+            'saved_s': saved,
+        }
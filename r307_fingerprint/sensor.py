@@ -0,0 +1,1262 @@
+"""
+Blocking front end for a module on a serial port.
+"""
+import collections
+import contextlib
+import logging
+import os
+import time
+
+from .constants import *
+from .constants import _LINK_PROBE_PATTERN, _NO_FINGER_CCS, _RECAPTURE_CCS
+from .deadlines import CommandDeadlines
+from .errors import CommandError, ProtocolError, SensorError, _STATUSES
+from .image import _fill_image, _image_view
+from .library import _LibraryKeeper, read_library_file
+from .protocol import DeviceProfile, FrameDecoder, FrameEncoder, _ACK_PIDS, \
+    _DATA_PIDS, _IDEMPOTENT_COMMANDS, _NEGATIVE_OUTCOMES, _IdentifyCycle, \
+    _address_args, _capture_result, _check_cc, _check_pid, _command_data, \
+    _data_packets, _delete_args, _index_table_args, _match_reply, \
+    _notepad_args, _notepad_page_args, _notepad_reply, _page_count, \
+    _parameter_args, _parse_parameters, _password_args, _port_control_args, \
+    _search_args, _search_reply, _status_result, _template_args, \
+    _verification_args, _verification_reply
+
+logger = logging.getLogger(__name__)
+
+# Errors of an exchange over a link whose rate or packet length the two
+# ends disagree on: lost or garbled frames, or the module rejecting a
+# garbled packet
+_LINK_ERRORS = (ProtocolError, CommandError)
+
+
+# Result of Sensor.enroll: the page the template was stored at, seconds
+# spent per stage and number of retries per stage, both keyed by stage name,
+# and the total duration in seconds
+EnrollResult = collections.namedtuple(
+    'EnrollResult', 'page_id timings retries duration')
+
+
+class Sensor:
+    def __init__(self, port, baudrate, strict=True, retries=DEFAULT_RETRIES,
+                 timeout=3, handshake_timeout=None, connect=True,
+                 deadlines=None, stamp_library=False):
+        """
+
+        :param port: serial port name, or an already open serial-like object
+        such as r307_fingerprint.virtual.VirtualSensor
+        :param baudrate:
+        :param strict: when False, generate_image, generate_charfile_image,
+        generate_template, match_template and the fingerprint verification
+        commands return Result, MatchResult or SearchResult objects, and
+        expected negative outcomes such as no finger or no match are returned
+        instead of raised as CommandError
+        :param retries: times an idempotent command or a download is sent
+        again after a framing error or lost packet
+        :param timeout: seconds to wait for a reply until the command's
+        latency has been learned, see CommandDeadlines
+        :param handshake_timeout: see connect
+        :param connect: when False nothing is opened or sent until connect
+        is called
+        :param deadlines: CommandDeadlines to use instead of a new one
+        learning from this sensor
+        :param stamp_library: keep a library stamp in notepad page
+        LIBRARY_STAMP_PAGE, renewed before every store_template,
+        delete_template and empty_fingerprint_library, so a saved
+        LibraryIndex can be checked with one read, see load_library_index.
+        Off by default: each renewal costs a notepad read or write
+        """
+        self._port = port
+        self._baudrate = baudrate
+        self._timeout = timeout
+        self._serial = None
+        if hasattr(port, 'read') and hasattr(port, 'write'):
+            self._serial = port
+        self._password = bytes.fromhex('00000000')
+        self._address = DEFAULT_ADDRESS
+        self._encoder = FrameEncoder(self._address)
+        self._decoder = FrameDecoder(self._address)
+        # Parameters last read from the module, kept current by the setters
+        self._profile = None
+        # Set when a reply was left half read
+        self._stale = False
+        # Read timeout last set on the port, and fixed deadlines of a
+        # deadline block
+        self._read_timeout = None
+        self._deadline = None
+        self._library = _LibraryKeeper(stamp_library)
+        self.strict = strict
+        self.retries = retries
+        self.deadlines = deadlines if deadlines is not None else \
+            CommandDeadlines(default=timeout)
+        self.instrumentation = None
+
+        if connect:
+            self.connect(handshake_timeout)
+
+    def connect(self, handshake_timeout=None):
+        """
+        Open the serial port if it is not open yet and verify the password.
+        pyserial is only imported here, when a port name has to be opened.
+
+        :param handshake_timeout: seconds to wait for the reply to the
+        password check, the port's read timeout when None
+        :return, Sensor: self
+        """
+        if self._serial is None:
+            from serial import Serial
+
+            self._serial = Serial(self._port, baudrate=self._baudrate,
+                                  timeout=self._timeout)
+            self._read_timeout = self._timeout
+            self._stale = False
+            self._decoder.reset()
+
+        with self.deadline(handshake_timeout):
+            self.verify_password()
+
+        return self
+
+    def close(self):
+        """
+        Close the serial port. A port opened by name is opened again by the
+        next connect.
+
+        :return:
+        """
+        if self._serial is None:
+            return
+        if hasattr(self._serial, 'close'):
+            self._serial.close()
+        if self._serial is not self._port:
+            self._serial = None
+
+    @contextlib.contextmanager
+    def deadline(self, timeout=None, frame_timeout=None):
+        """
+        Use fixed deadlines instead of the learned ones for the commands run
+        in a with block::
+
+            with sensor.deadline(15):
+                sensor.auto_fingerprint_verification()
+
+        :param timeout: seconds to wait for each acknowledgement, None for
+        the learned deadline
+        :param frame_timeout: seconds to wait for each data packet, None for
+        the learned deadline
+        """
+        saved = self._deadline
+        self._deadline = (timeout, frame_timeout)
+        try:
+            yield self
+        finally:
+            self._deadline = saved
+
+    def __set_read_timeout(self, timeout):
+        # Changing a pyserial timeout reconfigures the port, skip no-ops
+        if timeout != self._read_timeout:
+            self._serial.timeout = timeout
+            self._read_timeout = timeout
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def instrumentation(self):
+        """Instrumentation hooks, None to skip them"""
+        return self._instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, hooks):
+        self._instrumentation = hooks
+        self._decoder.on_fault = None if hooks is None else hooks.fault
+
+    @property
+    def library_index(self):
+        """LibraryIndex kept current by this sensor, None until loaded"""
+        return self._library.index
+
+    @library_index.setter
+    def library_index(self, index):
+        self._library.index = index
+
+    @property
+    def stamp_library(self):
+        """Whether library changes renew the library stamp"""
+        return self._library.stamp_library
+
+    @stamp_library.setter
+    def stamp_library(self, stamp_library):
+        self._library.stamp_library = stamp_library
+
+    def verify_password(self):
+        """
+
+        :return:
+        """
+        self.__execute(IC_VERIFY_PASSWORD, self._password)
+
+    def generate_image(self, timeout=2):
+        """
+        Capture a fingerprint image, giving the user up to timeout seconds
+        to place a finger. Returns as soon as the image is captured.
+
+        :param timeout: seconds to wait for a finger, polling the capture
+        command; each poll keeps its own command deadline
+        :return: None, or a Result when the sensor is not strict
+        """
+        return _capture_result(self.wait_for_finger(timeout), self.strict)
+
+    def wait_for_finger(self, timeout=10, poll_interval=0.2, cancel=None):
+        """
+        Poll the capture command until a finger is on the glass and its
+        image has been captured.
+
+        Polling starts at FINGER_POLL_MIN_INTERVAL and backs off to
+        poll_interval while no finger is present.
+
+        :param timeout: seconds to wait, None to wait until cancelled
+        :param poll_interval: longest pause between two polls
+        :param cancel: optional threading.Event; setting it stops the wait
+        :return, bool: True when an image was captured, False on timeout or
+        cancellation
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = min(FINGER_POLL_MIN_INTERVAL, poll_interval)
+
+        while True:
+            cc = self.__send_command(IC_GENERATE_IMAGE)[0:1]
+            if cc not in _NO_FINGER_CCS:
+                _check_cc(IC_GENERATE_IMAGE, cc)
+                return True
+
+            wait = interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return False
+
+            if cancel is not None:
+                if cancel.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+            interval = min(interval * FINGER_POLL_BACKOFF, poll_interval)
+
+    def iter_image_packets(self):
+        """
+        Request the image buffer and yield the content of each data packet
+        as it arrives. Every item is only valid until the next one is
+        requested.
+
+        :return: generator of memoryview
+        """
+        self.__execute(IC_DOWNLOAD_IMAGE)
+        return self.__receive_data(IC_DOWNLOAD_IMAGE)
+
+    def download_image(self, dest=None):
+        """
+        Download the image held in the module's image buffer.
+
+        The data is packed, two 4-bit pixels per byte; use unpack_image,
+        image_to_pil or image_to_array to get 8-bit pixels.
+
+        :param dest: None to get a new buffer back, a writable buffer of at
+        least IMAGE_SIZE bytes to fill in place, or a file object or path the
+        packed data is streamed to as it arrives
+        :return: the packed image when dest is None, otherwise the number of
+        bytes received
+        """
+        if dest is None:
+            image = bytearray(IMAGE_SIZE)
+            received = self.download_image(image)
+            del image[received:]
+            return image
+
+        if isinstance(dest, (str, os.PathLike)):
+            with open(dest, 'wb') as file:
+                return self.download_image(file)
+
+        retries = self.retries
+        position = None
+        if hasattr(dest, 'write'):
+            if hasattr(dest, 'seekable') and dest.seekable():
+                position = dest.tell()
+            else:
+                # What was streamed already cannot be taken back
+                retries = 0
+        else:
+            dest = _image_view(dest)
+
+        def transfer():
+            # A retry starts the image over
+            if position is not None and dest.tell() != position:
+                dest.seek(position)
+                dest.truncate()
+            try:
+                return _fill_image(dest, self.iter_image_packets())
+            except Exception:
+                # The rest of the image must not be taken for the next reply
+                self.__drain_stale()
+                raise
+
+        return self.__retrying(retries, transfer)
+
+    def generate_charfile_image(self, buffer_id):
+        """
+        :param buffer_id:
+        :return: None, or a Result when the sensor is not strict
+        """
+        status = self.__outcome(IC_GENERATE_CHARACTERISTICS, buffer_id)[0]
+        return _status_result(status, self.strict)
+
+    def generate_template(self):
+        """
+
+        :return: None, or a Result when the sensor is not strict
+        """
+        status = self.__outcome(IC_GENERATE_TEMPLATE)[0]
+        return _status_result(status, self.strict)
+
+    def download_char_buffer(self, buffer_id):
+        """
+
+        :param buffer_id:
+        :return, bytes: content of the character buffer
+        """
+        def transfer():
+            self.__execute(IC_DOWNLOAD_CHAR_BUFFER, buffer_id)
+
+            char_rcv = bytearray()
+            for content in self.__receive_data(IC_DOWNLOAD_CHAR_BUFFER):
+                char_rcv += content
+
+            return bytes(char_rcv)
+
+        return self.__retrying(self.retries, transfer)
+
+    def __send_packet(self, pid, content):
+        """
+
+        :param pid:
+        :param content:
+        :return:
+        """
+        frame = self._encoder.encode(pid, content)
+        self._serial.write(frame)
+
+        if self._instrumentation is not None:
+            self._instrumentation.frame_sent(pid, len(frame))
+
+    def __receive_packet(self, expected):
+        """
+
+        :param expected: _ACK_PIDS or _DATA_PIDS
+        :return: pid and content, content is only valid until the next
+        packet is received
+        """
+        hooks = self._instrumentation
+        try:
+            pid, content = self._decoder.read_frame(self._serial)
+            _check_pid(pid, expected)
+        except ProtocolError as error:
+            # The rest of the reply must not be taken for the next one
+            self._stale = True
+            if hooks is not None:
+                hooks.fault(error.kind)
+            raise
+
+        if hooks is not None:
+            hooks.frame_received(pid, FRAME_PREFIX_SIZE + len(content) +
+                                 CHECKSUM_SIZE)
+        return pid, content
+
+    def __receive_data(self, command):
+        """
+        Yield the content of data packets up to and including the end of
+        data packet, each awaited for the command's frame deadline.
+
+        :param command: instruction code that started the transfer
+        :return: generator of memoryview
+        """
+        deadlines = self.deadlines
+        timeout = None if self._deadline is None else self._deadline[1]
+        learned = timeout is None
+        if learned:
+            timeout = deadlines.frame_timeout(command)
+        self.__set_read_timeout(timeout)
+
+        start = time.perf_counter()
+        while True:
+            try:
+                pid, content = self.__receive_packet(_DATA_PIDS)
+            except ProtocolError as error:
+                if learned and error.kind == 'timeout':
+                    deadlines.frame_expired(command, timeout)
+                raise
+            now = time.perf_counter()
+            deadlines.observe_frame(command, now - start)
+
+            yield content
+            start = time.perf_counter()
+
+            if pid == PID_EOD:
+                break
+
+    def __send_data(self, data):
+        """
+        Send data as a run of data packets ending with an end of data packet.
+
+        :param data, bytes-like:
+        :return:
+        """
+        for pid, content in _data_packets(data, self.profile.packet_size):
+            self.__send_packet(pid, content)
+
+    def __send_command(self, command, *args):
+        """
+        Send a command and receive its acknowledgement, sending idempotent
+        commands again after a framing error or lost packet.
+
+        :param command: bytes
+        :param args: other parameters for the command
+        :return, bytes: the acknowledgement
+        """
+        data = _command_data(command, args)
+        retries = self.retries if command in _IDEMPOTENT_COMMANDS else 0
+        return self.__retrying(retries, self.__exchange, command, data)
+
+    def __retrying(self, retries, call, *args):
+        """
+        Run call, running it again up to retries times after a framing error
+        or lost packet with a doubling delay in between.
+        """
+        attempt = 0
+        while True:
+            try:
+                return call(*args)
+            except ProtocolError as error:
+                if attempt >= retries:
+                    raise
+                logger.info("retrying after %s", error)
+
+            time.sleep(min(RETRY_DELAY * 2 ** attempt, RETRY_MAX_DELAY))
+            attempt += 1
+
+    def __drain_stale(self):
+        """
+        Discard the rest of an abandoned or garbled reply, waiting until the
+        module has been quiet for STALE_QUIET seconds.
+        """
+        deadline = time.monotonic() + STALE_DRAIN_LIMIT
+        self.__drain()
+        while hasattr(self._serial, 'in_waiting') and \
+                time.monotonic() < deadline:
+            time.sleep(STALE_QUIET)
+            if not self._serial.in_waiting:
+                break
+            self.__drain()
+
+        self._stale = False
+
+    def __exchange(self, command, data):
+        """
+        :param command: bytes
+        :param data: the command and its parameters
+        :return, bytes: the acknowledgement
+        """
+        if self._stale:
+            self.__drain_stale()
+
+        deadlines = self.deadlines
+        size = _page_count(data)
+        timeout = None if self._deadline is None else self._deadline[0]
+        learned = timeout is None
+        if learned:
+            timeout = deadlines.timeout(command, size)
+        self.__set_read_timeout(timeout)
+
+        hooks = self._instrumentation
+        start = time.perf_counter()
+        self.__send_packet(PID_COMMAND, data)
+        try:
+            cc = self.__receive_packet(_ACK_PIDS)[1]
+        except ProtocolError as error:
+            if learned and error.kind == 'timeout':
+                deadlines.expired(command, timeout, size)
+            raise
+        seconds = time.perf_counter() - start
+
+        # Acknowledgements are small, copy them out of the receive buffer
+        ack = bytes(cc)
+        deadlines.observe(command, seconds, size)
+        if hooks is not None:
+            hooks.command(command, ack[0:1], seconds)
+        return ack
+
+    def __execute(self, command, *args):
+        """
+        Send a command and raise if it failed.
+
+        :param command: bytes
+        :param args: other parameters for the command
+        :return, bytes: the acknowledgement after the confirmation code
+        """
+        data = self.__send_command(command, *args)
+        _check_cc(command, data[0:1])
+        return data[1:]
+
+    def __outcome(self, command, *args):
+        """
+        Like __execute, but when the sensor is not strict the expected
+        negative outcomes of the command are returned instead of raised.
+
+        :param command: bytes
+        :param args: other parameters for the command
+        :return: Status and the acknowledgement after the confirmation code
+        """
+        data = self.__send_command(command, *args)
+        accept = () if self.strict else _NEGATIVE_OUTCOMES[command]
+        return _check_cc(command, data[0:1], accept), data[1:]
+
+    def __run(self, steps, calls=None):
+        """
+        Run the steps of an operation shared with AsyncSensor, see
+        library._LibraryKeeper.
+
+        :param steps: step generator
+        :param calls: callables by step name, None to call the sensor's
+        method of that name
+        :return: the result of the operation
+        """
+        reply = error = None
+        try:
+            while True:
+                try:
+                    if error is None:
+                        step = steps.send(reply)
+                    else:
+                        step = steps.throw(error)
+                except StopIteration as stop:
+                    return stop.value
+
+                call = getattr(self, step[0]) if calls is None else \
+                    calls[step[0]]
+                reply = error = None
+                try:
+                    reply = call(*step[1:])
+                except SensorError as raised:
+                    error = raised
+        finally:
+            steps.close()
+
+    # Set Password - D
+    def set_password(self, new_password):
+        self.__execute(IC_SET_PASSWORD, *_password_args(new_password))
+
+    # Set Module Address - A
+    def set_address(self, address):
+        args = _address_args(address)
+        self.__execute(IC_SET_ADDRESS, *args)
+        # The module answers under the old address and only listens on the
+        # new one from then on
+        self._address = args[0]
+        self._encoder.address = self._address
+        self._decoder.address = self._address
+        self.__update_profile(address=self._address)
+
+    # Set module system's basic parameter - D
+
+    def __set_parameters(self, pn, n):
+        self.__execute(IC_SET_PARAMETERS, *_parameter_args(pn, n))
+
+    def set_baudrate(self, n):
+        """
+        Change the module's baud rate to n * 9600. The host port keeps its
+        rate; use switch_baudrate or negotiate_link to switch both.
+
+        :param n, int: 1 to 12
+        :return:
+        """
+        self.__set_parameters(PN_BAUD_RATE, n)
+        self.__update_profile(baud_setting=n)
+        # Latencies seen at the old rate no longer apply
+        self.deadlines.reset()
+
+    def set_security_level(self, n):
+        self.__set_parameters(PN_SECURITY_LEVEL, n)
+        self.__update_profile(security_level=n)
+
+    def set_package_length(self, n):
+        self.__set_parameters(PN_PACKAGE_LEN, n)
+        self.__update_profile(package_length=n)
+        self.deadlines.reset()
+
+    # Link speed negotiation
+    def negotiate_link(self, max_baudrate=115200, package_length=3,
+                       probes=2, probe_timeout=0.5, settle=0.05):
+        """
+        Move the link to the fastest baud rate and largest data packet that
+        work, reopening the host port at the new rate.
+
+        Each candidate is checked by writing a test pattern to character
+        buffer 1 and reading it back, so the buffer's content is lost. When
+        a candidate fails the previous setting is restored; when the module
+        cannot be reached at either rate every rate in LINK_BAUD_SETTINGS is
+        tried to find it.
+
+        :param max_baudrate: fastest rate the host adapter supports
+        :param package_length: largest package length setting to try, 0-3
+        :param probes: test transfers a candidate must pass
+        :param probe_timeout: read timeout in seconds while negotiating
+        :param settle: seconds to wait after switching the host rate
+        :return: (baudrate, packet_size) in use afterwards
+        """
+        profile = self.read_profile()
+        baud = profile.baud_setting
+        length = profile.package_length
+
+        retries = self.retries
+        # A failed probe means the candidate does not work, don't retry it
+        self.retries = 0
+        try:
+            with self.deadline(probe_timeout, probe_timeout):
+                for candidate in LINK_BAUD_SETTINGS:
+                    if candidate <= baud:
+                        break
+                    if candidate * 9600 > max_baudrate:
+                        continue
+                    if self.__try_baudrate(baud, candidate, probes, settle):
+                        baud = candidate
+                        break
+
+                for candidate in range(package_length, length, -1):
+                    if self.__try_package_length(length, candidate, probes):
+                        length = candidate
+                        break
+        finally:
+            self.retries = retries
+
+        return baud * 9600, PACKET_SIZES[length]
+
+    def switch_baudrate(self, n, probes=1, settle=0.05):
+        """
+        Move the module and the host port to baud rate n * 9600, checking
+        the link at the new rate as negotiate_link does, so character
+        buffer 1 is overwritten.
+
+        :param n, int: 1 to 12
+        :param probes: test transfers the new rate must pass
+        :param settle: seconds to wait after switching the host rate
+        :return:
+        :raises ProtocolError: the link does not work at the new rate, the
+        old one is back in use
+        """
+        current = self.read_profile().baud_setting
+        if n == current:
+            return
+
+        retries = self.retries
+        self.retries = 0
+        try:
+            switched = self.__try_baudrate(current, n, probes, settle)
+        finally:
+            self.retries = retries
+        if not switched:
+            raise ProtocolError("The link does not work at %d baud"
+                                % (n * 9600), 'link')
+
+    def __try_baudrate(self, current, candidate, probes, settle):
+        """
+        :return, bool: whether the module now runs at the candidate rate
+        """
+        self.set_baudrate(candidate)
+        self.__set_host_baudrate(candidate, settle)
+        if self.__probe_link(probes):
+            return True
+
+        # Either the module keeps its old rate until it is reset, or the
+        # adapter cannot keep up with the new one
+        self.__set_host_baudrate(current, settle)
+        if self.__probe_link(1):
+            self.set_baudrate(current)
+            return False
+
+        self.__set_host_baudrate(candidate, settle)
+        try:
+            self.set_baudrate(current)
+        except _LINK_ERRORS:
+            pass
+        self.__set_host_baudrate(current, settle)
+        if self.__probe_link(1):
+            return False
+
+        for setting in LINK_BAUD_SETTINGS:
+            self.__set_host_baudrate(setting, settle)
+            if self.__probe_link(1):
+                self.set_baudrate(current)
+                self.__set_host_baudrate(current, settle)
+                if self.__probe_link(1):
+                    return False
+        raise ProtocolError("Lost the module while changing the baud rate",
+                            'link')
+
+    def __try_package_length(self, current, candidate, probes):
+        """
+        :return, bool: whether the module now uses the candidate length
+        """
+        self.set_package_length(candidate)
+        if self.__probe_link(probes):
+            return True
+
+        self.set_package_length(current)
+        return False
+
+    def __set_host_baudrate(self, setting, settle):
+        self._serial.baudrate = setting * 9600
+        self.deadlines.reset()
+        time.sleep(settle)
+        self.__drain()
+
+    def __drain(self):
+        """
+        Drop whatever is waiting in the port and the receive buffer.
+        """
+        if hasattr(self._serial, 'reset_input_buffer'):
+            self._serial.reset_input_buffer()
+        self._decoder.reset()
+
+    def __probe_link(self, transfers):
+        """
+        :param transfers: test patterns to send and read back
+        :return, bool: whether every exchange came back intact
+        """
+        try:
+            self.verify_password()
+            for _ in range(transfers):
+                self.upload_char_buffer(CHAR_BUFFER_1, _LINK_PROBE_PATTERN)
+                if self.download_char_buffer(CHAR_BUFFER_1) != \
+                        _LINK_PROBE_PATTERN:
+                    return False
+        except _LINK_ERRORS:
+            self.__drain()
+            return False
+
+        return True
+
+
+    # Port Control - A
+    def set_port_control(self, val):
+        """
+
+        :param val, bool:
+        :return:
+        """
+        self.__execute(IC_SET_PORT_CONTROL, *_port_control_args(val))
+
+    # Read system Parameter - D
+    def read_parameters(self):
+        data = self.__execute(IC_READ_PARAMETERS)
+        logger.debug("parameters %s", data.hex())
+
+        self._profile = DeviceProfile.from_parameters(data)
+        return _parse_parameters(data)
+
+    def read_profile(self):
+        """
+        Read the module's parameters afresh.
+
+        :return, DeviceProfile:
+        """
+        self.read_parameters()
+        return self._profile
+
+    @property
+    def profile(self):
+        """
+        The module's parameters as a DeviceProfile, read once and then kept
+        current by set_address, set_baudrate, set_security_level and
+        set_package_length.
+        """
+        if self._profile is None:
+            self.read_parameters()
+        return self._profile
+
+    def __update_profile(self, **fields):
+        if self._profile is not None:
+            self._profile = self._profile._replace(**fields)
+
+    def __check_pages(self, page_id, n=1):
+        """
+        Refuse pages outside the library when its size is known, instead of
+        sending a command the module will reject.
+        """
+        if self._profile is not None:
+            self._profile.check_pages(page_id, n)
+
+    # Read valid template number - A
+    def read_valid_template_num(self):
+        return self.__execute(IC_READ_TEMPLATE_NUM)
+
+    # Read index table - A
+    def read_index_table(self, index_page):
+        """
+
+        :param index_page, int: 0 for pages 0-255, 1 for 256-511 and so on
+        :return, bytes: 32 bytes, bit j of byte i set when page
+        index_page * 256 + i * 8 + j holds a template
+        """
+        return self.__execute(IC_READ_INDEX_TABLE,
+                              *_index_table_args(index_page))
+
+    def load_library_index(self, cached=None):
+        """
+        Read the occupancy of the whole library with the index table command
+        and keep it on the sensor as library_index.
+
+        With stamp_library set, a module without a library stamp is given
+        one, so the index can be cached.
+
+        :param cached: LibraryIndex saved earlier; used as is when its stamp
+        is the module's library stamp, so nothing else is read
+        :return, LibraryIndex:
+        """
+        return self.__run(self._library.load_index(cached, self._profile))
+
+    def read_library_stamp(self):
+        """
+        :return, LibraryStamp: the stamp in notepad page LIBRARY_STAMP_PAGE,
+        None when the page holds none
+        """
+        return self.__run(self._library.read_stamp())
+
+    @contextlib.contextmanager
+    def library_change(self):
+        """
+        Stamp the library once for all the changes made in the block
+        instead of before each one::
+
+            with sensor.library_change():
+                for page_id in pages:
+                    sensor.delete_template(page_id, 1)
+        """
+        library = self._library
+        if library.stamped:
+            yield self
+            return
+
+        self.__run(library.stamp_change())
+        library.stamped = True
+        try:
+            yield self
+        finally:
+            library.stamped = False
+
+    # Fingerprint verification - D
+    def fingerprint_verification(self, capture_time, start_bit,
+                                 search_quantity):
+        status, rcv_data = self.__outcome(
+            IC_FINGERPRINT_VERIFICATION,
+            *_verification_args(capture_time, start_bit, search_quantity))
+
+        return _verification_reply(status, rcv_data, self.strict)
+
+    # automatic fingerprint verification - A
+    def auto_fingerprint_verification(self):
+        status, rcv_data = self.__outcome(IC_AUTO_FINGERPRINT_VERIFICATION)
+
+        return _verification_reply(status, rcv_data, self.strict)
+
+    # upload character file or template - A
+    def upload_char_buffer(self, buffer_id, template):
+        """
+        Load a template or character file, as returned by
+        download_char_buffer, into a character buffer.
+
+        :param buffer_id, bytes:
+        :param template, bytes-like:
+        :return:
+        """
+        self.__execute(IC_UPLOAD_CHAR_BUFFER, buffer_id)
+        self.__send_data(template)
+
+    # To store template - D
+    def store_template(self, buffer_id, page_id):
+        self.__check_pages(page_id)
+        self.__run(self._library.stamp_change())
+        self.__execute(IC_STORE_TEMPLATE, *_template_args(buffer_id, page_id))
+        self._library.stored(page_id)
+
+    # To Read template from flash library - A
+    def read_template(self, buffer_id, page_id):
+        """
+
+        :param buffer_id, bytes:
+        :param page_id, int:
+        :return:
+        """
+        self.__check_pages(page_id)
+        self.__execute(IC_READ_TEMPLATE, *_template_args(buffer_id, page_id))
+
+    # To delete template - D
+    def delete_template(self, page_id, n):
+        self.__check_pages(page_id, n)
+        self.__run(self._library.stamp_change())
+        self.__execute(IC_DELETE_TEMPLATE, *_delete_args(page_id, n))
+        self._library.deleted(page_id, n)
+
+    # To empty finger library - A
+    def empty_fingerprint_library(self):
+        self.__run(self._library.stamp_change())
+        self.__execute(IC_EMPTY_FINGERPRINT_LIBRARY)
+        self._library.emptied()
+
+    def delete_templates(self, page_ids):
+        """
+        Delete a set of pages with as few commands as possible: each run of
+        adjacent pages is one delete_template. Only the pages asked for are
+        deleted, whatever the library index says about them. A run the
+        module refuses does not stop the others.
+
+        :param page_ids: iterable of int
+        :return, BatchResult:
+        """
+        return self.__run(self._library.delete_templates(page_ids))
+
+    def store_templates(self, templates, buffer_id=CHAR_BUFFER_1):
+        """
+        Store templates at their pages back to back, stamping the library
+        once. A template the module refuses does not stop the others.
+
+        :param templates: mapping or iterable of (page_id, template)
+        :param buffer_id: character buffer used for the transfer
+        :return, BatchResult:
+        """
+        return self.__run(self._library.store_templates(templates, buffer_id))
+
+    def read_templates(self, page_ids, buffer_id=CHAR_BUFFER_1):
+        """
+        Read the templates of a set of pages back to back. With a library
+        index whose stamp still matches the module's, pages it knows to be
+        free are skipped.
+
+        :param page_ids: iterable of int
+        :param buffer_id: character buffer used for the transfer
+        :return, dict: template bytes by page_id, without the pages the
+        module could not read
+        """
+        return self.__run(self._library.read_templates(page_ids, buffer_id))
+
+    # To carry out precise matching of two fingerprint template - D
+    def match_template(self):
+        status, match_score = self.__outcome(IC_MATCH_TEMPLATE)
+        return _match_reply(status, match_score, self.strict)
+
+
+    # To search finger library - A
+    def search_library(self, buffer_id, start_page, count):
+        """
+        Search count pages of the library from start_page for the character
+        file in buffer_id. Not finding a match is not an error.
+
+        :param buffer_id, bytes:
+        :param start_page, int:
+        :param count, int:
+        :return: (page_id, score) of the match, (None, 0) when there is none
+        """
+        return _search_reply(self.__send_command(
+            IC_SEARCH, *_search_args(buffer_id, start_page, count)))
+
+    def match_candidates(self, candidates):
+        """
+        Search templates held on the host for the character file in
+        CHAR_BUFFER_1 by loading them one after the other into CHAR_BUFFER_2
+        and matching the two buffers. The matching template is left in
+        CHAR_BUFFER_2.
+
+        :param candidates: iterable of (key, template)
+        :return: (key, score) of the first match, (None, 0) when there is
+        none
+        """
+        for key, template in candidates:
+            self.upload_char_buffer(CHAR_BUFFER_2, template)
+
+            data = self.__send_command(IC_MATCH_TEMPLATE)
+            cc = data[0:1]
+            if cc == CC_SUCCESS:
+                return key, int.from_bytes(data[1:3], byteorder='big')
+            if cc != CC_UNMATCHED_TEMPLATES:
+                _check_cc(IC_MATCH_TEMPLATE, cc)
+
+        return None, 0
+
+    # To Generate a random code - D
+    def get_random_number(self):
+        random_number = self.__execute(IC_RANDOM_NUMBER)
+
+        return int.from_bytes(random_number, byteorder='big')
+
+    # To Write Notepad - A
+    def write_notepad(self, page, data):
+        """
+        Write a page of the notepad kept in the module's flash.
+
+        :param page, int: 0 to NOTEPAD_PAGES - 1
+        :param data: bytes-like, or str written as UTF-8, of at most
+        NOTEPAD_PAGE_SIZE bytes; the rest of the page is zeroed
+        :return:
+        """
+        self.__execute(IC_WRITE_NOTEPAD, *_notepad_args(page, data))
+        self._library.notepad_written(page)
+
+    # To Read Notepad - D
+    def read_notepad(self, page=0, encoding='UTF-8'):
+        """
+        :param page, int: 0 to NOTEPAD_PAGES - 1
+        :param encoding: encoding of the page, None to return bytes
+        :return: the NOTEPAD_PAGE_SIZE bytes of the page
+        """
+        notepad_content = self.__execute(IC_READ_NOTEPAD,
+                                         *_notepad_page_args(page))
+        return _notepad_reply(notepad_content, encoding)
+
+    # Enrollment
+    def enroll(self, page_id=None, timeout=10, max_retries=3,
+               wait_for_lift=True, quality_gate=None):
+        """
+        Enroll a finger in one call: capture and extract it twice, merge the
+        two character files into a template and store it.
+
+        A capture rejected as disordered, too small or without a valid
+        image is retaken without restarting the enrollment, as is the second
+        capture when it does not match the first.
+
+        :param page_id: page to store the template at; by default the first
+        free page of library_index, which is loaded if needed
+        :param timeout: seconds to wait for each finger placement or lift
+        :param max_retries: retries allowed per stage
+        :param wait_for_lift: wait for the finger to leave the glass between
+        the two captures
+        :param quality_gate: optional QualityGate; each capture is then
+        downloaded and screened before extraction, a rejected one is
+        retaken, and the module's verdict is recorded with the gate. The
+        download costs more than an extraction at low baud rates
+        :return, EnrollResult:
+        """
+        start = time.monotonic()
+        timings = collections.OrderedDict()
+        retries = collections.Counter()
+
+        def timed(stage, call, *args):
+            stage_start = time.monotonic()
+            try:
+                return call(*args)
+            finally:
+                timings[stage] = timings.get(stage, 0.0) + \
+                    time.monotonic() - stage_start
+
+        if page_id is None:
+            index = self.library_index
+            if index is None:
+                index = timed('allocate', self.load_library_index)
+            page_id = index.next_free()
+            if page_id is None:
+                raise SensorError("Finger library is full")
+
+        timed('sample_1', self.__enroll_sample, CHAR_BUFFER_1, timeout,
+              max_retries, retries, 'sample_1', quality_gate)
+
+        while True:
+            if wait_for_lift:
+                if not timed('lift', self.__wait_for_lift, timeout):
+                    raise SensorError("Finger was not lifted")
+
+            timed('sample_2', self.__enroll_sample, CHAR_BUFFER_2, timeout,
+                  max_retries, retries, 'sample_2', quality_gate)
+
+            cc = timed('merge', self.__send_command, IC_GENERATE_TEMPLATE)
+            if cc != CC_CHAR_MISMATCH or retries['merge'] >= max_retries:
+                _check_cc(IC_GENERATE_TEMPLATE, cc)
+                break
+            retries['merge'] += 1
+
+        timed('store', self.store_template, CHAR_BUFFER_1, page_id)
+
+        return EnrollResult(page_id, timings, dict(retries),
+                            time.monotonic() - start)
+
+    def __enroll_sample(self, buffer_id, timeout, max_retries, retries,
+                        stage, quality_gate=None):
+        """
+        Capture a finger and extract its character file into buffer_id,
+        recapturing when the image is not usable.
+        """
+        while True:
+            if not self.wait_for_finger(timeout):
+                raise SensorError("No finger placed")
+
+            if quality_gate is not None:
+                report = quality_gate.assess(self.download_image())
+                if not report.ok and retries[stage] < max_retries:
+                    logger.debug("Capture rejected: %s, score %.2f",
+                                 report.reason, report.score)
+                    retries[stage] += 1
+                    continue
+
+            cc = self.__send_command(IC_GENERATE_CHARACTERISTICS, buffer_id)
+            if quality_gate is not None:
+                quality_gate.record(report, _STATUSES.get(bytes(cc), cc[0]))
+            if cc not in _RECAPTURE_CCS or retries[stage] >= max_retries:
+                _check_cc(IC_GENERATE_CHARACTERISTICS, cc)
+                return
+            retries[stage] += 1
+
+    def __wait_for_lift(self, timeout, poll_interval=FINGER_POLL_MIN_INTERVAL,
+                        cancel=None):
+        """
+        :param timeout: seconds to wait, None to wait until cancelled
+        :param poll_interval: longest pause between two polls
+        :param cancel: optional threading.Event; setting it stops the wait
+        :return, bool: True once no finger is on the glass, False on timeout
+        or cancellation
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = FINGER_POLL_MIN_INTERVAL
+        while True:
+            if self.__send_command(IC_GENERATE_IMAGE)[0:1] == \
+                    CC_FINGER_NOT_DETECTED:
+                return True
+
+            wait = interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return False
+            if self.__sleep(wait, cancel):
+                return False
+            interval = min(interval * FINGER_POLL_BACKOFF, poll_interval)
+
+    @staticmethod
+    def __sleep(seconds, cancel):
+        """
+        :return, bool: True when cancel was set instead
+        """
+        if cancel is not None:
+            return cancel.wait(seconds)
+        time.sleep(seconds)
+        return False
+
+    # Continuous identification
+    def identify_events(self, start_page=0, count=None,
+                        buffer_id=CHAR_BUFFER_1, poll_interval=0.2,
+                        debounce=True, rate=None, cancel=None):
+        """
+        Identify every finger placed on the glass, for as long as the
+        generator is consumed::
+
+            for event in sensor.identify_events(rate=2):
+                if event.matched:
+                    open_gate(event.page_id)
+
+        The module is only polled from inside next(), so a consumer that
+        falls behind pauses the stream instead of leaving stale events
+        queued. Polling an empty glass backs off to poll_interval. Images
+        too poor to extract are captured again without an event, and a
+        framing error restarts the cycle after a warning; other errors end
+        the stream.
+
+        :param start_page: first page searched
+        :param count: pages searched, by default to the end of the library
+        :param buffer_id: character buffer the finger is extracted into
+        :param poll_interval: longest pause between two polls of the glass
+        :param debounce: identify a finger once and wait for the glass to
+        be clear before the next, instead of again while it stays on
+        :param rate: most identifications per second, None for no limit
+        :param cancel: optional threading.Event; setting it ends the stream
+        :return: generator of IdentifyEvent
+        """
+        if count is None:
+            count = self.profile.library_size - start_page
+        cycle = _IdentifyCycle(poll_interval, debounce, rate, time.monotonic)
+        calls = {
+            'lift': lambda: self.__wait_for_lift(None, poll_interval, cancel),
+            'sleep': lambda seconds: not self.__sleep(seconds, cancel),
+            'finger': lambda: self.wait_for_finger(None, poll_interval,
+                                                   cancel),
+            'extract': lambda: self.__send_command(
+                IC_GENERATE_CHARACTERISTICS, buffer_id)[0:1],
+            'search': lambda: self.search_library(buffer_id, start_page,
+                                                  count),
+        }
+
+        while cancel is None or not cancel.is_set():
+            event = self.__run(cycle.next_event(), calls)
+            if event is None:
+                return
+            yield event
+
+    # Library backup and restore
+    def export_library(self, file, progress=None, buffer_id=CHAR_BUFFER_1):
+        """
+        Write every template stored in the library to a backup file. Only
+        the pages marked as used in the library index are read.
+
+        :param file: path or binary file object
+        :param progress: optional callable(done, total) called after each page
+        :param buffer_id: character buffer used for the transfer
+        :return, int: number of templates exported
+        """
+        if not hasattr(file, 'write'):
+            with open(file, 'wb') as file:
+                return self.export_library(file, progress, buffer_id)
+
+        index = self.library_index
+        if index is None:
+            index = self.load_library_index()
+        pages = list(index.used_pages())
+
+        file.write(LIBRARY_FILE_MAGIC)
+
+        for done, page_id in enumerate(pages, 1):
+            self.read_template(buffer_id, page_id)
+            template = self.download_char_buffer(buffer_id)
+
+            file.write(page_id.to_bytes(2, byteorder='big'))
+            file.write(len(template).to_bytes(2, byteorder='big'))
+            file.write(template)
+
+            if progress is not None:
+                progress(done, len(pages))
+
+        return len(pages)
+
+    def import_library(self, file, progress=None, buffer_id=CHAR_BUFFER_1):
+        """
+        Store every template of a backup file written by export_library at
+        its original page.
+
+        :param file: path or binary file object
+        :param progress: optional callable(done, total) called after each
+        template
+        :param buffer_id: character buffer used for the transfer
+        :return, int: number of templates imported
+        """
+        if not hasattr(file, 'read'):
+            with open(file, 'rb') as file:
+                return self.import_library(file, progress, buffer_id)
+
+        records = read_library_file(file)
+
+        with self.library_change():
+            for done, (page_id, template) in enumerate(records, 1):
+                self.upload_char_buffer(buffer_id, template)
+                self.store_template(buffer_id, page_id)
+
+                if progress is not None:
+                    progress(done, len(records))
+
+        return len(records)
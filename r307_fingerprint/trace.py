@@ -0,0 +1,308 @@
+"""
+Recording of serial traffic and deterministic replay of a recording.
+
+TraceRecorder sits between a Sensor and its port and appends every read
+and write, with its time, to a trace file::
+
+    port = Serial('/dev/ttyUSB0', baudrate=57600, timeout=3)
+    sensor = Sensor(TraceRecorder(port, 'field.trace'), 57600)
+
+TraceReplay plays the module's side of a trace back to a Sensor, at the
+recorded pace or as fast as possible, with no hardware::
+
+    sensor = Sensor(TraceReplay('field.trace', speed=1.0), 57600)
+"""
+import collections
+import mmap
+import os
+import time
+
+from .constants import DEFAULT_ADDRESS, TRACE_FILE_MAGIC
+from .errors import ProtocolError, SensorError
+from .protocol import FrameDecoder
+
+# Direction of a trace record
+TRACE_SENT = 1
+TRACE_RECEIVED = 2
+
+# Direction, time and length in front of the data of every record
+_RECORD_HEADER_SIZE = 13
+
+# One read or write: TRACE_SENT or TRACE_RECEIVED, nanoseconds since the
+# epoch and the bytes moved
+TraceRecord = collections.namedtuple('TraceRecord', 'direction time data')
+
+
+class TraceRecorder:
+    """
+    Serial-like wrapper that appends every read and write to a trace file.
+
+    Reads are recorded as returned, including the short or empty ones of a
+    timeout, so a replay sees the same chunks and the same timeouts. Bytes
+    dropped by reset_input_buffer never reach the host and are not
+    recorded. Anything the wrapper does not define is passed to the port.
+    """
+
+    def __init__(self, serial, file, flush=False):
+        """
+        :param serial: open serial-like object
+        :param file: path or binary file object; an existing trace file is
+        appended to
+        :param flush: write every record through to the file at once, so a
+        crash loses nothing
+        """
+        if hasattr(file, 'write'):
+            self._file = file
+            self._owns_file = False
+        else:
+            self._file = open(file, 'ab')
+            self._owns_file = True
+
+        if self._file.tell() == 0:
+            self._file.write(TRACE_FILE_MAGIC)
+        self._serial = serial
+        self._flush = flush
+        # Wall clock at start, advanced by the monotonic clock
+        self._epoch = time.time_ns() - time.perf_counter_ns()
+
+    @property
+    def timeout(self):
+        return self._serial.timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self._serial.timeout = timeout
+
+    @property
+    def baudrate(self):
+        return self._serial.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate):
+        self._serial.baudrate = baudrate
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._serial, name)
+
+    def __record(self, direction, data):
+        file = self._file
+        file.write(bytes((direction,)))
+        file.write((self._epoch + time.perf_counter_ns()).to_bytes(
+            8, byteorder='big'))
+        file.write(len(data).to_bytes(4, byteorder='big'))
+        file.write(data)
+        if self._flush:
+            file.flush()
+
+    def write(self, data):
+        written = self._serial.write(data)
+        self.__record(TRACE_SENT, data)
+        return written
+
+    def read(self, size=1):
+        data = self._serial.read(size)
+        self.__record(TRACE_RECEIVED, data)
+        return data
+
+    def flush(self):
+        """
+        :return:
+        """
+        self._file.flush()
+
+    def close(self):
+        """
+        Close the port and a trace file opened by path.
+
+        :return:
+        """
+        if hasattr(self._serial, 'close'):
+            self._serial.close()
+        if self._owns_file:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+class TraceReader:
+    """
+    Reads a trace file through mmap. A record cut short at the end of the
+    file, as left by a crash while recording, is ignored.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: trace file written by TraceRecorder
+        """
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < len(TRACE_FILE_MAGIC):
+                raise ValueError("Not a trace file")
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(TRACE_FILE_MAGIC)] != TRACE_FILE_MAGIC:
+            self._map.close()
+            raise ValueError("Not a trace file")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        :return:
+        """
+        self._map.close()
+
+    def __iter__(self):
+        data = self._map
+        offset = len(TRACE_FILE_MAGIC)
+        while offset + _RECORD_HEADER_SIZE <= len(data):
+            direction = data[offset]
+            when = int.from_bytes(data[offset + 1:offset + 9],
+                                  byteorder='big')
+            end = offset + _RECORD_HEADER_SIZE + int.from_bytes(
+                data[offset + 9:offset + 13], byteorder='big')
+            if end > len(data):
+                break
+
+            yield TraceRecord(direction, when,
+                              data[offset + _RECORD_HEADER_SIZE:end])
+            offset = end
+
+    def frames(self, direction=TRACE_RECEIVED, address=DEFAULT_ADDRESS):
+        """
+        Decode the packets sent one way, skipping any garbage on the line.
+
+        :param direction: TRACE_RECEIVED for the module's packets,
+        TRACE_SENT for the host's
+        :param address: module address the packets carry
+        :return: generator of (time, pid, content) with content as bytes
+        """
+        decoder = FrameDecoder(address)
+        for record in self:
+            if record.direction != direction:
+                continue
+
+            view = memoryview(record.data)
+            while view:
+                count = min(len(view), decoder.space())
+                decoder.feed(view[:count])
+                view = view[count:]
+                while True:
+                    try:
+                        frame = decoder.decode()
+                    except ProtocolError:
+                        continue
+                    if frame is None:
+                        break
+                    yield record.time, frame[0], bytes(frame[1])
+
+
+class TraceReplay:
+    """
+    Serial-like object that plays a trace back to a Sensor.
+
+    Reads return the recorded chunks in order, empty ones standing for the
+    recorded timeouts; a read asking for less than the next chunk gets the
+    start of it. Writes are checked against the recorded writes when
+    ``verify`` is set, so a host that no longer behaves as recorded fails
+    at the first difference instead of reading replies to other commands.
+    """
+
+    def __init__(self, trace, speed=None, verify=True, timeout=3,
+                 baudrate=57600):
+        """
+        :param trace: path of a trace file, or iterable of TraceRecord
+        :param speed: None to replay as fast as possible, otherwise the
+        factor applied to the recorded pace, 1.0 for real time
+        :param verify: raise SensorError when the host writes something
+        other than what was recorded
+        :param timeout: accepted and kept for Sensor, as pyserial's
+        :param baudrate: accepted and kept for Sensor, as pyserial's
+        """
+        if isinstance(trace, (str, bytes, os.PathLike)):
+            with TraceReader(trace) as reader:
+                records = list(reader)
+        else:
+            records = list(trace)
+
+        self._received = collections.deque(
+            (record.time, bytes(record.data)) for record in records
+            if record.direction == TRACE_RECEIVED)
+        self._sent = collections.deque(
+            bytes(record.data) for record in records
+            if record.direction == TRACE_SENT)
+        self._first = records[0].time if records else 0
+        self._start = None
+        self._writes = 0
+        self.speed = speed
+        self.verify = verify
+        self.timeout = timeout
+        self.baudrate = baudrate
+
+    def __due(self, when):
+        """
+        :return, float: seconds until a record of the given time is due
+        """
+        if self.speed is None:
+            return 0
+        if self._start is None:
+            self._start = time.monotonic()
+        return self._start + (when - self._first) / 1e9 / self.speed - \
+            time.monotonic()
+
+    @property
+    def in_waiting(self):
+        if not self._received:
+            return 0
+        when, data = self._received[0]
+        return len(data) if self.__due(when) <= 0 else 0
+
+    @property
+    def remaining(self):
+        """Number of recorded reads and writes not replayed yet"""
+        return len(self._received) + len(self._sent)
+
+    def write(self, data):
+        data = bytes(data)
+        self._writes += 1
+        if self.verify:
+            expected = self._sent.popleft() if self._sent else None
+            if data != expected:
+                raise SensorError("Replay diverged at write %d: sent %s, "
+                                  "recorded %s" % (
+                                      self._writes, data.hex(),
+                                      None if expected is None
+                                      else expected.hex()))
+        elif self._sent:
+            self._sent.popleft()
+
+        return len(data)
+
+    def read(self, size=1):
+        if not self._received:
+            return b''
+
+        when, data = self._received[0]
+        wait = self.__due(when)
+        if wait > 0:
+            time.sleep(wait)
+
+        if size < len(data):
+            self._received[0] = (when, data[size:])
+            return data[:size]
+
+        self._received.popleft()
+        return data
+
+    def reset_input_buffer(self):
+        # What the recorded reset dropped was never recorded
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,653 @@
+"""
+In-process simulation of an R307 module for tests and benchmarks.
+
+VirtualSensor speaks the same packet protocol as the real module and can be
+used wherever a Serial is expected::
+
+    device = VirtualSensor(library_size=1000)
+    sensor = Sensor(device, 57600)
+
+or from another process through a pseudo terminal (open_pty), or from
+asyncio through open_connection.
+"""
+import asyncio
+import collections
+import hashlib
+import os
+import random
+import select
+import threading
+import time
+
+from .constants import *
+from .errors import ProtocolError
+from .protocol import FrameDecoder, FrameEncoder, _data_packets
+
+# Size of a character file or template held in a character buffer
+CHAR_FILE_SIZE = TEMPLATE_SIZE
+
+# Score reported for two character files of the same finger
+MATCH_SCORE = 150
+
+# Approximate time the module spends on each command, in seconds
+DEFAULT_COMMAND_DELAYS = {
+    IC_GENERATE_IMAGE: 0.2,
+    IC_GENERATE_CHARACTERISTICS: 0.3,
+    IC_GENERATE_TEMPLATE: 0.1,
+    IC_STORE_TEMPLATE: 0.05,
+    IC_DELETE_TEMPLATE: 0.05,
+    IC_EMPTY_FINGERPRINT_LIBRARY: 0.2,
+    IC_SEARCH: 0.1,
+    IC_FINGERPRINT_VERIFICATION: 0.6,
+    IC_AUTO_FINGERPRINT_VERIFICATION: 0.6,
+}
+
+# Time per template searched, in seconds
+SEARCH_DELAY_PER_TEMPLATE = 0.0002
+
+
+def _expand(seed, size):
+    """
+    :return, bytes: size deterministic pseudo random bytes derived from seed
+    """
+    blocks = []
+    counter = 0
+    while len(blocks) * 32 < size:
+        blocks.append(hashlib.sha256(seed + counter.to_bytes(4, 'big'))
+                      .digest())
+        counter += 1
+    return b''.join(blocks)[:size]
+
+
+def finger_template(finger):
+    """
+    :param finger, bytes: identity of a simulated finger
+    :return, bytes: the character file the virtual module extracts from it
+    """
+    return _expand(b'char' + finger, CHAR_FILE_SIZE)
+
+
+def finger_image(finger):
+    """
+    :param finger, bytes: identity of a simulated finger
+    :return, bytes: packed image the virtual module captures from it
+    """
+    return _expand(b'image' + finger, IMAGE_SIZE)
+
+
+class VirtualSensor:
+    """
+    Simulated R307 module behind a pyserial-like interface.
+
+    :ivar library: page id to stored template
+    :ivar char_buffers: buffer number (1 or 2) to character file or None
+    :ivar finger: identity of the finger on the glass, None when there is
+    none
+    """
+
+    def __init__(self, library_size=1000, address=DEFAULT_ADDRESS,
+                 password=bytes.fromhex('00000000'), baudrate=57600,
+                 package_length=2, security_level=3, latency=False,
+                 command_delays=None, corruption=0.0, seed=None, timeout=3):
+        """
+        :param library_size: number of template pages
+        :param address: module address
+        :param password: module password
+        :param baudrate: line speed of the module and, initially, the host
+        :param package_length: data packet size setting, 0 to 3
+        :param security_level: 1 to 5
+        :param latency: when True, replies become readable after the time
+        it takes to send the bytes at the current baud rate plus the
+        module's processing time
+        :param command_delays: processing time per instruction code,
+        DEFAULT_COMMAND_DELAYS by default
+        :param corruption: probability of flipping one byte of each packet
+        the module sends
+        :param seed: seed for the corruption and random number generator
+        :param timeout: read timeout in seconds, as pyserial's
+        """
+        self.library_size = library_size
+        self.address = address
+        self.password = password
+        self.module_baudrate = baudrate
+        self.package_length = package_length
+        self.security_level = security_level
+        self.status_register = 0
+        self.system_identifier = 0
+
+        self.latency = latency
+        self.command_delays = dict(DEFAULT_COMMAND_DELAYS
+                                   if command_delays is None
+                                   else command_delays)
+        self.corruption = corruption
+        self.timeout = timeout
+        self.baudrate = baudrate
+        self.is_open = True
+
+        self.library = {}
+        self.char_buffers = {1: None, 2: None}
+        self.notepad = [bytes(NOTEPAD_PAGE_SIZE)] * NOTEPAD_PAGES
+        self.finger = None
+        self.image = None
+        self._image_finger = None
+        self._capture_failures = []
+
+        self.commands = collections.Counter()
+        self._random = random.Random(seed)
+        self._decoder = FrameDecoder(address)
+        self._encoder = FrameEncoder(address)
+        self._upload = None
+        # (ready time, bytes) the module has sent and the host not read
+        self._pending = collections.deque()
+        self._received = bytearray()
+        self._line_free_at = 0.0
+        self._lock = threading.Lock()
+
+    # Simulation control
+
+    def place_finger(self, finger, failures=()):
+        """
+        Put a finger on the glass.
+
+        :param finger, bytes: identity of the finger; the same identity
+        always gives the same image and character file
+        :param failures: confirmation codes returned by the next character
+        file generations, e.g. CC_DISORDERED_FINGERPRINT, before they
+        succeed
+        :return:
+        """
+        self.finger = finger
+        self._capture_failures = list(failures)
+
+    def remove_finger(self):
+        self.finger = None
+
+    def enroll(self, finger, page_id=None):
+        """
+        Store the template of a finger directly in the library.
+
+        :return, int: page id used
+        """
+        if page_id is None:
+            page_id = next(page for page in range(self.library_size)
+                           if page not in self.library)
+        self.library[page_id] = finger_template(finger)
+        return page_id
+
+    def inject(self, data):
+        """
+        Queue raw bytes, such as line noise, for the host to read.
+        """
+        with self._lock:
+            self._pending.append((time.monotonic(), bytes(data)))
+
+    # pyserial interface
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            self._collect(time.monotonic())
+            return len(self._received)
+
+    def write(self, data):
+        now = time.monotonic()
+        with self._lock:
+            if self.baudrate != self.module_baudrate:
+                # The module cannot make sense of bytes at another speed
+                return len(data)
+
+            arrival = now + self._byte_time() * len(data) \
+                if self.latency else now
+            try:
+                self._decoder.feed(data)
+                while True:
+                    frame = self._decoder.decode()
+                    if frame is None:
+                        break
+                    self._handle(frame[0], bytes(frame[1]), arrival)
+            except Exception:
+                # The real module ignores malformed packets
+                self._decoder.reset()
+
+        return len(data)
+
+    def read(self, size=1):
+        deadline = None if self.timeout is None \
+            else time.monotonic() + self.timeout
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._collect(now)
+                if len(self._received) >= size or \
+                        (deadline is not None and now >= deadline):
+                    data = bytes(self._received[:size])
+                    del self._received[:size]
+                    return data
+                wake = self._pending[0][0] if self._pending else None
+
+            if deadline is not None:
+                wake = deadline if wake is None else min(wake, deadline)
+            if wake is None:
+                # No timeout and nothing will ever arrive: a real port
+                # would hang, fail as the reply's deadline would instead
+                raise ProtocolError("Virtual sensor read would block "
+                                    "forever", 'timeout')
+            time.sleep(max(wake - time.monotonic(), 0))
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._pending.clear()
+            self._received.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+    # Other transports
+
+    def open_pty(self):
+        """
+        Serve the device on a pseudo terminal from a background thread.
+
+        :return, str: path of the terminal to open with Serial
+        """
+        master, slave = os.openpty()
+        thread = threading.Thread(target=self._serve_pty, args=(master,),
+                                  daemon=True)
+        thread.start()
+        self._pty = (master, slave)
+        return os.ttyname(slave)
+
+    def _serve_pty(self, master):
+        while self.is_open:
+            readable, _, _ = select.select([master], [], [], 0.001)
+            if readable:
+                self.write(os.read(master, 4096))
+
+            with self._lock:
+                self._collect(time.monotonic())
+                data = bytes(self._received)
+                self._received.clear()
+            if data:
+                os.write(master, data)
+
+    async def open_connection(self):
+        """
+        :return: asyncio (reader, writer) pair for AsyncSensor
+        """
+        reader = asyncio.StreamReader()
+        return reader, _VirtualWriter(self, reader)
+
+    # Module behaviour
+
+    def _byte_time(self):
+        # 1 start bit, 8 data bits and 1 stop bit per byte
+        return 10.0 / self.module_baudrate
+
+    def _collect(self, now):
+        pending = self._pending
+        while pending and pending[0][0] <= now:
+            self._received += pending.popleft()[1]
+
+    def _send(self, pid, content, start):
+        """
+        Queue a packet from the module, readable once it has been sent.
+
+        :return, float: time the packet is completely sent
+        """
+        frame = bytearray(self._encoder.encode(pid, content))
+        if self.corruption and self._random.random() < self.corruption:
+            frame[self._random.randrange(len(frame))] ^= \
+                1 << self._random.randrange(8)
+
+        if self.latency:
+            start = max(start, self._line_free_at)
+            ready = start + self._byte_time() * len(frame)
+            self._line_free_at = ready
+        else:
+            ready = start
+
+        self._pending.append((ready, bytes(frame)))
+        return ready
+
+    def _ack(self, cc, start, data=b''):
+        return self._send(PID_ACK, cc + data, start)
+
+    def _send_data(self, data, start):
+        for pid, content in _data_packets(data,
+                                          PACKET_SIZES[self.package_length]):
+            start = self._send(pid, content, start)
+
+    def _handle(self, pid, content, arrival):
+        if pid in (PID_DATA, PID_EOD):
+            if self._upload is not None:
+                self._upload[1].extend(content)
+                if pid == PID_EOD:
+                    target, data = self._upload
+                    self._upload = None
+                    self._finish_upload(target, bytes(data))
+            return
+
+        if pid != PID_COMMAND or not content:
+            return
+
+        command = content[0:1]
+        args = content[1:]
+        self.commands[command] += 1
+
+        start = arrival
+        if self.latency:
+            start += self.command_delays.get(command, 0.0)
+
+        handler = self._HANDLERS.get(command)
+        if handler is None:
+            self._ack(CC_ERROR, start)
+        else:
+            getattr(self, handler)(args, start)
+
+    def _finish_upload(self, target, data):
+        if target == 'image':
+            self.image = data
+            self._image_finger = None
+        else:
+            self.char_buffers[target] = data
+
+    def _capture(self):
+        if self.finger is None:
+            return False
+        self.image = finger_image(self.finger)
+        self._image_finger = self.finger
+        return True
+
+    def _extract(self, buffer_id):
+        """
+        :return, bytes: confirmation code of generating a character file
+        """
+        if self.image is None or self._image_finger is None:
+            return CC_INVALID_PRIMARY_IMAGE
+        if self._capture_failures:
+            return self._capture_failures.pop(0)
+
+        self.char_buffers[buffer_id] = finger_template(self._image_finger)
+        return CC_SUCCESS
+
+    def _search(self, template, start_page, count):
+        """
+        :return, int: matching page, or None
+        """
+        for page_id in range(start_page, min(start_page + count,
+                                             self.library_size)):
+            if self.library.get(page_id) == template:
+                return page_id
+        return None
+
+    def _search_delay(self, count):
+        if not self.latency:
+            return 0.0
+        return SEARCH_DELAY_PER_TEMPLATE * min(count, len(self.library))
+
+    def _verify_password(self, args, start):
+        self._ack(CC_SUCCESS if args == self.password else CC_WRONG_PASS,
+                  start)
+
+    def _generate_image(self, args, start):
+        self._ack(CC_SUCCESS if self._capture() else CC_FINGER_NOT_DETECTED,
+                  start)
+
+    def _download_image(self, args, start):
+        if self.image is None:
+            self._ack(CC_FAILED_DOWNLOAD_IMAGE, start)
+            return
+        self._send_data(self.image, self._ack(CC_SUCCESS, start))
+
+    def _upload_image(self, args, start):
+        self._upload = ('image', bytearray())
+        self._ack(CC_SUCCESS, start)
+
+    def _generate_characteristics(self, args, start):
+        buffer_id = args[0] if args else 1
+        self._ack(self._extract(buffer_id), start)
+
+    def _generate_template(self, args, start):
+        first, second = self.char_buffers[1], self.char_buffers[2]
+        if first is None or first != second:
+            self._ack(CC_CHAR_MISMATCH, start)
+            return
+        self._ack(CC_SUCCESS, start)
+
+    def _download_char_buffer(self, args, start):
+        template = self.char_buffers.get(args[0] if args else 1)
+        if template is None:
+            self._ack(CC_TEMPLATE_DWNLD_ERR, start)
+            return
+        self._send_data(template, self._ack(CC_SUCCESS, start))
+
+    def _upload_char_buffer(self, args, start):
+        self._upload = (args[0] if args else 1, bytearray())
+        self._ack(CC_SUCCESS, start)
+
+    def _set_password(self, args, start):
+        self.password = args[0:4]
+        self._ack(CC_SUCCESS, start)
+
+    def _set_address(self, args, start):
+        self._ack(CC_SUCCESS, start)
+        # The acknowledgement still goes out under the old address
+        self.address = args[0:4]
+        self._decoder.address = self.address
+        self._encoder.address = self.address
+
+    def _set_parameters(self, args, start):
+        pn, value = args[0:1], args[1]
+        if pn == PN_BAUD_RATE and 1 <= value <= 12:
+            self._ack(CC_SUCCESS, start)
+            self.module_baudrate = value * 9600
+        elif pn == PN_SECURITY_LEVEL and 1 <= value <= 5:
+            self.security_level = value
+            self._ack(CC_SUCCESS, start)
+        elif pn == PN_PACKAGE_LEN and 0 <= value <= 3:
+            self.package_length = value
+            self._ack(CC_SUCCESS, start)
+        else:
+            self._ack(CC_WRONG_REG_NUM, start)
+
+    def _set_port_control(self, args, start):
+        self._ack(CC_SUCCESS, start)
+
+    def _read_parameters(self, args, start):
+        data = b''.join((
+            self.status_register.to_bytes(2, 'big'),
+            self.system_identifier.to_bytes(2, 'big'),
+            self.library_size.to_bytes(2, 'big'),
+            self.security_level.to_bytes(2, 'big'),
+            self.address,
+            self.package_length.to_bytes(2, 'big'),
+            (self.module_baudrate // 9600).to_bytes(2, 'big'),
+        ))
+        self._ack(CC_SUCCESS, start, data)
+
+    def _read_template_num(self, args, start):
+        self._ack(CC_SUCCESS, start, len(self.library).to_bytes(2, 'big'))
+
+    def _read_index_table(self, args, start):
+        first = (args[0] if args else 0) * INDEX_TABLE_PAGE_SIZE
+        table = bytearray(INDEX_TABLE_PAGE_SIZE // 8)
+        for page_id in self.library:
+            if first <= page_id < first + INDEX_TABLE_PAGE_SIZE:
+                offset = page_id - first
+                table[offset // 8] |= 1 << (offset % 8)
+        self._ack(CC_SUCCESS, start, bytes(table))
+
+    def _reply_search(self, template, start_page, count, start):
+        page_id = None if template is None else \
+            self._search(template, start_page, count)
+        start += self._search_delay(count)
+        if page_id is None:
+            self._ack(CC_NO_MATCH, start, bytes(4))
+        else:
+            self._ack(CC_SUCCESS, start, page_id.to_bytes(2, 'big') +
+                      MATCH_SCORE.to_bytes(2, 'big'))
+
+    def _search_library(self, args, start):
+        buffer_id = args[0]
+        start_page = int.from_bytes(args[1:3], 'big')
+        count = int.from_bytes(args[3:5], 'big')
+        self._reply_search(self.char_buffers.get(buffer_id), start_page,
+                           count, start)
+
+    def _capture_and_search(self, start_page, count, start):
+        if not self._capture():
+            self._ack(CC_FINGER_NOT_DETECTED, start, bytes(4))
+            return
+        cc = self._extract(1)
+        if cc != CC_SUCCESS:
+            self._ack(cc, start, bytes(4))
+            return
+        self._reply_search(self.char_buffers[1], start_page, count, start)
+
+    def _fingerprint_verification(self, args, start):
+        start_page = int.from_bytes(args[1:3], 'big')
+        count = int.from_bytes(args[3:5], 'big')
+        self._capture_and_search(start_page, count, start)
+
+    def _auto_fingerprint_verification(self, args, start):
+        self._capture_and_search(0, self.library_size, start)
+
+    def _store_template(self, args, start):
+        buffer_id = args[0]
+        page_id = int.from_bytes(args[1:3], 'big')
+        template = self.char_buffers.get(buffer_id)
+        if page_id >= self.library_size:
+            self._ack(CC_PAGE_ID_INVALID, start)
+        elif template is None:
+            self._ack(CC_ERROR, start)
+        else:
+            self.library[page_id] = template
+            self._ack(CC_SUCCESS, start)
+
+    def _read_template(self, args, start):
+        buffer_id = args[0]
+        page_id = int.from_bytes(args[1:3], 'big')
+        if page_id >= self.library_size:
+            self._ack(CC_PAGE_ID_INVALID, start)
+        elif page_id not in self.library:
+            self._ack(CC_READOUT_TEMPLATE_INVALID, start)
+        else:
+            self.char_buffers[buffer_id] = self.library[page_id]
+            self._ack(CC_SUCCESS, start)
+
+    def _delete_template(self, args, start):
+        page_id = int.from_bytes(args[0:2], 'big')
+        count = int.from_bytes(args[2:4], 'big')
+        if page_id + count > self.library_size:
+            self._ack(CC_FAILED_DELETE, start)
+            return
+        for page in range(page_id, page_id + count):
+            self.library.pop(page, None)
+        self._ack(CC_SUCCESS, start)
+
+    def _empty_library(self, args, start):
+        self.library.clear()
+        self._ack(CC_SUCCESS, start)
+
+    def _match_template(self, args, start):
+        first, second = self.char_buffers[1], self.char_buffers[2]
+        if first is not None and first == second:
+            self._ack(CC_SUCCESS, start, MATCH_SCORE.to_bytes(2, 'big'))
+        else:
+            self._ack(CC_UNMATCHED_TEMPLATES, start, bytes(2))
+
+    def _random_number(self, args, start):
+        self._ack(CC_SUCCESS, start,
+                  self._random.getrandbits(32).to_bytes(4, 'big'))
+
+    def _read_notepad(self, args, start):
+        page = args[0] if args else 0
+        if page >= NOTEPAD_PAGES:
+            self._ack(CC_ERROR, start)
+            return
+        self._ack(CC_SUCCESS, start, self.notepad[page])
+
+    def _write_notepad(self, args, start):
+        page = args[0] if args else NOTEPAD_PAGES
+        if page >= NOTEPAD_PAGES:
+            self._ack(CC_ERROR, start)
+            return
+        self.notepad[page] = bytes(args[1:1 + NOTEPAD_PAGE_SIZE]).ljust(
+            NOTEPAD_PAGE_SIZE, b'\x00')
+        self._ack(CC_SUCCESS, start)
+
+    # Instruction code to the name of the method handling it, looked up on
+    # the instance so subclasses can change single commands
+    _HANDLERS = {
+        IC_VERIFY_PASSWORD: '_verify_password',
+        IC_GENERATE_IMAGE: '_generate_image',
+        IC_DOWNLOAD_IMAGE: '_download_image',
+        IC_UPLOAD_IMAGE: '_upload_image',
+        IC_GENERATE_CHARACTERISTICS: '_generate_characteristics',
+        IC_GENERATE_TEMPLATE: '_generate_template',
+        IC_DOWNLOAD_CHAR_BUFFER: '_download_char_buffer',
+        IC_UPLOAD_CHAR_BUFFER: '_upload_char_buffer',
+        IC_SET_PASSWORD: '_set_password',
+        IC_SET_ADDRESS: '_set_address',
+        IC_SET_PARAMETERS: '_set_parameters',
+        IC_SET_PORT_CONTROL: '_set_port_control',
+        IC_READ_PARAMETERS: '_read_parameters',
+        IC_READ_TEMPLATE_NUM: '_read_template_num',
+        IC_READ_INDEX_TABLE: '_read_index_table',
+        IC_SEARCH: '_search_library',
+        IC_FINGERPRINT_VERIFICATION: '_fingerprint_verification',
+        IC_AUTO_FINGERPRINT_VERIFICATION: '_auto_fingerprint_verification',
+        IC_STORE_TEMPLATE: '_store_template',
+        IC_READ_TEMPLATE: '_read_template',
+        IC_DELETE_TEMPLATE: '_delete_template',
+        IC_EMPTY_FINGERPRINT_LIBRARY: '_empty_library',
+        IC_MATCH_TEMPLATE: '_match_template',
+        IC_RANDOM_NUMBER: '_random_number',
+        IC_READ_NOTEPAD: '_read_notepad',
+        IC_WRITE_NOTEPAD: '_write_notepad',
+    }
+
+
+class _VirtualWriter:
+    """asyncio.StreamWriter stand-in that feeds a VirtualSensor"""
+
+    def __init__(self, device, reader):
+        self._device = device
+        self._reader = reader
+        self._loop = asyncio.get_event_loop()
+        self._delivery = None
+
+    def write(self, data):
+        self._device.write(data)
+        self._schedule()
+
+    def _schedule(self):
+        if self._delivery is not None:
+            return
+        pending = self._device._pending
+        if not pending:
+            return
+        delay = max(pending[0][0] - time.monotonic(), 0)
+        self._delivery = self._loop.call_later(delay, self._deliver)
+
+    def _deliver(self):
+        self._delivery = None
+        data = self._device.read(self._device.in_waiting)
+        if data:
+            self._reader.feed_data(data)
+        self._schedule()
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        if self._delivery is not None:
+            self._delivery.cancel()
+        self._device.close()
@@ -0,0 +1,86 @@
+"""
+Tests of a SensorBroker serving a VirtualSensor to RemoteSensor clients.
+"""
+import asyncio
+import contextlib
+import threading
+
+import pytest
+
+from r307_fingerprint import CommandError, Status
+from r307_fingerprint.aio import AsyncSensor
+from r307_fingerprint.broker import SensorBroker
+from r307_fingerprint.constants import CHAR_BUFFER_1
+from r307_fingerprint.pool import SensorPool
+from r307_fingerprint.remote import RemoteSensor
+from r307_fingerprint.virtual import VirtualSensor, finger_image, \
+    finger_template
+
+
+@contextlib.contextmanager
+def _broker(device, path):
+    """
+    Serve device on path from a thread with its own event loop for the
+    duration of the with block.
+    """
+    ready = threading.Event()
+    stop = threading.Event()
+    failed = []
+
+    async def open_virtual(port, baudrate, timeout):
+        reader, writer = await device.open_connection()
+        return await AsyncSensor(reader, writer, timeout).connect()
+
+    async def serve():
+        async with SensorPool(['virtual'], opener=open_virtual) as pool:
+            async with SensorBroker(pool, path):
+                ready.set()
+                while not stop.is_set():
+                    await asyncio.sleep(0.01)
+
+    def run():
+        try:
+            asyncio.run(serve())
+        except BaseException as error:
+            failed.append(error)
+        finally:
+            ready.set()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    ready.wait(5)
+    try:
+        assert not failed
+        yield
+    finally:
+        stop.set()
+        thread.join(5)
+    assert not failed
+
+
+def test_remote_round_trip(tmp_path):
+    device = VirtualSensor(library_size=100)
+    device.enroll(b'thumb', 7)
+    path = str(tmp_path / 'r307.sock')
+
+    with _broker(device, path), RemoteSensor(path) as sensor:
+        assert sensor.read_profile().library_size == 100
+
+        device.place_finger(b'thumb')
+        sensor.generate_image()
+        assert bytes(sensor.download_image()) == finger_image(b'thumb')
+        sensor.generate_charfile_image(CHAR_BUFFER_1)
+        assert sensor.search_library(CHAR_BUFFER_1, 0, 100)[0] == 7
+
+        sensor.upload_char_buffer(CHAR_BUFFER_1, finger_template(b'index'))
+        sensor.store_template(CHAR_BUFFER_1, 8)
+        assert device.library[8] == finger_template(b'index')
+        index = sensor.load_library_index()
+        assert list(index.used_pages()) == [7, 8]
+
+        # Errors on the broker's side are raised again on the client's
+        with pytest.raises(CommandError) as raised:
+            sensor.read_template(CHAR_BUFFER_1, 50)
+        assert raised.value.status == Status.TEMPLATE_INVALID
+        with pytest.raises(ValueError):
+            sensor.store_template(CHAR_BUFFER_1, 100)
@@ -0,0 +1,33 @@
+"""
+Tests of Sensor.enroll against a VirtualSensor.
+"""
+import pytest
+
+from r307_fingerprint import CommandError, Sensor, Status
+from r307_fingerprint.constants import CC_DISORDERED_FINGERPRINT, \
+    CC_VERY_SMALL_FINGERPRINT
+from r307_fingerprint.virtual import VirtualSensor, finger_template
+
+
+def test_enroll_retakes_rejected_capture():
+    device = VirtualSensor(library_size=100)
+    device.enroll(b'index', 0)
+    sensor = Sensor(device, 57600)
+    device.place_finger(b'thumb', failures=[CC_DISORDERED_FINGERPRINT])
+
+    result = sensor.enroll(wait_for_lift=False)
+    assert result.page_id == 1
+    assert result.retries == {'sample_1': 1}
+    assert device.library[1] == finger_template(b'thumb')
+    assert sensor.library_index.is_used(1)
+
+
+def test_enroll_gives_up_after_max_retries():
+    device = VirtualSensor(library_size=100)
+    sensor = Sensor(device, 57600)
+    device.place_finger(b'thumb', failures=[CC_VERY_SMALL_FINGERPRINT] * 3)
+
+    with pytest.raises(CommandError) as raised:
+        sensor.enroll(page_id=5, wait_for_lift=False, max_retries=2)
+    assert raised.value.status == Status.TOO_SMALL
+    assert not device.library
@@ -0,0 +1,54 @@
+"""
+Tests of Sensor.identify_events against a VirtualSensor.
+"""
+import threading
+
+from r307_fingerprint import Sensor
+from r307_fingerprint.virtual import VirtualSensor
+
+
+def _swap_later(device, finger, delay):
+    """
+    Lift the finger on the glass, then place another one, from a thread.
+    """
+    def swap():
+        device.remove_finger()
+        threading.Event().wait(delay)
+        device.place_finger(finger)
+
+    timer = threading.Timer(delay, swap)
+    timer.start()
+    return timer
+
+
+def test_finger_left_on_glass_is_identified_once():
+    device = VirtualSensor(library_size=100)
+    device.enroll(b'thumb', 42)
+    sensor = Sensor(device, 57600)
+    device.place_finger(b'thumb')
+    cancel = threading.Event()
+    events = sensor.identify_events(poll_interval=0.01, cancel=cancel)
+
+    first = next(events)
+    assert (first.matched, first.page_id) == (True, 42)
+
+    # The thumb stays on for a while; the next event is the unknown finger
+    timer = _swap_later(device, b'index', 0.1)
+    second = next(events)
+    timer.join()
+    assert (second.matched, second.page_id, second.score) == \
+        (False, None, 0)
+
+    cancel.set()
+    assert list(events) == []
+
+
+def test_finger_left_on_glass_repeats_without_debounce():
+    device = VirtualSensor(library_size=100)
+    device.enroll(b'thumb', 42)
+    sensor = Sensor(device, 57600)
+    device.place_finger(b'thumb')
+    events = sensor.identify_events(poll_interval=0.01, debounce=False)
+
+    assert [next(events).page_id for _ in range(3)] == [42, 42, 42]
+    events.close()
@@ -0,0 +1,36 @@
+"""
+Tests of the link settings of Sensor against a VirtualSensor.
+"""
+from r307_fingerprint import Sensor
+from r307_fingerprint.constants import PID_DATA, PID_EOD
+from r307_fingerprint.virtual import VirtualSensor
+
+
+def test_switch_baudrate_moves_module_and_port():
+    device = VirtualSensor()
+    sensor = Sensor(device, 57600)
+    sensor.switch_baudrate(12, settle=0)
+
+    assert device.module_baudrate == device.baudrate == 115200
+    assert sensor.profile.baud_setting == 12
+    assert sensor.read_profile().baud_setting == 12
+
+
+class _SlowAdapter(VirtualSensor):
+    """Garbles the data packets it receives above 57600 baud"""
+
+    def _send(self, pid, content, start):
+        if pid in (PID_DATA, PID_EOD) and self.baudrate > 57600:
+            content = bytes((content[0] ^ 0xff,)) + bytes(content[1:])
+        return super()._send(pid, content, start)
+
+
+def test_negotiate_link_falls_back_to_lower_rate():
+    # 115200 baud is tried first and fails its test transfers
+    device = _SlowAdapter(baudrate=9600)
+    sensor = Sensor(device, 9600)
+
+    assert sensor.negotiate_link(probe_timeout=0.2, settle=0) == \
+        (57600, 256)
+    assert device.module_baudrate == device.baudrate == 57600
+    assert sensor.read_profile().baud_setting == 6
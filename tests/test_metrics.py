@@ -0,0 +1,51 @@
+"""
+Tests of Metrics collected from a Sensor talking to a VirtualSensor.
+"""
+from r307_fingerprint import Sensor
+from r307_fingerprint.metrics import Metrics, prometheus_text
+from r307_fingerprint.virtual import VirtualSensor
+
+
+def _samples(text):
+    """
+    :return, dict: value by sample name and labels, without the comments
+    """
+    return dict(line.rsplit(' ', 1) for line in text.splitlines()
+                if not line.startswith('#'))
+
+
+def test_prometheus_export():
+    device = VirtualSensor()
+    sensor = Sensor(device, 57600)
+    sensor.instrumentation = Metrics(labels={'sensor': 'gate "1"'})
+    sensor.read_parameters()
+    device.inject(b'\x00\x11noise')
+    sensor.read_parameters()
+
+    text = sensor.instrumentation.prometheus()
+    assert '# TYPE r307_command_seconds histogram' in text.splitlines()
+    assert '# TYPE r307_faults_total counter' in text.splitlines()
+
+    samples = _samples(text)
+    command = 'sensor="gate \\"1\\"",command="read_parameters"'
+    assert samples['r307_command_seconds_count{%s}' % command] == '2'
+    assert samples['r307_command_seconds_bucket{%s,le="+Inf"}'
+                   % command] == '2'
+    assert samples['r307_confirmation_codes_total{%s,status="success"}'
+                   % command] == '2'
+    assert samples['r307_frames_total{sensor="gate \\"1\\"",'
+                   'direction="received"}'] == '2'
+    assert samples['r307_faults_total{sensor="gate \\"1\\"",'
+                   'kind="header"}'] == '1'
+
+
+def test_prometheus_text_merges_sensors():
+    first, second = Metrics({'sensor': 'a'}), Metrics({'sensor': 'b'})
+    first.fault('timeout')
+    second.fault('timeout')
+
+    lines = prometheus_text([first, second]).splitlines()
+    assert lines == ['# TYPE r307_faults_total counter',
+                     'r307_faults_total{sensor="a",kind="timeout"} 1',
+                     'r307_faults_total{sensor="b",kind="timeout"} 1']
+    assert prometheus_text([Metrics()]) == ''
@@ -0,0 +1,61 @@
+"""
+Tests of QualityGate on images captured from a VirtualSensor.
+"""
+import pytest
+
+from r307_fingerprint import Sensor, Status
+from r307_fingerprint.constants import IMAGE_HEIGHT, IMAGE_SIZE, IMAGE_WIDTH
+from r307_fingerprint.quality import QUALITY_DISORDERED, QUALITY_SMALL, \
+    QualityGate
+from r307_fingerprint.virtual import VirtualSensor, finger_image
+
+pytest.importorskip('numpy')
+
+
+def _ridges(period=8):
+    """
+    :return, bytes: packed image of vertical ridges across the whole glass
+    """
+    pixels = [0x0F if x % period < period // 2 else 0
+              for _ in range(IMAGE_HEIGHT) for x in range(IMAGE_WIDTH)]
+    return bytes(high << 4 | low
+                 for high, low in zip(pixels[0::2], pixels[1::2]))
+
+
+def test_gate_passes_ridges():
+    report = QualityGate().assess(_ridges())
+    assert report.ok and report.reason is None
+    assert report.score == pytest.approx(1)
+
+
+def test_gate_rejects_blank_glass_as_small():
+    report = QualityGate().assess(bytes(IMAGE_SIZE))
+    assert (report.ok, report.reason, report.coverage) == \
+        (False, QUALITY_SMALL, 0)
+
+
+def test_gate_rejects_noise_as_disordered():
+    # The virtual module's images are noise without ridge flow
+    report = QualityGate().assess(finger_image(b'thumb'))
+    assert (report.ok, report.reason) == (False, QUALITY_DISORDERED)
+    assert report.coverage == 1
+
+
+def test_enroll_records_verdicts_and_tune_follows_them():
+    device = VirtualSensor(library_size=100)
+    sensor = Sensor(device, 57600)
+    gate = QualityGate()
+    device.place_finger(b'thumb')
+
+    result = sensor.enroll(wait_for_lift=False, max_retries=1,
+                           quality_gate=gate)
+    assert result.retries == {'sample_1': 1, 'sample_2': 1}
+    assert gate.records[-1][1] == Status.SUCCESS
+    snapshot = gate.snapshot()
+    assert (snapshot['assessed'], snapshot['recorded']) == (4, 2)
+    assert snapshot['rejected'] == {QUALITY_DISORDERED: 4}
+
+    # The module extracted every capture the gate rejected
+    thresholds = gate.tune()
+    assert thresholds['min_coherence'] < QualityGate().min_coherence
+    assert gate.assess(finger_image(b'thumb')).ok
@@ -0,0 +1,56 @@
+"""
+Tests of the identification strategies against a VirtualSensor.
+"""
+from r307_fingerprint import Sensor
+from r307_fingerprint.library import TemplateStore
+from r307_fingerprint.search import SOURCE_FLASH, SOURCE_HOST, \
+    AdaptiveSearch, TemplateCache
+from r307_fingerprint.virtual import VirtualSensor, finger_template
+
+
+def _identify(cache, device, finger):
+    device.place_finger(finger)
+    return cache.identify(timeout=1)
+
+
+def test_template_cache_evicts_and_falls_back_to_host():
+    device = VirtualSensor(library_size=10)
+    store = TemplateStore((user, finger_template(user.encode()))
+                          for user in ('ann', 'bob', 'cat'))
+    cache = TemplateCache(Sensor(device, 57600), store, capacity=2)
+    assert cache.warm(['ann', 'bob']) == 2
+
+    result = _identify(cache, device, b'ann')
+    assert (result.user, result.page_id, result.source) == \
+        ('ann', 0, SOURCE_FLASH)
+
+    # cat is only on the host: matched there, then paged in over bob, the
+    # least recently matched
+    result = _identify(cache, device, b'cat')
+    assert (result.user, result.page_id, result.source) == \
+        ('cat', 1, SOURCE_HOST)
+    assert 'bob' not in cache and cache.page_of('cat') == 1
+    assert device.library[1] == finger_template(b'cat')
+
+    result = _identify(cache, device, b'cat')
+    assert result.source == SOURCE_FLASH
+    assert _identify(cache, device, b'stranger') is None
+    assert (cache.flash_hits, cache.host_hits, cache.rejects) == (2, 1, 1)
+
+
+def test_adaptive_search_relocates_frequent_finger():
+    device = VirtualSensor(library_size=20)
+    for finger, page_id in ((b'ann', 0), (b'bob', 1), (b'zoe', 15)):
+        device.enroll(finger, page_id)
+    relocated = []
+    search = AdaptiveSearch(Sensor(device, 57600), hot_size=2,
+                            relocate_every=3, on_relocate=relocated.append)
+
+    device.place_finger(b'zoe')
+    assert [search.identify(timeout=1)[0] for _ in range(3)] == [15, 15, 0]
+    assert relocated == [{15: 0, 0: 15}]
+    assert device.library[0] == finger_template(b'zoe')
+    assert device.library[15] == finger_template(b'ann')
+
+    assert search.identify(timeout=1)[0] == 0
+    assert (search.hot_hits, search.cold_hits) == (1, 3)
@@ -0,0 +1,71 @@
+"""
+Tests of recording a VirtualSensor session and replaying it.
+"""
+import pytest
+
+from r307_fingerprint import Sensor, SensorError
+from r307_fingerprint.constants import CHAR_BUFFER_1, CHAR_BUFFER_2, \
+    PID_ACK
+from r307_fingerprint.trace import TRACE_RECEIVED, TRACE_SENT, \
+    TraceReader, TraceRecorder, TraceReplay
+from r307_fingerprint.virtual import VirtualSensor, finger_template
+
+
+def _session(sensor):
+    """
+    Search for a finger and read its template back.
+    """
+    sensor.generate_image()
+    sensor.generate_charfile_image(CHAR_BUFFER_1)
+    page_id, score = sensor.search_library(CHAR_BUFFER_1, 0, 100)
+    sensor.read_template(CHAR_BUFFER_1, page_id)
+    return page_id, score, bytes(sensor.download_char_buffer(CHAR_BUFFER_1))
+
+
+def _record(path):
+    device = VirtualSensor(library_size=100)
+    device.enroll(b'thumb', 42)
+    device.place_finger(b'thumb')
+    recorder = TraceRecorder(device, str(path))
+    try:
+        return _session(Sensor(recorder, 57600, strict=False))
+    finally:
+        recorder.close()
+
+
+def test_replay_returns_recorded_results(tmp_path):
+    path = tmp_path / 'session.trace'
+    recorded = _record(path)
+    assert recorded[0] == 42
+    assert recorded[2] == finger_template(b'thumb')
+
+    replay = TraceReplay(str(path))
+    assert _session(Sensor(replay, 57600, strict=False)) == recorded
+    assert replay.remaining == 0
+
+
+def test_replay_fails_when_host_diverges(tmp_path):
+    path = tmp_path / 'session.trace'
+    _record(path)
+
+    sensor = Sensor(TraceReplay(str(path)), 57600, strict=False)
+    sensor.generate_image()
+    with pytest.raises(SensorError):
+        sensor.generate_charfile_image(CHAR_BUFFER_2)
+
+
+def test_reader_decodes_recorded_frames(tmp_path):
+    path = tmp_path / 'session.trace'
+    _record(path)
+
+    with TraceReader(str(path)) as reader:
+        directions = {record.direction for record in reader}
+        sent = list(reader.frames(TRACE_SENT))
+        received = list(reader.frames(TRACE_RECEIVED))
+
+    assert directions == {TRACE_SENT, TRACE_RECEIVED}
+    # The password check of the constructor, then the five commands
+    assert len(sent) == 6
+    assert all(pid == PID_ACK for _, pid, _ in received[:6])
+    assert b''.join(content for _, _, content in received[6:]) == \
+        finger_template(b'thumb')
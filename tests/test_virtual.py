@@ -0,0 +1,403 @@
+"""
+Regression tests of Sensor and AsyncSensor against a VirtualSensor.
+"""
+import asyncio
+import io
+
+import pytest
+
+from r307_fingerprint import AsyncSensor, CommandDeadlines, Sensor, \
+    SensorPool
+from r307_fingerprint.constants import CC_DISORDERED_FINGERPRINT, \
+    CHAR_BUFFER_1, IC_DELETE_TEMPLATE, IC_DOWNLOAD_IMAGE, IC_READ_NOTEPAD, \
+    IC_READ_PARAMETERS, IC_SEARCH, IC_WRITE_NOTEPAD, IMAGE_SIZE, PID_ACK, \
+    PID_COMMAND
+from r307_fingerprint.errors import ProtocolError, Status
+from r307_fingerprint.library import BatchResult
+from r307_fingerprint.protocol import FrameDecoder, FrameEncoder
+from r307_fingerprint.virtual import VirtualSensor, finger_image, \
+    finger_template
+
+# Lengths around the 128 byte default packet size, including ones the
+# end of data packet must not pad with bytes already sent
+_LENGTHS = (1, 100, 128, 500, 512, 600)
+
+
+def _payload(size):
+    return bytes(i * 7 % 251 for i in range(size))
+
+
+async def _connect(device, timeout=3, **kwargs):
+    reader, writer = await device.open_connection()
+    return await AsyncSensor(reader, writer, timeout, **kwargs).connect()
+
+
+@pytest.mark.parametrize('size', _LENGTHS)
+def test_char_buffer_round_trip(size):
+    sensor = Sensor(VirtualSensor(), 57600)
+    sensor.upload_char_buffer(CHAR_BUFFER_1, _payload(size))
+    assert bytes(sensor.download_char_buffer(CHAR_BUFFER_1)) == \
+        _payload(size)
+
+
+@pytest.mark.parametrize('size', _LENGTHS)
+def test_async_char_buffer_round_trip(size):
+    async def round_trip():
+        sensor = await _connect(VirtualSensor())
+        await sensor.upload_char_buffer(CHAR_BUFFER_1, _payload(size))
+        return await sensor.download_char_buffer(CHAR_BUFFER_1)
+
+    assert bytes(asyncio.run(round_trip())) == _payload(size)
+
+
+def test_set_address_moves_framing():
+    device = VirtualSensor()
+    sensor = Sensor(device, 57600)
+    sensor.read_profile()
+    sensor.set_address(b'\x01\x02\x03\x04')
+    assert device.address == b'\x01\x02\x03\x04'
+    assert sensor.read_profile().address == b'\x01\x02\x03\x04'
+
+
+def test_async_set_address_moves_framing():
+    async def set_address():
+        sensor = await _connect(VirtualSensor())
+        await sensor.read_profile()
+        await sensor.set_address(b'\x01\x02\x03\x04')
+        return await sensor.read_profile()
+
+    assert asyncio.run(set_address()).address == b'\x01\x02\x03\x04'
+
+
+def test_auto_verification_finds_enrolled_finger():
+    device = VirtualSensor(library_size=100)
+    device.enroll(b'thumb', 42)
+    sensor = Sensor(device, 57600, strict=False)
+
+    assert sensor.auto_fingerprint_verification().status == Status.NO_FINGER
+    device.place_finger(b'index')
+    assert sensor.auto_fingerprint_verification().status == Status.NO_MATCH
+    device.place_finger(b'thumb')
+    result = sensor.auto_fingerprint_verification()
+    assert (result.status, result.page_id) == (Status.SUCCESS, 42)
+
+
+def test_capture_failures_are_replayed():
+    device = VirtualSensor()
+    sensor = Sensor(device, 57600, strict=False)
+    device.place_finger(b'thumb', failures=[CC_DISORDERED_FINGERPRINT])
+    sensor.generate_image()
+
+    assert sensor.generate_charfile_image(CHAR_BUFFER_1).status == \
+        Status.DISORDERED
+    assert sensor.generate_charfile_image(CHAR_BUFFER_1).status == \
+        Status.SUCCESS
+    assert device.char_buffers[1] == finger_template(b'thumb')
+
+
+def test_module_ignores_other_baud_rates():
+    device = VirtualSensor(timeout=0.05)
+    device.baudrate = 115200
+    device.write(bytes(FrameEncoder().encode(PID_COMMAND,
+                                             IC_READ_PARAMETERS)))
+    assert device.read(12) == b''
+    assert not device.commands
+
+
+def test_read_without_reply_fails():
+    device = VirtualSensor(timeout=None)
+    with pytest.raises(ProtocolError) as raised:
+        device.read(1)
+    assert raised.value.kind == 'timeout'
+
+
+def test_decoder_resyncs_after_noise_and_bad_checksum():
+    frame = bytes(FrameEncoder().encode(PID_ACK, b'\x00\x2a'))
+    corrupted = frame[:-1] + bytes((frame[-1] ^ 0xff,))
+    decoder = FrameDecoder()
+    decoder.feed(b'\x00\xef\x01noise' + corrupted + frame)
+
+    with pytest.raises(ProtocolError) as raised:
+        decoder.decode()
+    assert raised.value.kind == 'checksum'
+    pid, content = decoder.decode()
+    assert (pid, bytes(content)) == (PID_ACK, b'\x00\x2a')
+    assert decoder.decode() is None
+    assert decoder.skipped > 0
+
+
+def test_sensor_skips_line_noise():
+    device = VirtualSensor()
+    sensor = Sensor(device, 57600)
+    device.inject(b'\x00\xffnoise\xef\x01')
+    assert sensor.read_profile().library_size == device.library_size
+
+
+def test_sensor_retries_corrupted_replies():
+    device = VirtualSensor(corruption=0.2, seed=3)
+    sensor = Sensor(device, 57600, retries=5, timeout=0.2)
+    for _ in range(20):
+        sensor.read_parameters()
+    assert device.commands[IC_READ_PARAMETERS] > 20
+
+
+@pytest.mark.parametrize('package_length', (0, 3))
+def test_image_download(package_length):
+    device = VirtualSensor(package_length=package_length)
+    sensor = Sensor(device, 57600)
+    device.place_finger(b'thumb')
+    sensor.generate_image()
+    assert bytes(sensor.download_image()) == finger_image(b'thumb')
+
+
+def test_generate_image_waits_for_a_finger():
+    sensor = Sensor(VirtualSensor(), 57600, strict=False)
+    assert sensor.generate_image(0.1).status == Status.NO_FINGER
+
+
+def test_async_generate_image_waits_for_a_finger():
+    async def capture():
+        device = VirtualSensor()
+        sensor = await _connect(device, strict=False)
+        missed = await sensor.generate_image(0.1)
+
+        loop = asyncio.get_event_loop()
+        loop.call_later(0.1, device.place_finger, b'thumb')
+        return missed, await sensor.generate_image(2)
+
+    missed, captured = asyncio.run(capture())
+    assert missed.status == Status.NO_FINGER
+    assert captured.status == Status.SUCCESS
+
+
+def test_async_image_download():
+    async def download():
+        device = VirtualSensor()
+        sensor = await _connect(device)
+        device.place_finger(b'thumb')
+        await sensor.generate_image()
+        return await sensor.download_image()
+
+    assert bytes(asyncio.run(download())) == finger_image(b'thumb')
+
+
+class _FullFile(io.BytesIO):
+    """
+    File that fails once it holds more than limit bytes.
+    """
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def write(self, data):
+        if self.tell() + len(data) > self.limit:
+            raise OSError("No space left on device")
+        return super().write(data)
+
+
+def test_image_download_checks_buffer_before_sending():
+    device = VirtualSensor()
+    sensor = Sensor(device, 57600)
+    device.place_finger(b'thumb')
+    sensor.generate_image()
+
+    with pytest.raises(ValueError):
+        sensor.download_image(bytearray(IMAGE_SIZE - 1))
+    with pytest.raises(TypeError):
+        sensor.download_image(bytes(IMAGE_SIZE))
+    assert device.commands[IC_DOWNLOAD_IMAGE] == 0
+
+
+def test_image_download_failing_midway_leaves_link_usable():
+    device = VirtualSensor()
+    # Without retries a reply mixed with the rest of the image would fail
+    sensor = Sensor(device, 57600, retries=0)
+    device.place_finger(b'thumb')
+    sensor.generate_image()
+
+    with pytest.raises(OSError):
+        sensor.download_image(_FullFile(1000))
+    assert bytes(sensor.download_image()) == finger_image(b'thumb')
+
+
+def test_async_image_download_failing_midway_leaves_link_usable():
+    async def download():
+        device = VirtualSensor()
+        sensor = await _connect(device, retries=0)
+        device.place_finger(b'thumb')
+        await sensor.generate_image()
+
+        with pytest.raises(ValueError):
+            await sensor.download_image(bytearray(IMAGE_SIZE - 1))
+        assert device.commands[IC_DOWNLOAD_IMAGE] == 0
+        with pytest.raises(OSError):
+            await sensor.download_image(_FullFile(1000))
+        return await sensor.download_image()
+
+    assert bytes(asyncio.run(download())) == finger_image(b'thumb')
+
+
+def _stale_library():
+    """
+    :return: a VirtualSensor, and the pages a stale library index of it
+    thinks free but another host has filled since
+    """
+    device = VirtualSensor(library_size=100)
+    for page_id in (1, 2, 4, 5, 7, 9):
+        device.enroll(b'finger %d' % page_id, page_id)
+    return device, (3, 8)
+
+
+def _fill(device, pages):
+    for page_id in pages:
+        device.enroll(b'late %d' % page_id, page_id)
+
+
+def test_delete_templates_trusts_no_stale_index():
+    device, late = _stale_library()
+    sensor = Sensor(device, 57600, stamp_library=True)
+    sensor.load_library_index()
+    _fill(device, late)
+
+    # 1-2, 4-5 and 8-9 after renewing the stamp load_library_index read:
+    # page 3 is not bridged and page 8 is not skipped
+    result = sensor.delete_templates([1, 2, 4, 5, 8, 9])
+    assert result == BatchResult(6, 4, ())
+    assert device.commands[IC_DELETE_TEMPLATE] == 3
+    assert sorted(device.library) == [3, 7]
+
+
+def test_async_delete_templates_trusts_no_stale_index():
+    async def delete(device, late):
+        sensor = await _connect(device, stamp_library=True)
+        await sensor.load_library_index()
+        _fill(device, late)
+        return await sensor.delete_templates([1, 2, 4, 5, 8, 9])
+
+    device, late = _stale_library()
+    assert asyncio.run(delete(device, late)) == BatchResult(6, 4, ())
+    assert device.commands[IC_DELETE_TEMPLATE] == 3
+    assert sorted(device.library) == [3, 7]
+
+
+def test_read_templates_checks_index_stamp():
+    device = VirtualSensor(library_size=100)
+    sensor = Sensor(device, 57600, stamp_library=True)
+    sensor.load_library_index()
+
+    template = finger_template(b'other host')
+    other = Sensor(device, 57600, stamp_library=True)
+    other.store_templates({5: template})
+    assert sensor.read_templates([5]) == {5: template}
+
+
+def test_library_changes_leave_notepad_alone_by_default():
+    device = VirtualSensor(library_size=100)
+    sensor = Sensor(device, 57600)
+    sensor.load_library_index()
+    sensor.upload_char_buffer(CHAR_BUFFER_1, finger_template(b'thumb'))
+    sensor.store_template(CHAR_BUFFER_1, 3)
+    sensor.delete_template(3, 1)
+    sensor.empty_fingerprint_library()
+
+    assert device.commands[IC_READ_NOTEPAD] == 0
+    assert device.commands[IC_WRITE_NOTEPAD] == 0
+    assert sensor.library_index.stamp is None
+
+
+def test_store_templates_stamps_once():
+    device = VirtualSensor(library_size=100)
+    sensor = Sensor(device, 57600, stamp_library=True)
+    index = sensor.load_library_index()
+    stamp = index.stamp
+
+    templates = {page_id: finger_template(b'%d' % page_id)
+                 for page_id in (3, 4, 7)}
+    result = sensor.store_templates(templates)
+    # One stamp write, then an upload and a store per template
+    assert result == BatchResult(3, 7, ())
+    assert index.stamp.generation == stamp.generation + 1
+    assert sensor.read_library_stamp() == index.stamp
+    assert sensor.read_templates([3, 4, 5, 7]) == templates
+
+
+def test_search_deadline_scales_to_pages():
+    # Learned on searches of 5 pages, the deadline must still cover a
+    # search of the whole library
+    device = VirtualSensor(library_size=3000, latency=True,
+                           command_delays={IC_SEARCH: 0.01})
+    for page_id in range(device.library_size):
+        device.enroll(b'%d' % page_id, page_id)
+    sensor = Sensor(device, 57600, deadlines=CommandDeadlines(min_samples=4))
+    sensor.upload_char_buffer(CHAR_BUFFER_1, finger_template(b'stranger'))
+    for _ in range(4):
+        sensor.search_library(CHAR_BUFFER_1, 0, 5)
+
+    assert sensor.search_library(CHAR_BUFFER_1, 0, 3000) == (None, 0)
+
+
+def test_expired_deadline_widens():
+    device = VirtualSensor(latency=True)
+    sensor = Sensor(device, 57600, retries=1,
+                    deadlines=CommandDeadlines(min_samples=4))
+    for _ in range(4):
+        sensor.read_parameters()
+    learned = sensor.deadlines.timeout(IC_READ_PARAMETERS)
+
+    # The module slows down past the learned deadline: the retry waits
+    # twice as long and gets through
+    device.command_delays[IC_READ_PARAMETERS] = learned * 1.5
+    sensor.read_parameters()
+    assert sensor.deadlines.timeout(IC_READ_PARAMETERS) > learned
+
+
+def test_pool_close_with_busy_worker():
+    async def open_virtual(port, baudrate, timeout):
+        return await _connect(VirtualSensor(), timeout)
+
+    async def close_busy_pool():
+        pool = SensorPool(['virtual'], opener=open_virtual)
+        await pool.start()
+        # Waits forever: no finger is ever placed
+        busy = pool.submit('virtual', 'wait_for_finger', None, 0.01)
+        queued = pool.submit('virtual', 'read_profile')
+        await asyncio.sleep(0.05)
+
+        await asyncio.wait_for(pool.close(), 5)
+        assert busy.cancelled()
+        with pytest.raises(ConnectionError):
+            await queued
+        with pytest.raises(ConnectionError):
+            pool.submit('virtual', 'read_profile')
+        assert not pool.connected('virtual')
+
+    asyncio.run(close_busy_pool())
+
+
+def test_pool_runs_identify_search_first():
+    device = VirtualSensor()
+    device.char_buffers[1] = finger_template(b'stranger')
+
+    async def open_virtual(port, baudrate, timeout):
+        return await _connect(device, timeout)
+
+    async def schedule():
+        finished = []
+        async with SensorPool(['virtual'], opener=open_virtual) as pool:
+            # Keeps the worker busy while the other two are queued
+            busy = pool.submit('virtual', 'wait_for_finger', 2, 0.01)
+            normal = pool.submit('virtual', 'verify_password')
+            search = pool.submit('virtual', 'search_library',
+                                 CHAR_BUFFER_1, 0, 100)
+            for name, future in (('busy', busy), ('normal', normal),
+                                 ('search', search)):
+                future.add_done_callback(
+                    lambda _, name=name: finished.append(name))
+
+            asyncio.get_event_loop().call_later(0.05, device.place_finger,
+                                                b'thumb')
+            await asyncio.gather(busy, normal, search)
+        return finished
+
+    assert asyncio.run(schedule()) == ['busy', 'search', 'normal']